@@ -8,7 +8,6 @@ import json
 import threading
 from datetime import datetime
 from dotenv import load_dotenv
-import sseclient  # You may need to install this: pip install sseclient-py
 from threading import Thread, Event
 from src.utils.time_utils import get_utc_timestamp
 
@@ -22,6 +21,7 @@ sys.path.insert(0, project_root)
 from src.collector.pc_collector import PCCollector
 from src.collector.stock_collector import StockCollector
 from src.collector.uploader_queue import UploaderQueue
+from src.collector.sse_client import SSEClient
 from src.utils.logging_config import get_logger, setup_logger
 from src.utils.config import config
 
@@ -94,37 +94,22 @@ def listen_for_commands(api_url, stock_collector):
     """Listen for commands from the web server via SSE."""
     commands_url = f"{api_url}/commands"
     logger.info(f"Starting command listener on {commands_url}")
-    
-    while True:
+    # Only the commands addressed to the stock device's mailbox, or to every collector.
+    # The client resumes from the last event id, so a reconnect only gets newer commands.
+    client = SSEClient(commands_url, params={'device': stock_collector.device_name}, timeout=60)
+
+    for event in client.events():
         try:
-            headers = {'Accept': 'text/event-stream'}
-            # Increase timeout to 60 seconds and add backoff mechanism
-            response = requests.get(commands_url, headers=headers, stream=True, timeout=60)
-            client = sseclient.SSEClient(response)
-            
-            for event in client.events():
-                try:
-                    commands = json.loads(event.data)
-                    logger.info(f"Received commands: {commands}")
-                    
-                    for command in commands:
-                        if command['action'] == 'add_stock' and 'symbol' in command:
-                            symbol = command['symbol'].strip().upper()
-                            logger.info(f"Adding stock {symbol} from command")
-                            stock_collector.add_stock(symbol)
-                except Exception as e:
-                    logger.error(f"Error processing command: {str(e)}", exc_info=True)
-                    
-        except requests.exceptions.Timeout:
-            logger.warning("Command listener timed out, reconnecting...")
-            time.sleep(5)  # Wait before reconnecting
-        except requests.exceptions.ConnectionError:
-            logger.warning("Connection error in command listener, reconnecting in 10 seconds...")
-            time.sleep(10)  # Longer wait for connection errors
+            commands = json.loads(event.data)
+            logger.info(f"Received commands: {commands}")
+
+            for command in commands:
+                if command['action'] == 'add_stock' and 'symbol' in command:
+                    symbol = command['symbol'].strip().upper()
+                    logger.info(f"Adding stock {symbol} from command")
+                    stock_collector.add_stock(symbol)
         except Exception as e:
-            logger.error(f"Error in command listener: {str(e)}", exc_info=True)
-            # Wait before reconnecting with exponential backoff
-            time.sleep(15)
+            logger.error(f"Error processing command: {str(e)}", exc_info=True)
 
 def main():
     """Main function to run the collector."""
@@ -0,0 +1,198 @@
+import re
+import time
+import requests
+from urllib3.exceptions import ProtocolError, ReadTimeoutError
+from typing import Dict, Iterator, List, Optional
+from ..utils.logging_config import get_logger
+
+logger = get_logger('collector.sse')
+
+# Bytes asked for per read; a read returns whatever has arrived, up to this
+READ_SIZE = 64 * 1024
+
+# Seconds before reconnecting, until the server sends a retry field
+DEFAULT_RETRY = 5.0
+
+# A line ends at CRLF, LF or CR
+_LINE_END = re.compile(rb'\r\n|\r|\n')
+
+class ServerSentEvent:
+    """One dispatched event of a text/event-stream."""
+
+    __slots__ = ('id', 'event', 'data')
+
+    def __init__(self, id: str, event: str, data: str):
+        self.id = id  # last event id at dispatch, sent back as Last-Event-ID on reconnect
+        self.event = event
+        self.data = data
+
+    def __repr__(self):
+        return f"ServerSentEvent(id={self.id!r}, event={self.event!r}, data={self.data!r})"
+
+class SSEParser:
+    """
+    Incremental text/event-stream parser, fed byte chunks of any size.
+
+    Follows the HTML event stream rules: lines end at CRLF, LF or CR,
+    comment lines start with a colon, data lines are joined with newlines,
+    an empty line dispatches the event, and an event without data is
+    dropped. An id takes effect at the end of its event, with or without
+    data, and carries over to the following events.
+    """
+
+    def __init__(self, last_event_id: str = ''):
+        self.last_event_id = last_event_id
+        self._id = last_event_id
+        self.retry = None  # reconnection delay in milliseconds, once the server sent one
+        self.comments = 0
+        self._buffer = b''
+        self._started = False
+        self._event = ''
+        self._data = []
+
+    def feed(self, chunk: bytes) -> List[ServerSentEvent]:
+        """Parse a chunk and return the events it completed."""
+        buffer = self._buffer + chunk if self._buffer else chunk
+        if not self._started and buffer:
+            if len(buffer) < 3 and b'\xef\xbb\xbf'.startswith(buffer):
+                self._buffer = buffer
+                return []
+            self._started = True
+            if buffer.startswith(b'\xef\xbb\xbf'):
+                buffer = buffer[3:]
+
+        events = []
+        start = 0
+        for match in _LINE_END.finditer(buffer):
+            # A CR at the end of the chunk may be the first half of a CRLF
+            if match.group() == b'\r' and match.end() == len(buffer):
+                break
+            event = self._line(buffer[start:match.start()].decode('utf-8', 'replace'))
+            if event is not None:
+                events.append(event)
+            start = match.end()
+        self._buffer = buffer[start:]
+        return events
+
+    def _line(self, line: str) -> Optional[ServerSentEvent]:
+        if not line:
+            return self._dispatch()
+        if line[0] == ':':
+            self.comments += 1
+            return None
+        field, colon, value = line.partition(':')
+        if colon and value.startswith(' '):
+            value = value[1:]
+        if field == 'data':
+            self._data.append(value)
+        elif field == 'event':
+            self._event = value
+        elif field == 'id':
+            if '\0' not in value:
+                self._id = value
+        elif field == 'retry':
+            if value.isdigit():
+                self.retry = int(value)
+        return None
+
+    def _dispatch(self) -> Optional[ServerSentEvent]:
+        data, event = self._data, self._event
+        self._data, self._event = [], ''
+        self.last_event_id = self._id
+        if not data:
+            return None
+        return ServerSentEvent(self.last_event_id, event or 'message', '\n'.join(data))
+
+def _iter_chunks(response, size: int) -> Iterator[bytes]:
+    """Body chunks as they arrive, up to size bytes each."""
+    raw = response.raw
+    if hasattr(raw, 'read1'):
+        while True:
+            # urllib3 errors surface as requests exceptions, as from iter_content
+            try:
+                chunk = raw.read1(size, decode_content=True)
+            except ReadTimeoutError as e:
+                raise requests.exceptions.ReadTimeout(e)
+            except ProtocolError as e:
+                raise requests.exceptions.ChunkedEncodingError(e)
+            if not chunk:
+                return
+            yield chunk
+    else:
+        # Older urllib3: chunked responses still yield each chunk as it arrives
+        yield from response.iter_content(chunk_size=None)
+
+class SSEClient:
+    """
+    Server-Sent Events client that reconnects and resumes.
+
+    The stream is read in large chunks and parsed incrementally. On
+    reconnect the last event id is sent as Last-Event-ID, so the server
+    only replays what was missed; the server's retry field sets the delay
+    between reconnects. Keepalive comments are consumed without yielding
+    but keep the read timeout from firing.
+    """
+
+    def __init__(self, url: str, params: Dict = None, headers: Dict = None, timeout: float = 60,
+                 last_event_id: str = None, session: requests.Session = None, read_size: int = READ_SIZE):
+        self.url = url
+        self.params = params
+        self.headers = headers or {}
+        self.timeout = timeout
+        self.last_event_id = last_event_id or ''
+        self.retry = DEFAULT_RETRY
+        self.session = session or requests.Session()
+        self.read_size = read_size
+        self.running = True
+        self._response = None
+
+    def _connect(self):
+        headers = dict(self.headers, Accept='text/event-stream', **{'Cache-Control': 'no-cache'})
+        if self.last_event_id:
+            headers['Last-Event-ID'] = self.last_event_id
+        return self.session.get(self.url, params=self.params, headers=headers, stream=True, timeout=self.timeout)
+
+    def events(self) -> Iterator[ServerSentEvent]:
+        """Yield events until close(), reconnecting after errors and disconnects."""
+        while self.running:
+            try:
+                response = self._response = self._connect()
+                try:
+                    if response.status_code == 204:
+                        # The server asks clients not to reconnect
+                        logger.info(f"SSE stream {self.url} ended by the server")
+                        self.running = False
+                        return
+                    if response.status_code != 200:
+                        logger.error(f"SSE connection to {self.url} failed with status {response.status_code}")
+                    else:
+                        parser = SSEParser(self.last_event_id)
+                        for chunk in _iter_chunks(response, self.read_size):
+                            events = parser.feed(chunk)
+                            self.last_event_id = parser.last_event_id
+                            yield from events
+                            if parser.retry is not None:
+                                self.retry = parser.retry / 1000
+                            if not self.running:
+                                return
+                        logger.info(f"SSE stream {self.url} closed by the server, reconnecting...")
+                finally:
+                    response.close()
+            except Exception as e:
+                if not self.running:
+                    return  # Closed from another thread while reading
+                if isinstance(e, requests.exceptions.Timeout):
+                    logger.warning(f"SSE stream {self.url} timed out, reconnecting...")
+                elif isinstance(e, (requests.exceptions.ConnectionError, requests.exceptions.ChunkedEncodingError)):
+                    logger.warning(f"Connection error on SSE stream {self.url}, reconnecting in {self.retry:g} seconds...")
+                else:
+                    logger.error(f"SSE stream {self.url} failed: {str(e)}")
+            if self.running:
+                time.sleep(self.retry)
+
+    def close(self):
+        """Stop reconnecting and close the current connection."""
+        self.running = False
+        if self._response is not None:
+            self._response.close()
+        self.session.close()
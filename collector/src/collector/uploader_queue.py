@@ -1,5 +1,7 @@
 import time
 import json
+import uuid
+import itertools
 import requests
 import threading
 from typing import List, Dict
@@ -9,61 +11,17 @@ from ..utils.logging_config import get_logger
 from ..utils.config import config
 from datetime import datetime
 from ..utils.time_utils import get_utc_timestamp, format_timestamp
+from ..utils.columnar import COLUMNAR_CONTENT_TYPE, encode_batch
+from ..utils.compression import compress_body, iter_compress
+from .sse_client import SSEClient
 
 logger = get_logger('collector.uploader')
 
-class SSEClient:
-    def __init__(self, url):
-        self.url = url
-        self.session = requests.Session()
-        self.running = True
-        
-    def events(self):
-        """Generator for SSE events."""
-        while self.running:
-            try:
-                response = self.session.get(
-                    self.url, 
-                    stream=True,
-                    headers={'Accept': 'text/event-stream'}
-                )
-                
-                if response.status_code != 200:
-                    logger.error(f"SSE connection failed with status {response.status_code}")
-                    time.sleep(5)
-                    continue
-                
-                # Process the stream
-                buffer = ""
-                for chunk in response.iter_content(chunk_size=1):
-                    if not self.running:
-                        break
-                        
-                    if chunk:
-                        chunk_str = chunk.decode('utf-8')
-                        buffer += chunk_str
-                        
-                        if buffer.endswith('\n\n'):
-                            # Complete event received
-                            lines = buffer.split('\n')
-                            data = None
-                            
-                            for line in lines:
-                                if line.startswith('data:'):
-                                    data = line[5:].strip()
-                            
-                            if data:
-                                yield data
-                                
-                            buffer = ""
-            except Exception as e:
-                logger.error(f"SSE connection error: {e}")
-                time.sleep(5)
-                
-    def close(self):
-        """Close the SSE connection."""
-        self.running = False
-        self.session.close()
+# Bytes of NDJSON gathered before a chunk is handed to the streaming request
+STREAM_CHUNK_SIZE = 64 * 1024
+
+# Base delay in seconds between retries of a failed batch upload (doubles per attempt)
+UPLOAD_RETRY_DELAY = 0.5
 
 class UploaderQueue:
     def __init__(self, api_url: str, batch_size: int = None, max_queue_size: int = None):
@@ -74,11 +32,17 @@ class UploaderQueue:
         self.stop_event = Event()
         self.upload_thread = None
         self.running = True
+        self.upload_format = config.collector.upload_format
+        
+        # Identity used to make batch retries idempotent on the server
+        self.collector_id = str(uuid.uuid4())
+        self._sequence = itertools.count(1)
         
         logger.info(f"Initializing uploader queue with batch_size={self.batch_size}, max_queue_size={self.max_queue_size}")
         logger.info(f"API URL: {self.api_url}")
 
-        # Start the control listener thread
+        # Start the control listener thread; the stream sends keepalives well within the timeout
+        self.control_client = SSEClient(f"{self.api_url}/control", timeout=30)
         self.control_thread = Thread(target=self._listen_for_control, daemon=True)
         self.control_thread.start()
 
@@ -86,57 +50,19 @@ class UploaderQueue:
         """Listen for control messages from the server."""
         control_url = f"{self.api_url}/control"
         logger.info(f"Starting SSE control listener at {control_url}")
-        
-        while not self.stop_event.is_set():
-            try:
-                response = requests.get(
-                    control_url, 
-                    stream=True,
-                    headers={'Accept': 'text/event-stream'},
-                    timeout=30
-                )
-                
-                if response.status_code != 200:
-                    logger.error(f"SSE connection failed with status {response.status_code}")
-                    time.sleep(5)
-                    continue
-                
-                # Process the stream
-                buffer = ""
-                for chunk in response.iter_content(chunk_size=1):
-                    if not chunk:
-                        continue
-                        
-                    chunk_str = chunk.decode('utf-8')
-                    buffer += chunk_str
-                    
-                    if buffer.endswith('\n\n'):
-                        lines = buffer.split('\n')
-                        for line in lines:
-                            # Skip empty lines and comment lines (keepalive)
-                            if not line or line.startswith(':'):
-                                continue
-                                
-                            if line.startswith('data:'):
-                                data = line[5:].strip()
-                                logger.info(f"Received control message: {data}")
-                                
-                                if data == 'STOPPED' and self.running:
-                                    self.running = False
-                                    logger.info("Stopping collector due to control message")
-                                elif data == 'RUNNING' and not self.running:
-                                    self.running = True
-                                    logger.info("Starting collector due to control message")
-                        
-                        buffer = ""
-            except requests.exceptions.Timeout:
-                logger.warning("Control SSE connection timed out, reconnecting...")
-            except requests.exceptions.ConnectionError:
-                logger.warning("Control SSE connection error, reconnecting in 5 seconds...")
-                time.sleep(5)
-            except Exception as e:
-                logger.error(f"Control listener error: {e}")
-                time.sleep(10)
+
+        for event in self.control_client.events():
+            if self.stop_event.is_set():
+                break
+            data = event.data.strip()
+            logger.info(f"Received control message: {data}")
+
+            if data == 'STOPPED' and self.running:
+                self.running = False
+                logger.info("Stopping collector due to control message")
+            elif data == 'RUNNING' and not self.running:
+                self.running = True
+                logger.info("Starting collector due to control message")
 
     def validate_metric(self, metric: Dict) -> bool:
         """Validate a metric."""
@@ -206,6 +132,7 @@ class UploaderQueue:
         
         for metric in metrics:
             if self.validate_metric(metric):
+                metric['_seq'] = next(self._sequence)
                 valid_metrics.append(metric)
                 logger.debug(f"Valid metric added to queue: {metric}")
             else:
@@ -226,31 +153,38 @@ class UploaderQueue:
         if invalid_metrics:
             logger.warning(f"Skipped {len(invalid_metrics)} invalid metrics")
 
-    def _upload_metrics_batch(self, metrics_batch):
+    def _batch_headers(self, metrics_batch):
+        """Headers that identify a batch so retries of it can be skipped by the server."""
+        sequences = [metric['_seq'] for metric in metrics_batch if '_seq' in metric]
+        headers = {
+            "X-Batch-Id": str(uuid.uuid4()),
+            "X-Collector-Id": self.collector_id
+        }
+        # The server marks the whole range as stored, so it is only sent for gapless batches;
+        # requeued metrics can make a batch skip sequence numbers still waiting in the queue
+        if sequences and max(sequences) - min(sequences) + 1 == len(set(sequences)) == len(sequences):
+            headers["X-Batch-Seq"] = f"{min(sequences)}-{max(sequences)}"
+        return headers
+
+    def _upload_with_retry(self, metrics_batch):
+        """Upload a batch, retrying with the same batch identity after failures."""
+        batch_headers = self._batch_headers(metrics_batch)
+        retries = config.collector.upload_retries
+        
+        for attempt in range(retries + 1):
+            if self._upload_metrics_batch(metrics_batch, batch_headers):
+                return True
+            if attempt < retries and not self.stop_event.is_set():
+                delay = UPLOAD_RETRY_DELAY * (2 ** attempt)
+                logger.warning(f"Retrying batch {batch_headers['X-Batch-Id']} in {delay:.1f}s (attempt {attempt + 1}/{retries})")
+                self.stop_event.wait(delay)
+        return False
+
+    def _upload_metrics_batch(self, metrics_batch, batch_headers=None):
         """Upload a batch of metrics to the server."""
         try:
             # Ensure all metrics have the correct format
-            formatted_batch = []
-            for metric in metrics_batch:
-                # Create a properly formatted metric
-                formatted_metric = {
-                    "device_name": metric.get('device_name'),
-                    "metric_name": metric.get('metric_name'),
-                    # Ensure we have a valid metric value
-                    "metric_value": metric.get('metric_value', metric.get('value')),
-                    # Use the timestamp from the metric or generate a new one
-                    "timestamp": metric.get('timestamp', get_utc_timestamp())
-                }
-                
-                # Add device_id if available
-                if 'device_id' in metric:
-                    formatted_metric['device_id'] = metric['device_id']
-                    
-                # Add metadata if available
-                if 'metadata' in metric:
-                    formatted_metric['metadata'] = metric['metadata']
-                    
-                formatted_batch.append(formatted_metric)
+            formatted_batch = [self._format_metric(metric) for metric in metrics_batch]
                 
             if not formatted_batch:
                 logger.warning("No valid metrics to upload after formatting")
@@ -262,15 +196,10 @@ class UploaderQueue:
             logger.info(f"Uploading {len(formatted_batch)} metrics to {upload_url}")
             
             # Send the batch to the server
-            response = requests.post(
-                upload_url,
-                json=formatted_batch,
-                headers={"Content-Type": "application/json"},
-                timeout=30
-            )
+            response = self._post_batch(upload_url, formatted_batch, batch_headers)
             
-            # Check the response
-            if response.status_code == 200:
+            # Check the response (202 means the server buffered the batch for a group commit)
+            if response.status_code in (200, 202):
                 logger.info(f"Successfully uploaded {len(formatted_batch)} metrics")
                 return True
             else:
@@ -286,6 +215,152 @@ class UploaderQueue:
             logger.error(f"Error uploading metrics batch: {str(e)}")
             return False
 
+    def _post_batch(self, upload_url, formatted_batch, batch_headers=None):
+        """POST a batch in the configured wire format."""
+        if self.upload_format == 'columnar':
+            response = self._post_body(upload_url, encode_batch(formatted_batch), COLUMNAR_CONTENT_TYPE, batch_headers)
+            # Servers without columnar support reject the content type; use JSON from now on
+            if response.status_code != 415:
+                return response
+            logger.warning("Server does not accept columnar batches, falling back to JSON uploads")
+            self.upload_format = 'json'
+        
+        return self._post_body(upload_url, json.dumps(formatted_batch).encode('utf-8'), "application/json", batch_headers)
+
+    def _post_body(self, upload_url, payload, content_type, extra_headers=None):
+        """POST a request body, gzip-compressing it above the configured threshold."""
+        headers = {"Content-Type": content_type, **(extra_headers or {})}
+        threshold = config.collector.compression_threshold
+        
+        if threshold and len(payload) >= threshold:
+            compressed, cpu_time = compress_body(payload)
+            logger.info(
+                f"Compressed {content_type} body {len(payload)} -> {len(compressed)} bytes "
+                f"(ratio {len(payload) / max(len(compressed), 1):.1f}x, {cpu_time * 1000:.2f}ms CPU)"
+            )
+            payload = compressed
+            headers["Content-Encoding"] = "gzip"
+        
+        return requests.post(upload_url, data=payload, headers=headers, timeout=30)
+
+    def _format_metric(self, metric):
+        """Shape a queued metric the way the aggregator expects it."""
+        formatted_metric = {
+            "device_name": metric.get('device_name'),
+            "metric_name": metric.get('metric_name'),
+            # Ensure we have a valid metric value
+            "metric_value": metric.get('metric_value', metric.get('value')),
+            # Use the timestamp from the metric or generate a new one
+            "timestamp": metric.get('timestamp', get_utc_timestamp())
+        }
+        
+        # Add device_id if available
+        if 'device_id' in metric:
+            formatted_metric['device_id'] = metric['device_id']
+            
+        # Add metadata if available
+        if 'metadata' in metric:
+            formatted_metric['metadata'] = metric['metadata']
+            
+        return formatted_metric
+
+    def _stream_backlog(self, first_batch):
+        """
+        Upload a batch plus the metrics waiting in the queue as one NDJSON stream.
+        
+        At most stream_backlog_max_rows metrics are taken from the queue. They
+        are kept until the server acknowledges the stream, which is retried
+        like a batch upload and under the same batch identity, so the server
+        skips a replay of a stream it already stored; if every attempt fails
+        they go back to the queue.
+        """
+        records = list(first_batch)
+        try:
+            while len(records) < config.collector.stream_backlog_max_rows:
+                records.append(self.queue.get(block=False))
+                self.queue.task_done()
+        except Empty:
+            pass
+        
+        batch_headers = self._batch_headers(records)
+        retries = config.collector.upload_retries
+        for attempt in range(retries + 1):
+            if self._post_stream(records, batch_headers):
+                return True
+            if attempt < retries and not self.stop_event.is_set():
+                delay = UPLOAD_RETRY_DELAY * (2 ** attempt)
+                logger.warning(f"Retrying stream of {len(records)} metrics in {delay:.1f}s (attempt {attempt + 1}/{retries})")
+                self.stop_event.wait(delay)
+        
+        self._requeue(records)
+        return False
+
+    def _post_stream(self, records, batch_headers=None):
+        """
+        POST metrics as a chunked NDJSON body; the lines are encoded while the body is sent.
+
+        Like batch bodies, the stream is only gzip-compressed when it reaches
+        the compression threshold, which is found out by encoding that many
+        bytes ahead. Shorter streams are sent as one plain body.
+        """
+        upload_url = f"{self.api_url}/metrics/stream"
+        
+        def chunks():
+            lines = []
+            size = 0
+            for metric in records:
+                line = json.dumps(self._format_metric(metric)).encode('utf-8') + b'\n'
+                lines.append(line)
+                size += len(line)
+                if size >= STREAM_CHUNK_SIZE:
+                    yield b''.join(lines)
+                    lines = []
+                    size = 0
+            if lines:
+                yield b''.join(lines)
+        
+        headers = {"Content-Type": "application/x-ndjson", **(batch_headers or {})}
+        body = chunks()
+        threshold = config.collector.compression_threshold
+        if threshold:
+            head = []
+            size = 0
+            for chunk in body:
+                head.append(chunk)
+                size += len(chunk)
+                if size >= threshold:
+                    break
+            if size >= threshold:
+                body = iter_compress(itertools.chain(head, body))
+                headers["Content-Encoding"] = "gzip"
+            else:
+                body = b''.join(head)
+        
+        try:
+            logger.info(f"Streaming {len(records)} backlogged metrics to {upload_url}")
+            response = requests.post(upload_url, data=body, headers=headers, timeout=60)
+            if response.status_code in (200, 202):
+                logger.info(f"Successfully streamed {len(records)} metrics")
+                return True
+            logger.error(f"Failed to stream metrics backlog: {response.status_code} - {response.text}")
+            return False
+        except requests.exceptions.RequestException as e:
+            logger.error(f"Error streaming {len(records)} metrics: {str(e)}")
+            return False
+
+    def _requeue(self, metrics):
+        """Put metrics that could not be uploaded back in the queue, as far as it has room."""
+        requeued = 0
+        for metric in metrics:
+            try:
+                self.queue.put(metric, block=False)
+                requeued += 1
+            except Full:
+                break
+        if requeued < len(metrics):
+            logger.warning(f"Queue is full, dropped {len(metrics) - requeued} metrics that could not be uploaded")
+        logger.info(f"Requeued {requeued} metrics for a later upload")
+
     def start(self):
         """Start the uploader thread."""
         if self.upload_thread is None or not self.upload_thread.is_alive():
@@ -302,6 +377,7 @@ class UploaderQueue:
         logger.info("Stopping uploader thread")
         self.running = False
         self.stop_event.set()
+        self.control_client.close()
         
         # Wait for the thread to finish
         if self.upload_thread and self.upload_thread.is_alive():
@@ -337,10 +413,17 @@ class UploaderQueue:
                     # No more metrics available
                     pass
                 
+                # A backlog larger than one batch is flushed over a single streaming request
+                if batch and config.collector.stream_backlog and self.queue.qsize() >= self.batch_size:
+                    logger.info(f"Queue backlog of {self.queue.qsize() + len(batch)} metrics, streaming it")
+                    if not self._stream_backlog(batch):
+                        logger.error("Failed to stream metrics backlog, it was put back in the queue")
+                        self.stop_event.wait(config.collector.upload_interval)
+                
                 # Upload the batch
-                if batch:
+                elif batch:
                     logger.info(f"Uploading batch of {len(batch)} metrics")
-                    if self._upload_metrics_batch(batch):
+                    if self._upload_with_retry(batch):
                         logger.info(f"Successfully uploaded {len(batch)} metrics")
                     else:
                         logger.error(f"Failed to upload {len(batch)} metrics")
@@ -26,6 +26,11 @@ class CollectorConfig:
     max_queue_size: int
     upload_interval: int  # in seconds
     stock_interval: int  # in seconds for stock collection
+    upload_format: str = "columnar"  # "columnar" or "json" batch uploads
+    compression_threshold: int = 4096  # in bytes, gzip batch bodies at least this large (0 disables)
+    stream_backlog: bool = True  # flush a backlogged queue as one NDJSON stream instead of many batches
+    upload_retries: int = 3  # retries of a failed batch upload, reusing its batch id
+    stream_backlog_max_rows: int = 50000  # metrics sent by one backlog stream
 
 @dataclass
 class WebConfig:
@@ -64,7 +69,12 @@ class Config:
             batch_size=int(os.getenv('BATCH_SIZE', '100')),
             max_queue_size=int(os.getenv('MAX_QUEUE_SIZE', '1000')),
             upload_interval=int(os.getenv('UPLOAD_INTERVAL', '5')),
-            stock_interval=int(os.getenv('STOCK_INTERVAL', '300'))  # Default to 5 minutes
+            stock_interval=int(os.getenv('STOCK_INTERVAL', '300')),  # Default to 5 minutes
+            upload_format=os.getenv('UPLOAD_FORMAT', 'columnar').lower(),
+            compression_threshold=int(os.getenv('COMPRESSION_THRESHOLD', '4096')),
+            stream_backlog=os.getenv('STREAM_BACKLOG', 'True').lower() == 'true',
+            upload_retries=int(os.getenv('UPLOAD_RETRIES', '3')),
+            stream_backlog_max_rows=int(os.getenv('STREAM_BACKLOG_MAX_ROWS', '50000'))
         )
 
         # Web configuration
@@ -108,7 +118,12 @@ class Config:
             'batch_size': self.collector.batch_size,
             'max_queue_size': self.collector.max_queue_size,
             'upload_interval': self.collector.upload_interval,
-            'stock_interval': self.collector.stock_interval
+            'stock_interval': self.collector.stock_interval,
+            'upload_format': self.collector.upload_format,
+            'compression_threshold': self.collector.compression_threshold,
+            'stream_backlog': self.collector.stream_backlog,
+            'upload_retries': self.collector.upload_retries,
+            'stream_backlog_max_rows': self.collector.stream_backlog_max_rows
         }
 
     def get_web_config(self) -> dict:
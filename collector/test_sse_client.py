@@ -0,0 +1,38 @@
+from src.collector.sse_client import SSEParser
+
+def _feed_all(parser, chunks):
+    events = []
+    for chunk in chunks:
+        events.extend(parser.feed(chunk))
+    return events
+
+def test_events_and_fields():
+    parser = SSEParser()
+    events = parser.feed(b': keepalive\n\nid: 1\nevent: command\ndata: {"a": 1}\n\ndata: first\ndata:second\n\n')
+    assert [(e.id, e.event, e.data) for e in events] == [('1', 'command', '{"a": 1}'), ('1', 'message', 'first\nsecond')]
+    assert parser.comments == 1
+    assert parser.last_event_id == '1'
+
+def test_split_chunks_and_line_endings():
+    payload = b'\xef\xbb\xbfid: 7\r\ndata: x\r\n\r\ndata: y\rdata: z\r\n\n'
+    # Every split point must give the same events, including a CRLF cut in half and a split BOM
+    expected = [(e.id, e.data) for e in SSEParser().feed(payload)]
+    assert expected == [('7', 'x'), ('7', 'y\nz')]
+    for split in range(1, len(payload)):
+        events = _feed_all(SSEParser(), [payload[:split], payload[split:]])
+        assert [(e.id, e.data) for e in events] == expected, split
+    events = _feed_all(SSEParser(), [payload[i:i + 1] for i in range(len(payload))])
+    assert [(e.id, e.data) for e in events] == expected
+
+def test_id_without_data_and_retry():
+    parser = SSEParser('3')
+    assert parser.feed(b'id: 4\n\nretry: 2500\nretry: soon\n\n') == []
+    assert parser.last_event_id == '4'
+    assert parser.retry == 2500
+    # An id with a NUL is ignored
+    assert parser.feed(b'id: 5\x006\ndata: x\n\n')[0].id == '4'
+
+def test_incomplete_event_waits_for_blank_line():
+    parser = SSEParser()
+    assert parser.feed(b'data: partial\n') == []
+    assert [e.data for e in parser.feed(b'\n')] == ['partial']
@@ -0,0 +1,40 @@
+import gzip
+from src.collector import uploader_queue
+from src.collector.uploader_queue import UploaderQueue
+from src.utils.config import config
+
+class _Response:
+    status_code = 200
+    text = ''
+
+def _post_stream(monkeypatch, records, threshold):
+    monkeypatch.setattr(config.collector, 'compression_threshold', threshold)
+    sent = {}
+    def post(url, data, headers, timeout):
+        sent['body'] = data if isinstance(data, bytes) else b''.join(data)
+        sent['headers'] = headers
+        return _Response()
+    monkeypatch.setattr(uploader_queue.requests, 'post', post)
+
+    # Skip __init__, which starts the control listener
+    uploader = UploaderQueue.__new__(UploaderQueue)
+    uploader.api_url = 'http://aggregator'
+    assert uploader._post_stream(records)
+    return sent
+
+def _records(count):
+    return [{'device_name': 'D1', 'metric_name': 'cpu', 'metric_value': i, 'timestamp': '2024-03-01T12:00:00Z'} for i in range(count)]
+
+def test_short_stream_is_not_compressed(monkeypatch):
+    sent = _post_stream(monkeypatch, _records(3), 4096)
+    assert 'Content-Encoding' not in sent['headers']
+    assert sent['body'].count(b'\n') == 3
+
+def test_stream_above_threshold_is_compressed(monkeypatch):
+    sent = _post_stream(monkeypatch, _records(5000), 4096)
+    assert sent['headers']['Content-Encoding'] == 'gzip'
+    assert gzip.decompress(sent['body']).count(b'\n') == 5000
+
+def test_compression_disabled(monkeypatch):
+    sent = _post_stream(monkeypatch, _records(5000), 0)
+    assert 'Content-Encoding' not in sent['headers']
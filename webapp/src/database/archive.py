@@ -0,0 +1,329 @@
+import json
+import os
+import shutil
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Iterator, List, Optional, Tuple
+from urllib.parse import quote, unquote
+import numpy as np
+from sqlalchemy import Table, select
+from .database import db
+from .partitions import _naive, partitions
+from src.utils.config import config
+from src.utils.logging_config import get_logger
+
+logger = get_logger('database.archive')
+
+# Sidecar files: one catalog of archived ranges, one chunk index per series
+CATALOG_FILE = 'archive.json'
+INDEX_FILE = 'index.json'
+
+TIMESTAMP_DTYPE = 'datetime64[us]'
+VALUE_DTYPE = np.float64
+
+# Rows fetched per round trip while exporting a partition
+EXPORT_FETCH_ROWS = 10000
+
+def _to_datetime64(timestamp: datetime) -> np.datetime64:
+    return np.datetime64(_naive(timestamp), 'us')
+
+def _write_atomic(path: str, write):
+    """Write a file next to its final path and move it into place."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        write(f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+def _write_json(path: str, data):
+    _write_atomic(path, lambda f: f.write(json.dumps(data, indent=1, default=str).encode('utf-8')))
+
+def _read_json(path: str, default):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return default
+
+class ColumnarArchive:
+    """
+    Cold metric values as per-series columnar chunk files.
+
+    Each sealed partition is exported to one chunk per series: a datetime64
+    timestamp array and a float64 value array, saved as .npy files under
+    <root>/<device_id>/<metric_info_id>/. A sidecar index.json per series
+    lists the chunks with their time bounds and count/sum/min/max, so range
+    queries skip chunks outside the range and summarize fully covered ones
+    without touching their arrays. Chunks are opened with mmap, so reads
+    slice the page cache instead of copying rows through SQLAlchemy.
+    """
+
+    def __init__(self, root: str = None):
+        self.root = root or config.archive.directory
+        self._lock = threading.Lock()  # serializes index and catalog writes
+
+    # Layout
+
+    def _series_dir(self, device_id: str, metric_info_id: int) -> str:
+        return os.path.join(self.root, quote(device_id, safe=''), str(metric_info_id))
+
+    def _load_index(self, device_id: str, metric_info_id: int) -> List[Dict]:
+        return _read_json(os.path.join(self._series_dir(device_id, metric_info_id), INDEX_FILE), [])
+
+    def catalog(self) -> List[Dict]:
+        """Archived ranges, oldest first."""
+        return _read_json(os.path.join(self.root, CATALOG_FILE), [])
+
+    def series(self, device_id: str = None) -> List[Tuple[str, int]]:
+        """Archived (device_id, metric_info_id) pairs, optionally for one device."""
+        if not os.path.isdir(self.root):
+            return []
+        device_dirs = [quote(device_id, safe='')] if device_id else os.listdir(self.root)
+        found = []
+        for device_dir in device_dirs:
+            path = os.path.join(self.root, device_dir)
+            if not os.path.isdir(path):
+                continue
+            for metric_dir in os.listdir(path):
+                if metric_dir.isdigit():
+                    found.append((unquote(device_dir), int(metric_dir)))
+        return found
+
+    def overlaps(self, start_time: datetime = None, end_time: datetime = None) -> bool:
+        """Whether any archived range may hold values in [start_time, end_time]."""
+        start_time, end_time = _naive(start_time), _naive(end_time)
+        for entry in self.catalog():
+            if (end_time is None or datetime.fromisoformat(entry['start_time']) <= end_time) and \
+               (start_time is None or datetime.fromisoformat(entry['end_time']) > start_time):
+                return True
+        return False
+
+    # Export
+
+    def _write_chunk(self, device_id: str, metric_info_id: int, chunk: str,
+                     timestamps: List[datetime], values: List[float]) -> Dict:
+        series_dir = self._series_dir(device_id, metric_info_id)
+        os.makedirs(series_dir, exist_ok=True)
+
+        ts_array = np.array(timestamps, dtype=TIMESTAMP_DTYPE)
+        value_array = np.array(values, dtype=VALUE_DTYPE)
+        _write_atomic(os.path.join(series_dir, f'{chunk}.ts.npy'), lambda f: np.save(f, ts_array))
+        _write_atomic(os.path.join(series_dir, f'{chunk}.values.npy'), lambda f: np.save(f, value_array))
+
+        entry = {
+            'chunk': chunk,
+            'start_time': ts_array[0].item().isoformat(),
+            'end_time': ts_array[-1].item().isoformat(),
+            'count': int(value_array.size),
+            'sum': float(value_array.sum()),
+            'min': float(value_array.min()),
+            'max': float(value_array.max())
+        }
+        with self._lock:
+            index = [existing for existing in self._load_index(device_id, metric_info_id) if existing['chunk'] != chunk]
+            index.append(entry)
+            index.sort(key=lambda existing: existing['start_time'])
+            _write_json(os.path.join(series_dir, INDEX_FILE), index)
+        return entry
+
+    def export_table(self, table: Table, chunk: str, start_time: datetime, end_time: datetime) -> int:
+        """
+        Export every row of a metric_values table into chunk files named chunk.
+
+        Rows are read in series index order, so each series is written out as
+        soon as its last row has been fetched. Exporting the same chunk again
+        replaces it.
+
+        Returns:
+            int: Number of rows exported
+        """
+        started = time.perf_counter()
+        query = select(table.c.device_id, table.c.metric_info_id, table.c.timestamp, table.c.metric_value)\
+            .order_by(table.c.device_id, table.c.metric_info_id, table.c.timestamp)
+        result = db.session.execute(query.execution_options(yield_per=EXPORT_FETCH_ROWS))
+
+        total = 0
+        series_count = 0
+        current, timestamps, values = None, [], []
+        for device_id, metric_info_id, timestamp, value in result:
+            if (device_id, metric_info_id) != current:
+                if timestamps:
+                    self._write_chunk(current[0], current[1], chunk, timestamps, values)
+                    series_count += 1
+                current, timestamps, values = (device_id, metric_info_id), [], []
+            timestamps.append(timestamp)
+            values.append(value)
+            total += 1
+        if timestamps:
+            self._write_chunk(current[0], current[1], chunk, timestamps, values)
+            series_count += 1
+        db.session.commit()
+
+        with self._lock:
+            entries = [entry for entry in self.catalog() if entry['chunk'] != chunk]
+            entries.append({
+                'chunk': chunk,
+                'start_time': start_time.isoformat(),
+                'end_time': end_time.isoformat(),
+                'rows': total,
+                'series': series_count,
+                'archived_at': datetime.utcnow().isoformat()
+            })
+            entries.sort(key=lambda entry: entry['start_time'])
+            os.makedirs(self.root, exist_ok=True)
+            _write_json(os.path.join(self.root, CATALOG_FILE), entries)
+
+        logger.info(
+            f"Archived {total} values of {series_count} series as chunk {chunk} "
+            f"in {time.perf_counter() - started:.1f}s"
+        )
+        return total
+
+    def archive_partitions_before(self, cutoff: datetime) -> Dict[str, int]:
+        """
+        Export every partition that ends at or before cutoff, then drop it.
+
+        Returns:
+            dict: Partition name -> rows archived
+        """
+        cutoff = _naive(cutoff)
+        archived = {}
+        for name, start, end, table in partitions.entries():
+            if end > cutoff:
+                continue
+            archived[name] = self.export_table(table, name, start, end)
+            partitions.drop_partition(name)
+        return archived
+
+    def remove_before(self, cutoff: datetime) -> int:
+        """Delete archived chunks whose range ends at or before cutoff. Returns the number of chunk files removed."""
+        cutoff = _naive(cutoff)
+        with self._lock:
+            catalog = self.catalog()
+            expired = {entry['chunk'] for entry in catalog if datetime.fromisoformat(entry['end_time']) <= cutoff}
+            if not expired:
+                return 0
+
+            removed = 0
+            for device_id, metric_info_id in self.series():
+                series_dir = self._series_dir(device_id, metric_info_id)
+                index = self._load_index(device_id, metric_info_id)
+                kept = [entry for entry in index if entry['chunk'] not in expired]
+                for entry in index:
+                    if entry['chunk'] in expired:
+                        for suffix in ('ts', 'values'):
+                            path = os.path.join(series_dir, f"{entry['chunk']}.{suffix}.npy")
+                            if os.path.exists(path):
+                                os.remove(path)
+                                removed += 1
+                if kept:
+                    _write_json(os.path.join(series_dir, INDEX_FILE), kept)
+                else:
+                    shutil.rmtree(series_dir, ignore_errors=True)
+            _write_json(
+                os.path.join(self.root, CATALOG_FILE),
+                [entry for entry in catalog if entry['chunk'] not in expired]
+            )
+        logger.info(f"Removed {len(expired)} archived chunks ending before {cutoff}")
+        return removed
+
+    # Reads
+
+    def iter_chunks(self, device_id: str, metric_info_id: int, start_time: datetime = None,
+                    end_time: datetime = None) -> Iterator[Tuple[Dict, np.ndarray, np.ndarray]]:
+        """
+        Yield (index entry, timestamps, values) for the chunks overlapping a range.
+
+        The arrays are read-only views into memory-mapped files, already cut
+        to start_time <= timestamp <= end_time.
+        """
+        start_time, end_time = _naive(start_time), _naive(end_time)
+        series_dir = self._series_dir(device_id, metric_info_id)
+        for entry in self._load_index(device_id, metric_info_id):
+            if end_time is not None and datetime.fromisoformat(entry['start_time']) > end_time:
+                continue
+            if start_time is not None and datetime.fromisoformat(entry['end_time']) < start_time:
+                continue
+            try:
+                timestamps = np.load(os.path.join(series_dir, f"{entry['chunk']}.ts.npy"), mmap_mode='r')
+                values = np.load(os.path.join(series_dir, f"{entry['chunk']}.values.npy"), mmap_mode='r')
+            except FileNotFoundError:
+                continue  # Removed by a concurrent retention pass
+            low = 0 if start_time is None else np.searchsorted(timestamps, _to_datetime64(start_time), side='left')
+            high = timestamps.size if end_time is None else np.searchsorted(timestamps, _to_datetime64(end_time), side='right')
+            if high > low:
+                yield entry, timestamps[low:high], values[low:high]
+
+    def read(self, device_id: str, metric_info_id: int, start_time: datetime = None,
+             end_time: datetime = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Archived (timestamps, values) of one series in a range, oldest first.
+
+        A range within one chunk is returned without copying; ranges spanning
+        several chunks are concatenated.
+        """
+        chunks = [(timestamps, values) for _, timestamps, values in
+                  self.iter_chunks(device_id, metric_info_id, start_time, end_time)]
+        if not chunks:
+            return np.empty(0, dtype=TIMESTAMP_DTYPE), np.empty(0, dtype=VALUE_DTYPE)
+        if len(chunks) == 1:
+            return chunks[0]
+        return np.concatenate([c[0] for c in chunks]), np.concatenate([c[1] for c in chunks])
+
+    def summarize(self, device_id: str, metric_info_id: int, start_time: datetime = None,
+                  end_time: datetime = None) -> Optional[Dict]:
+        """
+        Count, sum, min, max and newest timestamp of one series in a range.
+
+        Chunks entirely inside the range are answered from the index.
+        """
+        count, total, low, high, last_time = 0, 0.0, None, None, None
+        for entry, timestamps, values in self.iter_chunks(device_id, metric_info_id, start_time, end_time):
+            if values.size == entry['count']:
+                chunk_count, chunk_sum, chunk_min, chunk_max = entry['count'], entry['sum'], entry['min'], entry['max']
+            else:
+                chunk_count, chunk_sum = int(values.size), float(values.sum())
+                chunk_min, chunk_max = float(values.min()), float(values.max())
+            count += chunk_count
+            total += chunk_sum
+            low = chunk_min if low is None else min(low, chunk_min)
+            high = chunk_max if high is None else max(high, chunk_max)
+            last_time = timestamps[-1].item()
+        if not count:
+            return None
+        return {'count': count, 'sum': total, 'min': low, 'max': high, 'last_updated': last_time}
+
+    def stats(self) -> dict:
+        catalog = self.catalog()
+        size = 0
+        for dirpath, _, filenames in os.walk(self.root):
+            size += sum(os.path.getsize(os.path.join(dirpath, name)) for name in filenames)
+        return {
+            'enabled': config.archive.enabled,
+            'directory': self.root,
+            'archive_after': config.archive.archive_after,
+            'retention': config.archive.retention,
+            'rows': sum(entry['rows'] for entry in catalog),
+            'series': len(self.series()),
+            'bytes': size,
+            'chunks': catalog
+        }
+
+# Global columnar archive, written by the compaction job
+archive = ColumnarArchive()
+
+def check_archive_config():
+    """Refuse an enabled archive without partitions, since only whole partitions are ever archived."""
+    if config.archive.enabled and not partitions.enabled:
+        raise ValueError(
+            f"ARCHIVE=True needs partitioned metric values, but PARTITION_INTERVAL is '{partitions.interval}'. "
+            "Set PARTITION_INTERVAL to day or week, or ARCHIVE=False"
+        )
+
+def archive_cutoff(now: datetime) -> Optional[datetime]:
+    """End time up to which partitions are archived, or None when archiving is off."""
+    if not config.archive.enabled or config.archive.archive_after is None:
+        return None
+    return now - timedelta(seconds=config.archive.archive_after)
@@ -12,11 +12,92 @@ logger = get_logger('database')
 # Initialize SQLAlchemy
 db = SQLAlchemy()
 
+# Named SQLite pragma presets, applied to every pooled connection
+STORAGE_PROFILES = {
+    # Every commit is fsynced; sized for small deployments
+    'durable': {
+        'journal_mode': 'WAL',
+        'synchronous': 'FULL',
+        'cache_size': -16000,  # 16MB
+        'mmap_size': 0,
+        'temp_store': 'DEFAULT',
+        'busy_timeout': 5000,
+        'wal_autocheckpoint': 1000
+    },
+    # WAL with NORMAL sync: commits survive crashes, only a power loss can drop the last ones
+    'throughput': {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'cache_size': -65536,  # 64MB
+        'mmap_size': 268435456,  # 256MB
+        'temp_store': 'MEMORY',
+        'busy_timeout': 10000,
+        'wal_autocheckpoint': 10000
+    }
+}
+
+def get_storage_profile():
+    """Resolve the configured storage profile and its overrides into pragma values."""
+    storage = config.storage
+    if storage.profile not in STORAGE_PROFILES:
+        raise ValueError(f"Unknown SQLite storage profile '{storage.profile}'. Choose one of: {', '.join(STORAGE_PROFILES)}")
+    
+    pragmas = dict(STORAGE_PROFILES[storage.profile])
+    for name in pragmas:
+        override = getattr(storage, name)
+        if override is not None:
+            pragmas[name] = override
+    return pragmas
+
+def apply_storage_profile(engine):
+    """Apply the storage profile pragmas to every new connection of a SQLite engine."""
+    if engine.dialect.name != 'sqlite':
+        return None
+    
+    pragmas = get_storage_profile()
+    
+    @event.listens_for(engine, 'connect')
+    def set_sqlite_pragma(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        # busy_timeout first so switching the journal mode waits on a locked file
+        cursor.execute(f"PRAGMA busy_timeout={int(pragmas['busy_timeout'])}")
+        cursor.execute(f"PRAGMA journal_mode={pragmas['journal_mode']}")
+        cursor.execute(f"PRAGMA synchronous={pragmas['synchronous']}")
+        cursor.execute(f"PRAGMA cache_size={int(pragmas['cache_size'])}")
+        cursor.execute(f"PRAGMA mmap_size={int(pragmas['mmap_size'])}")
+        cursor.execute(f"PRAGMA temp_store={pragmas['temp_store']}")
+        cursor.execute(f"PRAGMA wal_autocheckpoint={int(pragmas['wal_autocheckpoint'])}")
+        cursor.close()
+    
+    return pragmas
+
+def get_storage_report(engine):
+    """Read back the pragmas a pooled connection is actually running with."""
+    if engine.dialect.name != 'sqlite':
+        return {}
+    
+    report = {}
+    with engine.connect() as conn:
+        for name in ('journal_mode', 'synchronous', 'cache_size', 'mmap_size', 'temp_store', 'busy_timeout', 'wal_autocheckpoint'):
+            report[name] = conn.exec_driver_sql(f"PRAGMA {name}").scalar()
+    return report
+
+def configure_storage(app):
+    """Install the storage profile on the app's engine and log what it runs with."""
+    with app.app_context():
+        engine = db.engine
+        if apply_storage_profile(engine) is None:
+            return
+        logger.info(f"SQLite storage profile '{config.storage.profile}': {get_storage_report(engine)}")
+
 def _initialize_sqlite_db(db_path):
     """Initialize a new SQLite database file."""
     try:
-        # Create a new SQLite database file
+        # Create a new SQLite database file; auto_vacuum has to be chosen before
+        # the first table exists so compaction can later shrink the file
         conn = sqlite3.connect(db_path)
+        conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        conn.execute("VACUUM")
         conn.close()
         logger.info(f"Created new SQLite database at {db_path}")
     except Exception as e:
@@ -52,10 +133,13 @@ def init_db(app):
         # Initialize the database with the app
         db.init_app(app)
         
+        # Apply the SQLite storage profile to every pooled connection
+        configure_storage(app)
+        
         # Create all tables
         with app.app_context():
             # Import models to ensure they're registered with SQLAlchemy
-            from .models import Device, MetricInfo, MetricValue
+            from .models import Device, MetricInfo, MetricValue, MetricPartition
             
             # Log all tables that should be created
             for table in db.Model.metadata.tables.values():
@@ -65,6 +149,14 @@ def init_db(app):
             db.create_all()
             logger.info("Database tables created successfully")
             
+            # Bring indexes of pre-existing database files up to date
+            from .migrations import ensure_indexes
+            ensure_indexes()
+            
+            # Load the metric_values partition catalog
+            from .partitions import partitions
+            partitions.load()
+            
             # Verify tables were created
             engine = db.get_engine()
             with engine.connect() as conn:
@@ -85,14 +177,8 @@ def create_session():
     database_url = config.get_database_url()
     engine = create_engine(database_url)
     
-    # Configure SQLite for better concurrency
-    if database_url.startswith('sqlite:///'):
-        @event.listens_for(engine, 'connect')
-        def set_sqlite_pragma(dbapi_connection, connection_record):
-            cursor = dbapi_connection.cursor()
-            cursor.execute("PRAGMA journal_mode=WAL")
-            cursor.execute("PRAGMA synchronous=NORMAL")
-            cursor.close()
+    # Configure SQLite with the same storage profile as the Flask engine
+    apply_storage_profile(engine)
     
     Session = sessionmaker(bind=engine)
     return Session()
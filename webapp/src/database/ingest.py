@@ -0,0 +1,164 @@
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from operator import itemgetter
+from typing import Dict, List
+import numpy as np
+from sqlalchemy import Table, insert
+from .database import db
+from .partitions import partitions
+from .resolver import resolver
+from .rollups import update_rollup_points, update_rollups
+from src.utils.columnar import ColumnarBatch
+from src.utils.logging_config import get_logger
+
+logger = get_logger('database.ingest')
+
+# Columns bound positionally by _insert_points, in row tuple order
+POINT_COLUMNS = ('device_id', 'metric_info_id', 'metric_value', 'timestamp', 'created_at')
+
+@dataclass
+class IngestResult:
+    """Outcome of a bulk ingest call."""
+    count: int
+    devices: int
+    metrics: int
+    elapsed: float  # in seconds
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.count / self.elapsed if self.elapsed > 0 else float(self.count)
+
+def coerce_timestamp(value) -> datetime:
+    """Convert an incoming timestamp to a datetime, falling back to the current time."""
+    if isinstance(value, datetime):
+        return value
+    if isinstance(value, str):
+        try:
+            return datetime.fromisoformat(value.replace('Z', '+00:00'))
+        except ValueError:
+            # If parsing fails, use current time
+            return datetime.utcnow()
+    return value if value is not None else datetime.utcnow()
+
+def ingest_metrics(metrics_batch: List[Dict], commit: bool = True) -> IngestResult:
+    """
+    Insert a batch of metrics using set-based lookups and a single multi-row insert.
+
+    Every distinct device and metric name in the batch is resolved once through the
+    shared catalog resolver, then all metric_values rows are written with one
+    executemany inside the current transaction.
+
+    Args:
+        metrics_batch: Metric dicts with device_id, device_name, metric_name,
+            metric_value, timestamp and optional metric_metadata
+        commit: Commit the session once the rows are written
+
+    Returns:
+        IngestResult: Row count, distinct devices/metrics and elapsed time
+    """
+    started = time.perf_counter()
+
+    device_keys = list(dict.fromkeys(
+        (metric.get('device_id'), metric.get('device_name')) for metric in metrics_batch
+    ))
+    metric_names = list(dict.fromkeys(metric.get('metric_name') for metric in metrics_batch))
+
+    device_ids = resolver.resolve_devices(device_keys)
+    metric_info_ids = resolver.resolve_metrics(metric_names)
+
+    rows = [
+        {
+            'device_id': device_ids[(metric.get('device_id'), metric.get('device_name'))],
+            'metric_info_id': metric_info_ids[metric.get('metric_name')],
+            'metric_value': metric.get('metric_value'),
+            'timestamp': coerce_timestamp(metric.get('timestamp')),
+            'metric_metadata': metric.get('metric_metadata'),
+        }
+        for metric in metrics_batch
+    ]
+
+    return _write_rows(rows, len(device_keys), len(metric_names), started, commit)
+
+def ingest_columns(batch: ColumnarBatch, commit: bool = True) -> IngestResult:
+    """
+    Insert a columnar batch decoded from the binary wire format.
+
+    Names are resolved per string-table entry rather than per row. The
+    packed columns are zipped into positional row tuples that are bound to
+    the insert as they are, without a parameter dict per row.
+    """
+    started = time.perf_counter()
+    strings = batch.strings
+
+    device_pairs = list(dict.fromkeys(zip(batch.device_ids, batch.device_names)))
+    device_keys = {
+        pair: (strings[pair[0]] if pair[0] >= 0 else None, strings[pair[1]])
+        for pair in device_pairs
+    }
+    metric_indices = list(dict.fromkeys(batch.metric_names))
+
+    resolved_devices = resolver.resolve_devices(device_keys.values())
+    resolved_metrics = resolver.resolve_metrics(strings[index] for index in metric_indices)
+
+    device_ids = {pair: resolved_devices[key] for pair, key in device_keys.items()}
+    metric_info_ids = {index: resolved_metrics[strings[index]] for index in metric_indices}
+
+    points = list(zip(
+        [device_ids[pair] for pair in zip(batch.device_ids, batch.device_names)],
+        [metric_info_ids[index] for index in batch.metric_names],
+        batch.values.tolist(),
+        # Microseconds since the epoch convert to naive UTC datetimes in one pass
+        np.asarray(batch.timestamps).astype('datetime64[us]').tolist()
+    ))
+
+    for table, partition_points in partitions.route(points, itemgetter(3)).items():
+        _insert_points(table, partition_points)
+    update_rollup_points(points)
+    return _finish(len(points), len(device_pairs), len(metric_indices), started, commit)
+
+def _insert_points(table: Table, points: List[tuple]):
+    """
+    Insert (device_id, metric_info_id, metric_value, timestamp) tuples with one executemany.
+
+    The tuples are handed to the DBAPI as positional parameters; only the
+    datetimes pass through the dialect's bind processor.
+    """
+    dialect = db.engine.dialect
+    process = table.c.timestamp.type.bind_processor(dialect) or (lambda value: value)
+    created_at = process(datetime.utcnow())
+    preparer = dialect.identifier_preparer
+    marker = '?' if dialect.paramstyle == 'qmark' else '%s'
+    statement = (
+        f"INSERT INTO {preparer.format_table(table)} "
+        f"({', '.join(preparer.quote(column) for column in POINT_COLUMNS)}) "
+        f"VALUES ({', '.join([marker] * len(POINT_COLUMNS))})"
+    )
+    db.session.connection().exec_driver_sql(statement, [
+        (device_id, metric_info_id, value, process(timestamp), created_at)
+        for device_id, metric_info_id, value, timestamp in points
+    ])
+
+def _write_rows(rows: List[Dict], devices: int, metrics: int, started: float, commit: bool) -> IngestResult:
+    """Write resolved metric_values rows with one executemany per partition, fold them into the rollups and report throughput."""
+    for table, partition_rows in partitions.route(rows).items():
+        db.session.execute(insert(table), partition_rows)
+    update_rollups(rows)
+    return _finish(len(rows), devices, metrics, started, commit)
+
+def _finish(count: int, devices: int, metrics: int, started: float, commit: bool) -> IngestResult:
+    """Commit if asked to and report the throughput of an ingest call."""
+    if commit:
+        db.session.commit()
+
+    result = IngestResult(
+        count=count,
+        devices=devices,
+        metrics=metrics,
+        elapsed=time.perf_counter() - started
+    )
+    logger.info(
+        f"Ingested {result.count} metrics for {result.devices} devices and {result.metrics} metric names "
+        f"in {result.elapsed * 1000:.1f}ms ({result.rows_per_second:.0f} rows/s)"
+    )
+    return result
@@ -0,0 +1,44 @@
+import time
+from sqlalchemy import inspect
+from .database import db
+from .models import MetricValue
+from src.utils.logging_config import get_logger
+
+logger = get_logger('database.migrations')
+
+# Tables whose declared indexes are managed on existing databases
+MANAGED_TABLES = [MetricValue.__table__]
+
+def ensure_indexes(engine=None):
+    """
+    Create any declared index that is missing from an existing database.
+
+    db.create_all() only creates indexes together with new tables, so files
+    created before an index was declared are brought up to date here.
+
+    Returns:
+        list: Names of the indexes that were created
+    """
+    engine = engine or db.engine
+    created = []
+    inspector = inspect(engine)
+    
+    for table in MANAGED_TABLES:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {index['name'] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name in existing:
+                continue
+            logger.info(f"Creating index {index.name} on {table.name}, this may take a while on large tables")
+            started = time.perf_counter()
+            index.create(bind=engine, checkfirst=True)
+            logger.info(f"Created index {index.name} in {time.perf_counter() - started:.1f}s")
+            created.append(index.name)
+    
+    if created and engine.dialect.name == 'sqlite':
+        # Refresh planner statistics so the new indexes are used
+        with engine.begin() as conn:
+            conn.exec_driver_sql("PRAGMA analysis_limit=1000")
+            conn.exec_driver_sql("ANALYZE")
+    return created
@@ -1,5 +1,5 @@
 from datetime import datetime
-from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, JSON
+from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, JSON, Index
 from sqlalchemy.orm import relationship
 from .database import db
 from src.utils.logging_config import get_logger
@@ -42,6 +42,12 @@ class MetricInfo(db.Model):
 class MetricValue(db.Model):
     """Model for storing metric values."""
     __tablename__ = 'metric_values'
+    __table_args__ = (
+        # Per-series range scans ordered by time (dashboard, reporting, pagination)
+        Index('ix_metric_values_series_time', 'device_id', 'metric_info_id', 'timestamp'),
+        # Time-range scans across all series
+        Index('ix_metric_values_timestamp', 'timestamp'),
+    )
     
     id = Column(Integer, primary_key=True)
     device_id = Column(String(36), ForeignKey('devices.id'), nullable=False)
@@ -56,4 +62,40 @@ class MetricValue(db.Model):
     metric_info = relationship('MetricInfo', back_populates='values')
     
     def __repr__(self):
-        return f"<MetricValue {self.metric_value} for Device {self.device_id} at {self.timestamp}>" 
\ No newline at end of file
+        return f"<MetricValue {self.metric_value} for Device {self.device_id} at {self.timestamp}>"
+
+class MetricRollup(db.Model):
+    """Per-series aggregates of metric values over fixed time buckets."""
+    __tablename__ = 'metric_rollups'
+    __table_args__ = (
+        # Time-range scans of one tier across all series
+        Index('ix_metric_rollups_tier_bucket', 'tier', 'bucket_start'),
+    )
+    
+    tier = Column(String(8), primary_key=True)  # "1m", "1h" or "1d"
+    device_id = Column(String(36), ForeignKey('devices.id'), primary_key=True)
+    metric_info_id = Column(Integer, ForeignKey('metric_info.id'), primary_key=True)
+    bucket_start = Column(DateTime, primary_key=True)
+    value_count = Column(Integer, nullable=False)
+    value_sum = Column(Float, nullable=False)
+    value_min = Column(Float, nullable=False)
+    value_max = Column(Float, nullable=False)
+    first_value = Column(Float, nullable=False)
+    first_time = Column(DateTime, nullable=False)
+    last_value = Column(Float, nullable=False)
+    last_time = Column(DateTime, nullable=False)
+    
+    def __repr__(self):
+        return f"<MetricRollup {self.tier} {self.device_id}/{self.metric_info_id} at {self.bucket_start}>"
+
+class MetricPartition(db.Model):
+    """Catalog of the time-partitioned tables holding metric values."""
+    __tablename__ = 'metric_partitions'
+    
+    name = Column(String(64), primary_key=True)
+    start_time = Column(DateTime, nullable=False)  # inclusive
+    end_time = Column(DateTime, nullable=False)  # exclusive
+    created_at = Column(DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f"<MetricPartition {self.name} [{self.start_time}, {self.end_time})>"
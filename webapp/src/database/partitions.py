@@ -0,0 +1,321 @@
+import threading
+import time
+from datetime import datetime, timedelta
+from operator import itemgetter
+from typing import Callable, Dict, List, Optional, Tuple
+from sqlalchemy import Table, delete, event, false, func, select, tuple_, union_all
+from sqlalchemy.orm import Session, aliased
+from .database import db
+from .models import Device, MetricInfo, MetricPartition, MetricValue
+from .resolver import _upsert
+from src.utils.config import config
+from src.utils.logging_config import get_logger
+
+logger = get_logger('database.partitions')
+
+# Rows written before partitioning was enabled stay in the original table
+LEGACY_TABLE = MetricValue.__table__.name
+
+PARTITION_INTERVALS = {
+    'day': timedelta(days=1),
+    'week': timedelta(weeks=1)
+}
+
+# Seconds between reloads of the catalog, so partitions created by other workers become visible
+CATALOG_REFRESH_INTERVAL = 30
+
+def _naive(timestamp: Optional[datetime]) -> Optional[datetime]:
+    """Drop tzinfo the way the SQLite DateTime type does when storing a value."""
+    if timestamp is not None and timestamp.tzinfo is not None:
+        return timestamp.replace(tzinfo=None)
+    return timestamp
+
+def partition_bounds(timestamp: datetime, interval: str) -> Tuple[datetime, datetime]:
+    """Return the [start, end) range of the partition holding a timestamp."""
+    timestamp = _naive(timestamp)
+    start = datetime(timestamp.year, timestamp.month, timestamp.day)
+    if interval == 'week':
+        start -= timedelta(days=start.weekday())
+    return start, start + PARTITION_INTERVALS[interval]
+
+def partition_name(start: datetime, interval: str) -> str:
+    """Table name of a partition, e.g. metric_values_d20240131 or metric_values_w20240129."""
+    return f"{LEGACY_TABLE}_{interval[0]}{start:%Y%m%d}"
+
+def _define_table(name: str) -> Table:
+    """Table object for a partition, with the columns and indexes of metric_values."""
+    table = db.metadata.tables.get(name)
+    if table is None:
+        table = MetricValue.__table__.to_metadata(db.metadata, name=name)
+        # Index names are global in SQLite, so give each partition its own
+        for index in table.indexes:
+            index.name = index.name.replace(LEGACY_TABLE, name, 1)
+    return table
+
+class PartitionManager:
+    """
+    Routes metric values into per-day or per-week tables and prunes queries to
+    the partitions overlapping the requested time range.
+
+    Partitions are recorded in the metric_partitions catalog. Dropping an old
+    partition is a single DROP TABLE instead of a DELETE over millions of rows.
+    Rows written before partitioning was enabled stay in metric_values, which
+    is treated as one more partition bounded by its oldest and newest rows.
+    """
+
+    def __init__(self, interval: str = None):
+        self.interval = interval or config.storage.partition_interval
+        if self.interval != 'none' and self.interval not in PARTITION_INTERVALS:
+            raise ValueError(f"Unknown partition interval '{self.interval}'. Choose one of: day, week, none")
+        self._lock = threading.Lock()
+        self._partitions: Dict[str, Tuple[datetime, datetime, Table]] = {}  # name -> (start, end, table)
+        self._legacy_bounds = None  # (oldest, newest) timestamps of rows in metric_values
+        self._loaded_at = None
+        self._changed_at: Dict[str, float] = {}  # name -> when this worker created or dropped it
+
+    @property
+    def enabled(self) -> bool:
+        """Whether new rows are routed to partitions."""
+        return self.interval in PARTITION_INTERVALS
+
+    def load(self):
+        """
+        Read the partition catalog and the bounds of the legacy table. Needs an app context.
+
+        The catalog replaces the one in memory, so partitions other workers
+        created or dropped are picked up. Partitions this worker created or
+        dropped while the catalog was read keep their current state.
+        """
+        started = time.monotonic()
+        entries = db.session.execute(select(MetricPartition)).scalars().all()
+        low, high = db.session.execute(
+            select(func.min(MetricValue.timestamp), func.max(MetricValue.timestamp))
+        ).one()
+        first_load = self._loaded_at is None
+        with self._lock:
+            catalog = {
+                entry.name: (entry.start_time, entry.end_time, _define_table(entry.name))
+                for entry in entries
+            }
+            for name, changed_at in self._changed_at.items():
+                if changed_at >= started:
+                    catalog.pop(name, None)
+                    if name in self._partitions:
+                        catalog[name] = self._partitions[name]
+            for name, (_, _, table) in self._partitions.items():
+                if name not in catalog:
+                    db.metadata.remove(table)
+            self._partitions = catalog
+            self._changed_at = {name: at for name, at in self._changed_at.items() if at >= started}
+            self._legacy_bounds = (low, high) if low is not None else None
+            self._loaded_at = time.monotonic()
+        (logger.info if first_load else logger.debug)(
+            f"Loaded {len(entries)} metric partitions (interval: {self.interval})"
+        )
+
+    def _refresh_catalog(self):
+        # Apps that never called load() still see the legacy table
+        if self._loaded_at is None or time.monotonic() - self._loaded_at >= CATALOG_REFRESH_INTERVAL:
+            self.load()
+
+    # Writes
+
+    def route(self, rows: List, timestamp_of: Callable = itemgetter('timestamp')) -> Dict[Table, List]:
+        """
+        Group metric_values rows by the table they belong in, creating partitions as needed.
+
+        Rows are dicts unless timestamp_of reads the timestamp of another row shape.
+        """
+        if not self.enabled:
+            return {MetricValue.__table__: rows} if rows else {}
+
+        groups: Dict[datetime, List] = {}
+        for row in rows:
+            start, _ = partition_bounds(timestamp_of(row), self.interval)
+            groups.setdefault(start, []).append(row)
+        return {self._table_for(start): group for start, group in groups.items()}
+
+    def _table_for(self, start: datetime) -> Table:
+        name = partition_name(start, self.interval)
+        entry = self._partitions.get(name)
+        if entry is not None:
+            return entry[2]
+
+        pending = db.session.info.setdefault('partitions_pending', {})
+        if name in pending:
+            return pending[name][2]
+
+        # Created on the session's connection so the catalog entry commits with the rows
+        end = start + PARTITION_INTERVALS[self.interval]
+        with self._lock:
+            table = _define_table(name)
+        connection = db.session.connection()
+        table.create(bind=connection, checkfirst=True)
+        connection.execute(_upsert(MetricPartition, [{
+            'name': name,
+            'start_time': start,
+            'end_time': end,
+            'created_at': datetime.utcnow()
+        }], ['name']))
+        pending[name] = (start, end, table)
+        logger.info(f"Created partition {name} for [{start}, {end})")
+        return table
+
+    def _promote(self, pending: Dict):
+        now = time.monotonic()
+        with self._lock:
+            self._partitions.update(pending)
+            self._changed_at.update((name, now) for name in pending)
+
+    # Reads
+
+    def tables_for_range(self, start_time: datetime = None, end_time: datetime = None) -> List[Table]:
+        """Tables that may hold rows with start_time <= timestamp <= end_time."""
+        start_time, end_time = _naive(start_time), _naive(end_time)
+        self._refresh_catalog()
+
+        def overlaps(low, high):
+            return (end_time is None or low <= end_time) and (start_time is None or high > start_time)
+
+        with self._lock:
+            partitions = sorted(self._partitions.values(), key=lambda entry: entry[0])
+            legacy_bounds = self._legacy_bounds
+
+        tables = []
+        # While partitioning is off new rows still land in metric_values, so its bounds are open
+        if not self.enabled or (legacy_bounds and overlaps(legacy_bounds[0], legacy_bounds[1] + timedelta(microseconds=1))):
+            tables.append(MetricValue.__table__)
+        tables.extend(table for low, high, table in partitions if overlaps(low, high))
+        return tables
+
+    def source(self, start_time: datetime = None, end_time: datetime = None,
+               device_name: str = None, metric_name: str = None,
+               before: Tuple[datetime, int] = None, after: Tuple[datetime, int] = None, limit: int = None):
+        """
+        ORM entity to query in place of MetricValue for a time range.
+
+        Only partitions overlapping the range are read. The range and the
+        optional device and metric filters are applied inside every partition
+        so each one can use its series index.
+
+        For keyset pagination, before/after restrict rows to (timestamp, id)
+        below or above a cursor, and limit makes every partition contribute
+        only its first rows in that order (newest first, or oldest first with
+        after). A page then reads the same number of rows however deep it is.
+        """
+        if before:
+            end_time = min(end_time, before[0]) if end_time else before[0]
+        if after:
+            start_time = max(start_time, after[0]) if start_time else after[0]
+
+        tables = self.tables_for_range(start_time, end_time)
+        if tables == [MetricValue.__table__]:
+            return MetricValue
+
+        arms = []
+        for table in tables:
+            arm = select(table)
+            if start_time:
+                arm = arm.where(table.c.timestamp >= start_time)
+            if end_time:
+                arm = arm.where(table.c.timestamp <= end_time)
+            if device_name:
+                arm = arm.where(table.c.device_id == select(Device.id).where(Device.name == device_name).scalar_subquery())
+            if metric_name:
+                arm = arm.where(table.c.metric_info_id == select(MetricInfo.id).where(MetricInfo.name == metric_name).scalar_subquery())
+            if before:
+                arm = arm.where(tuple_(table.c.timestamp, table.c.id) < tuple_(*before))
+            if after:
+                arm = arm.where(tuple_(table.c.timestamp, table.c.id) > tuple_(*after))
+            if limit:
+                if after:
+                    arm = arm.order_by(table.c.timestamp, table.c.id)
+                else:
+                    arm = arm.order_by(table.c.timestamp.desc(), table.c.id.desc())
+                # SQLite only allows LIMIT on a compound member inside a subquery
+                arm = select(arm.limit(limit).subquery())
+            arms.append(arm)
+        if not arms:
+            arms.append(select(MetricValue.__table__).where(false()))
+
+        selectable = arms[0] if len(arms) == 1 else union_all(*arms)
+        return aliased(MetricValue, selectable.subquery(f'{LEGACY_TABLE}_range'), adapt_on_names=True)
+
+    def has_rows(self) -> bool:
+        """Whether any partition holds a metric value, without counting them."""
+        return any(
+            db.session.execute(select(table.c.id).limit(1)).first() is not None
+            for table in self.tables_for_range()
+        )
+
+    # Maintenance
+
+    def entries(self) -> List[Tuple[str, datetime, datetime, Table]]:
+        """Catalogued partitions as (name, start, end, table), oldest first."""
+        self._refresh_catalog()
+        with self._lock:
+            return sorted(
+                ((name, start, end, table) for name, (start, end, table) in self._partitions.items()),
+                key=lambda entry: entry[1]
+            )
+
+    def drop_partition(self, name: str) -> bool:
+        """Drop a partition table and its catalog entry."""
+        with self._lock:
+            entry = self._partitions.get(name)
+        if entry is None:
+            return False
+
+        started = time.perf_counter()
+        table = entry[2]
+        try:
+            connection = db.session.connection()
+            table.drop(bind=connection, checkfirst=True)
+            connection.execute(delete(MetricPartition).where(MetricPartition.name == name))
+            db.session.commit()
+        except Exception:
+            # The table is still there, so it stays in the catalog
+            db.session.rollback()
+            raise
+        with self._lock:
+            self._partitions.pop(name, None)
+            self._changed_at[name] = time.monotonic()
+        db.metadata.remove(table)
+        logger.info(f"Dropped partition {name} in {(time.perf_counter() - started) * 1000:.1f}ms")
+        return True
+
+    def drop_partitions_before(self, cutoff: datetime) -> List[str]:
+        """Drop every partition that only holds rows older than cutoff."""
+        cutoff = _naive(cutoff)
+        with self._lock:
+            expired = [name for name, (_, end, _) in self._partitions.items() if end <= cutoff]
+        return [name for name in sorted(expired) if self.drop_partition(name)]
+
+    def stats(self) -> dict:
+        with self._lock:
+            partitions = sorted(self._partitions.items(), key=lambda item: item[1][0])
+            legacy_bounds = self._legacy_bounds
+        return {
+            'interval': self.interval,
+            'legacy_table': {
+                'oldest': legacy_bounds[0].isoformat() if legacy_bounds else None,
+                'newest': legacy_bounds[1].isoformat() if legacy_bounds else None
+            },
+            'partitions': [
+                {'name': name, 'start_time': start.isoformat(), 'end_time': end.isoformat()}
+                for name, (start, end, _) in partitions
+            ]
+        }
+
+# Global partition manager, loaded by init_db
+partitions = PartitionManager()
+
+@event.listens_for(Session, 'after_commit')
+def _promote_pending(session):
+    pending = session.info.pop('partitions_pending', None)
+    if pending:
+        partitions._promote(pending)
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _discard_pending(session, previous_transaction):
+    session.info.pop('partitions_pending', None)
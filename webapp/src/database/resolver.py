@@ -0,0 +1,249 @@
+import threading
+import uuid
+from collections import OrderedDict, namedtuple
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+from sqlalchemy import event, select, or_
+from sqlalchemy.orm import Session
+from .database import db
+from .models import Device, MetricInfo
+from src.utils.config import config
+from src.utils.logging_config import get_logger
+
+logger = get_logger('database.resolver')
+
+# Lightweight, session-independent snapshot of a device row
+CachedDevice = namedtuple('CachedDevice', ['id', 'name'])
+
+DeviceKey = Tuple[Optional[str], Optional[str]]
+
+def _upsert(model, rows: List[Dict], index_elements=None):
+    """Build an INSERT ... ON CONFLICT DO NOTHING statement for the active dialect."""
+    if db.engine.dialect.name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    return dialect_insert(model).values(rows).on_conflict_do_nothing(index_elements=index_elements)
+
+class CatalogResolver:
+    """
+    Process-wide get-or-create resolver for devices and metric names.
+
+    Resolutions are kept in bounded LRU maps so a stable fleet resolves every
+    device and metric name without touching the catalog tables. Entries learnt
+    inside a transaction only become visible to other requests once that
+    transaction commits, so a rolled back batch never leaves stale ids behind.
+    """
+
+    def __init__(self, max_size: int = None):
+        self.max_size = max_size or config.ingest.catalog_cache_size
+        self._lock = threading.Lock()
+        self._devices_by_id = OrderedDict()  # requested device_id -> CachedDevice
+        self._devices_by_name = OrderedDict()  # device name -> CachedDevice
+        self._metric_ids = OrderedDict()  # metric name -> metric_info id
+        self.hits = 0
+        self.misses = 0
+
+    # Cache bookkeeping
+
+    def _get(self, cache: OrderedDict, key):
+        value = cache.get(key)
+        if value is not None:
+            cache.move_to_end(key)
+        return value
+
+    def _put(self, cache: OrderedDict, key, value):
+        cache[key] = value
+        cache.move_to_end(key)
+        while len(cache) > self.max_size:
+            cache.popitem(last=False)
+
+    def _stage(self, kind: str, key, value):
+        """Hold a resolution until the current transaction commits."""
+        db.session.info.setdefault('catalog_pending', []).append((kind, key, value))
+
+    def _promote(self, pending: List):
+        with self._lock:
+            for kind, key, value in pending:
+                if kind == 'device_id':
+                    self._put(self._devices_by_id, key, value)
+                elif kind == 'device_name':
+                    self._put(self._devices_by_name, key, value)
+                else:
+                    self._put(self._metric_ids, key, value)
+
+    # Devices
+
+    def resolve_devices(self, device_keys: Iterable[DeviceKey]) -> Dict[DeviceKey, str]:
+        """
+        Resolve (device_id, device_name) pairs to device ids.
+
+        A known device_id wins; otherwise the device is matched by name, and
+        finally created with the requested id (or a new UUID) if neither exists.
+        """
+        resolved = {}
+        missing = []
+        with self._lock:
+            for device_id, device_name in device_keys:
+                device = self._get(self._devices_by_id, device_id) if device_id \
+                    else self._get(self._devices_by_name, device_name)
+                if device is not None:
+                    self.hits += 1
+                    resolved[(device_id, device_name)] = device.id
+                else:
+                    self.misses += 1
+                    missing.append((device_id, device_name))
+
+        if missing:
+            resolved.update(self._load_devices(missing))
+        return resolved
+
+    def resolve_device(self, device_id: Optional[str], device_name: str) -> str:
+        """Resolve a single device to its id."""
+        return self.resolve_devices([(device_id, device_name)])[(device_id, device_name)]
+
+    def _load_devices(self, device_keys: List[DeviceKey]) -> Dict[DeviceKey, str]:
+        ids = {device_id for device_id, _ in device_keys if device_id}
+        names = {device_name for _, device_name in device_keys if device_name}
+
+        by_id, by_name = self._select_devices(ids, names)
+
+        # Insert whatever is still unknown; concurrent writers are absorbed by ON CONFLICT
+        new_rows = {}
+        for device_id, device_name in device_keys:
+            if by_id.get(device_id) is None and by_name.get(device_name) is None and device_name not in new_rows:
+                now = datetime.utcnow()
+                new_rows[device_name] = {
+                    'id': device_id or str(uuid.uuid4()),
+                    'name': device_name,
+                    'created_at': now,
+                    'updated_at': now
+                }
+        if new_rows:
+            db.session.execute(_upsert(Device, list(new_rows.values())))
+            created_ids = {row['id'] for row in new_rows.values()}
+            more_by_id, more_by_name = self._select_devices(created_ids, set(new_rows))
+            by_id.update(more_by_id)
+            by_name.update(more_by_name)
+            logger.info(f"Created new devices: {', '.join(new_rows)}")
+
+        resolved = {}
+        for device_id, device_name in device_keys:
+            device = by_id.get(device_id) or by_name.get(device_name)
+            resolved[(device_id, device_name)] = device.id
+            if device_id:
+                self._stage('device_id', device_id, device)
+            else:
+                self._stage('device_name', device_name, device)
+        return resolved
+
+    def _select_devices(self, ids, names):
+        if not ids and not names:
+            return {}, {}
+        rows = db.session.execute(
+            select(Device.id, Device.name).where(or_(Device.id.in_(ids), Device.name.in_(names)))
+        ).all()
+        devices = [CachedDevice(row.id, row.name) for row in rows]
+        return {device.id: device for device in devices}, {device.name: device for device in devices}
+
+    def register_device(self, device_name: str, description: Optional[str] = None) -> Tuple[str, bool]:
+        """
+        Create a device by name if it does not exist.
+
+        Any cached resolution for the name is dropped first so re-registration
+        always reflects the current row.
+
+        Returns:
+            tuple: (device_id, created)
+        """
+        self.invalidate_device(device_name)
+
+        now = datetime.utcnow()
+        result = db.session.execute(_upsert(Device, [{
+            'id': str(uuid.uuid4()),
+            'name': device_name,
+            'description': description,
+            'created_at': now,
+            'updated_at': now
+        }], index_elements=['name']))
+        created = result.rowcount == 1
+
+        device_id = self.resolve_device(None, device_name)
+        return device_id, created
+
+    def invalidate_device(self, device_name: str):
+        """Drop every cached resolution that points at the named device."""
+        with self._lock:
+            self._devices_by_name.pop(device_name, None)
+            stale = [key for key, device in self._devices_by_id.items() if device.name == device_name]
+            for key in stale:
+                del self._devices_by_id[key]
+
+    # Metric names
+
+    def resolve_metrics(self, metric_names: Iterable[str]) -> Dict[str, int]:
+        """Resolve metric names to metric_info ids, creating missing entries."""
+        resolved = {}
+        missing = []
+        with self._lock:
+            for metric_name in metric_names:
+                metric_id = self._get(self._metric_ids, metric_name)
+                if metric_id is not None:
+                    self.hits += 1
+                    resolved[metric_name] = metric_id
+                else:
+                    self.misses += 1
+                    missing.append(metric_name)
+
+        if missing:
+            now = datetime.utcnow()
+            db.session.execute(_upsert(MetricInfo, [
+                {'name': metric_name, 'unit': 'units', 'created_at': now, 'updated_at': now}
+                for metric_name in missing
+            ], index_elements=['name']))
+            rows = db.session.execute(
+                select(MetricInfo.id, MetricInfo.name).where(MetricInfo.name.in_(missing))
+            ).all()
+            for row in rows:
+                resolved[row.name] = row.id
+                self._stage('metric', row.name, row.id)
+        return resolved
+
+    def resolve_metric(self, metric_name: str) -> int:
+        """Resolve a single metric name to its metric_info id."""
+        return self.resolve_metrics([metric_name])[metric_name]
+
+    # Introspection
+
+    def clear(self):
+        with self._lock:
+            self._devices_by_id.clear()
+            self._devices_by_name.clear()
+            self._metric_ids.clear()
+
+    def stats(self) -> dict:
+        """Cache size and hit/miss counters."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'devices_by_id': len(self._devices_by_id),
+                'devices_by_name': len(self._devices_by_name),
+                'metrics': len(self._metric_ids),
+                'max_size': self.max_size
+            }
+
+# Global resolver shared by every ingest entry point
+resolver = CatalogResolver()
+
+@event.listens_for(Session, 'after_commit')
+def _promote_pending(session):
+    pending = session.info.pop('catalog_pending', None)
+    if pending:
+        resolver._promote(pending)
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _discard_pending(session, previous_transaction):
+    session.info.pop('catalog_pending', None)
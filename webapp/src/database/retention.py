@@ -0,0 +1,278 @@
+import time
+from dataclasses import asdict, dataclass, field
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+from sqlalchemy import and_, delete, func, select
+from .archive import archive, archive_cutoff
+from .database import db
+from .models import MetricInfo, MetricRollup
+from .partitions import partitions
+from .rollups import TIERS, bucket_start, write_rollups
+from src.utils.config import config
+from src.utils.logging_config import get_logger
+
+logger = get_logger('database.retention')
+
+RAW = 'raw'
+
+@dataclass
+class CompactionReport:
+    """What one compaction run removed and reclaimed."""
+    started_at: datetime
+    raw_rows_removed: int = 0
+    rows_downsampled: int = 0
+    raw_metrics_skipped: List[int] = field(default_factory=list)  # metrics whose expiring values are not in the rollups yet
+    rollup_rows_removed: Dict[str, int] = field(default_factory=dict)
+    partitions_dropped: List[str] = field(default_factory=list)
+    partitions_archived: List[str] = field(default_factory=list)
+    rows_archived: int = 0
+    archive_files_removed: int = 0
+    bytes_reclaimed: int = 0
+    free_bytes: int = 0  # space left on the freelist, reusable but not returned to the OS
+    elapsed: float = 0.0
+
+    def to_dict(self) -> dict:
+        report = asdict(self)
+        report['started_at'] = self.started_at.isoformat()
+        return report
+
+def resolve_policy(metric_name: str) -> Dict[str, Optional[float]]:
+    """Retention in seconds per tier for a metric, None meaning keep forever."""
+    policy = dict(config.retention.default_policy)
+    policy.update(config.retention.policies.get(metric_name, {}))
+    return policy
+
+def _cutoff_groups(policies: Dict[int, Dict], tier: str, now: datetime) -> Dict[datetime, List[int]]:
+    """Group metric ids by their cutoff for one tier; metrics kept forever are left out."""
+    groups: Dict[datetime, List[int]] = {}
+    for metric_info_id, policy in policies.items():
+        retention = policy.get(tier)
+        if retention is not None:
+            groups.setdefault(now - timedelta(seconds=retention), []).append(metric_info_id)
+    return groups
+
+def _delete_in_batches(table, criteria, order_column, downsample: bool = False) -> int:
+    """
+    Delete matching rows a batch per transaction, pausing between batches.
+
+    Each batch is selected in order_column order and deleted up to its last
+    key, so the write lock is only held for one small DELETE at a time.
+    With downsample the rows are folded into the rollup tiers first, in the
+    same transaction as their deletion.
+    """
+    batch_rows = config.retention.batch_rows
+    columns = [order_column]
+    if downsample:
+        columns += [table.c.device_id, table.c.metric_info_id, table.c.metric_value, table.c.timestamp]
+
+    removed = 0
+    while True:
+        batch = db.session.execute(
+            select(*columns).where(criteria).order_by(order_column).limit(batch_rows)
+        ).mappings().all()
+        if not batch:
+            break
+        if downsample:
+            write_rollups(batch)
+        result = db.session.execute(delete(table).where(criteria, order_column <= batch[-1][order_column.name]))
+        db.session.commit()
+        removed += result.rowcount
+        time.sleep(config.retention.batch_pause)
+    return removed
+
+def _coverage_tier(policy: Dict[str, Optional[float]]) -> Optional[str]:
+    """Finest tier kept at least as long as the raw values, or None when every tier expires first."""
+    for tier in TIERS:
+        if policy.get(tier) is None or policy[tier] >= policy[RAW]:
+            return tier
+    return None
+
+def _uncovered_metrics(metric_ids: List[int], tier: str, cutoff: datetime) -> List[int]:
+    """
+    Metrics with raw values before cutoff that the tier does not account for.
+
+    Each series' raw count from the bucket of its oldest value up to cutoff,
+    a bucket boundary, is compared with the counts of the tier's buckets over
+    the same range.
+    """
+    series: Dict[tuple, list] = {}
+    for table in partitions.tables_for_range(end_time=cutoff):
+        counts = db.session.execute(
+            select(table.c.device_id, table.c.metric_info_id, func.count(), func.min(table.c.timestamp))
+            .where(table.c.metric_info_id.in_(metric_ids), table.c.timestamp < cutoff)
+            .group_by(table.c.device_id, table.c.metric_info_id)
+        ).all()
+        for device_id, metric_info_id, rows, oldest in counts:
+            entry = series.setdefault((device_id, metric_info_id), [0, oldest])
+            entry[0] += rows
+            entry[1] = min(entry[1], oldest)
+
+    uncovered = set()
+    for (device_id, metric_info_id), (rows, oldest) in series.items():
+        if metric_info_id in uncovered:
+            continue
+        rolled_up = db.session.execute(
+            select(func.coalesce(func.sum(MetricRollup.value_count), 0)).where(
+                MetricRollup.tier == tier,
+                MetricRollup.device_id == device_id,
+                MetricRollup.metric_info_id == metric_info_id,
+                MetricRollup.bucket_start >= bucket_start(oldest, tier),
+                MetricRollup.bucket_start < cutoff
+            )
+        ).scalar()
+        if rolled_up < rows:
+            uncovered.add(metric_info_id)
+    db.session.commit()
+    return sorted(uncovered)
+
+def _covered_groups(policies: Dict[int, Dict], groups: Dict[datetime, List[int]],
+                    report: CompactionReport) -> Dict[datetime, List[int]]:
+    """
+    Narrow the raw cutoff groups to values the rollups already hold.
+
+    Ingest folds new values into the tiers, but an upgraded database only
+    has its older values in them once start_rebuild has finished, so every
+    range is checked before deletion. Cutoffs move back to a bucket
+    boundary of the tier checked.
+    """
+    covered: Dict[datetime, List[int]] = {}
+    for cutoff, metric_ids in groups.items():
+        by_tier: Dict[Optional[str], List[int]] = {}
+        for metric_info_id in metric_ids:
+            by_tier.setdefault(_coverage_tier(policies[metric_info_id]), []).append(metric_info_id)
+        for tier, ids in by_tier.items():
+            tier_cutoff = cutoff
+            if tier is not None:
+                tier_cutoff = bucket_start(cutoff, tier)
+                uncovered = _uncovered_metrics(ids, tier, tier_cutoff)
+                if uncovered:
+                    logger.warning(
+                        f"Keeping expired raw values of metrics {uncovered}: the {tier} rollups do not cover them yet"
+                    )
+                    report.raw_metrics_skipped.extend(uncovered)
+                    ids = [metric_info_id for metric_info_id in ids if metric_info_id not in uncovered]
+            if ids:
+                covered.setdefault(tier_cutoff, []).extend(ids)
+    return covered
+
+def _expire_raw(policies: Dict[int, Dict], now: datetime, report: CompactionReport):
+    # Without ingest rollups the rows are folded into the tiers as they are deleted
+    downsample = not config.ingest.rollups
+    groups = _cutoff_groups(policies, RAW, now)
+    if groups and not downsample:
+        groups = _covered_groups(policies, groups, report)
+    if not groups:
+        return
+
+    # Partitions that only hold expired rows of every metric are dropped whole
+    if sum(len(ids) for ids in groups.values()) == len(policies):
+        oldest_cutoff = min(groups)
+        for name, start, end, table in partitions.entries():
+            if end > oldest_cutoff:
+                continue
+            if downsample:
+                removed = _delete_in_batches(table, table.c.id > 0, table.c.id, downsample=True)
+                report.rows_downsampled += removed
+            else:
+                removed = db.session.execute(select(func.count()).select_from(table)).scalar()
+                db.session.commit()
+            report.raw_rows_removed += removed
+            if partitions.drop_partition(name):
+                report.partitions_dropped.append(name)
+
+    # Everything else is deleted per metric in small batches
+    latest_cutoff = max(groups)
+    for table in partitions.tables_for_range(end_time=latest_cutoff):
+        for cutoff, metric_ids in groups.items():
+            criteria = and_(table.c.metric_info_id.in_(metric_ids), table.c.timestamp < cutoff)
+            removed = _delete_in_batches(table, criteria, table.c.id, downsample)
+            report.raw_rows_removed += removed
+            if downsample:
+                report.rows_downsampled += removed
+
+def _archive_partitions(now: datetime, report: CompactionReport):
+    """Move sealed partitions to the columnar archive before raw retention sees them."""
+    cutoff = archive_cutoff(now)
+    if cutoff is not None:
+        for name, rows in archive.archive_partitions_before(cutoff).items():
+            report.partitions_archived.append(name)
+            report.rows_archived += rows
+    if config.archive.retention is not None:
+        report.archive_files_removed = archive.remove_before(now - timedelta(seconds=config.archive.retention))
+
+def _expire_rollups(policies: Dict[int, Dict], now: datetime, report: CompactionReport):
+    for tier in TIERS:
+        removed = 0
+        for cutoff, metric_ids in _cutoff_groups(policies, tier, now).items():
+            criteria = and_(
+                MetricRollup.tier == tier,
+                MetricRollup.metric_info_id.in_(metric_ids),
+                MetricRollup.bucket_start < cutoff
+            )
+            removed += _delete_in_batches(MetricRollup.__table__, criteria, MetricRollup.__table__.c.bucket_start)
+        report.rollup_rows_removed[tier] = removed
+
+def _reclaim_space(report: CompactionReport):
+    """Return free pages to the OS with incremental vacuum, a few pages per step."""
+    if db.engine.dialect.name != 'sqlite':
+        return
+
+    with db.engine.connect() as conn:
+        page_size = conn.exec_driver_sql("PRAGMA page_size").scalar()
+        page_count = conn.exec_driver_sql("PRAGMA page_count").scalar()
+        if conn.exec_driver_sql("PRAGMA auto_vacuum").scalar() != 2:
+            logger.warning(
+                "Database was not created with auto_vacuum=INCREMENTAL; freed pages are reused "
+                "but the file will not shrink until a full VACUUM"
+            )
+        else:
+            free_pages = conn.exec_driver_sql("PRAGMA freelist_count").scalar()
+            while free_pages:
+                # The pragma frees one page per step; executescript steps it to completion
+                conn.connection.driver_connection.executescript(
+                    f"PRAGMA incremental_vacuum({config.retention.vacuum_pages})"
+                )
+                remaining = conn.exec_driver_sql("PRAGMA freelist_count").scalar()
+                if remaining >= free_pages:
+                    break
+                free_pages = remaining
+                time.sleep(config.retention.batch_pause)
+        report.bytes_reclaimed = (page_count - conn.exec_driver_sql("PRAGMA page_count").scalar()) * page_size
+        report.free_bytes = conn.exec_driver_sql("PRAGMA freelist_count").scalar() * page_size
+
+def compact(now: datetime = None) -> CompactionReport:
+    """
+    Apply the retention policies once. Needs an app context.
+
+    Sealed partitions are moved to the columnar archive when it is enabled,
+    raw values past their retention are removed (whole partitions are
+    dropped when possible), rollup buckets past their tier's retention are
+    deleted, and the freed space is reclaimed.
+    """
+    now = now or datetime.utcnow()
+    report = CompactionReport(started_at=now)
+    started = time.perf_counter()
+
+    policies = {
+        metric_info_id: resolve_policy(name)
+        for metric_info_id, name in db.session.execute(select(MetricInfo.id, MetricInfo.name)).all()
+    }
+    db.session.commit()
+
+    try:
+        _archive_partitions(now, report)
+        _expire_raw(policies, now, report)
+        _expire_rollups(policies, now, report)
+    except Exception:
+        db.session.rollback()
+        raise
+    _reclaim_space(report)
+
+    report.elapsed = time.perf_counter() - started
+    logger.info(
+        f"Compaction removed {report.raw_rows_removed} raw rows "
+        f"({len(report.partitions_dropped)} partitions dropped, {report.rows_downsampled} downsampled), "
+        f"{sum(report.rollup_rows_removed.values())} rollup rows, archived {report.rows_archived} rows, reclaimed {report.bytes_reclaimed} bytes "
+        f"in {report.elapsed:.1f}s"
+    )
+    return report
@@ -0,0 +1,268 @@
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+from sqlalchemy import case, func, or_, select
+from .database import db
+from .models import MetricRollup
+from .partitions import partitions
+from src.utils.config import config
+from src.utils.logging_config import get_logger
+
+logger = get_logger('database.rollups')
+
+# Rollup tiers from finest to coarsest
+TIERS = {
+    '1m': timedelta(minutes=1),
+    '1h': timedelta(hours=1),
+    '1d': timedelta(days=1)
+}
+
+_TRUNCATE = {
+    '1m': lambda ts: ts.replace(second=0, microsecond=0),
+    '1h': lambda ts: ts.replace(minute=0, second=0, microsecond=0),
+    '1d': lambda ts: ts.replace(hour=0, minute=0, second=0, microsecond=0)
+}
+
+# Raw rows read per chunk when rebuilding rollups from metric values
+REBUILD_CHUNK_ROWS = 50000
+
+SeriesBucket = Tuple[str, int, datetime]  # (device_id, metric_info_id, bucket_start)
+Point = Tuple[str, int, float, datetime]  # (device_id, metric_info_id, metric_value, timestamp)
+
+def bucket_start(timestamp: datetime, tier: str) -> datetime:
+    """Start of the tier bucket holding a timestamp."""
+    if timestamp.tzinfo is not None:
+        # Stored timestamps carry no zone, see partitions._naive
+        timestamp = timestamp.replace(tzinfo=None)
+    return _TRUNCATE[tier](timestamp)
+
+def choose_tier(start_time: datetime, end_time: datetime, resolution: float = None) -> Optional[str]:
+    """
+    Pick the coarsest tier whose buckets are no wider than the requested resolution.
+
+    Args:
+        resolution: Seconds per point; defaults to the range split into
+            config.web.chart_points points
+
+    Returns:
+        str: Tier name, or None when raw values are needed
+    """
+    if not config.ingest.rollups:
+        return None
+    if resolution is None:
+        resolution = (end_time - start_time).total_seconds() / max(config.web.chart_points, 1)
+
+    chosen = None
+    for tier, width in TIERS.items():
+        if width.total_seconds() <= resolution:
+            chosen = tier
+    return chosen
+
+def _new_aggregate(timestamp: datetime, value: float) -> list:
+    # [count, sum, min, max, first_time, first_value, last_time, last_value]
+    return [1, value, value, value, timestamp, value, timestamp, value]
+
+def _merge(aggregate: list, other: list):
+    aggregate[0] += other[0]
+    aggregate[1] += other[1]
+    if other[2] < aggregate[2]:
+        aggregate[2] = other[2]
+    if other[3] > aggregate[3]:
+        aggregate[3] = other[3]
+    if other[4] < aggregate[4]:
+        aggregate[4], aggregate[5] = other[4], other[5]
+    if other[6] >= aggregate[6]:
+        aggregate[6], aggregate[7] = other[6], other[7]
+
+def aggregate_rows(rows: List[Dict]) -> Dict[str, Dict[SeriesBucket, list]]:
+    """Aggregate metric_values rows into every tier."""
+    return aggregate_points(
+        (row['device_id'], row['metric_info_id'], row['metric_value'], row['timestamp']) for row in rows
+    )
+
+def aggregate_points(points: Iterable[Point]) -> Dict[str, Dict[SeriesBucket, list]]:
+    """
+    Aggregate (device_id, metric_info_id, metric_value, timestamp) points into every tier.
+
+    Points are folded into minute buckets once; hour and day buckets are built
+    from the minute aggregates, so the per-row work does not grow with the
+    number of tiers.
+    """
+    minutes: Dict[SeriesBucket, list] = {}
+    truncate = _TRUNCATE['1m']
+    for device_id, metric_info_id, value, timestamp in points:
+        if timestamp.tzinfo is not None:
+            timestamp = timestamp.replace(tzinfo=None)
+        key = (device_id, metric_info_id, truncate(timestamp))
+        aggregate = minutes.get(key)
+        if aggregate is None:
+            minutes[key] = _new_aggregate(timestamp, value)
+        else:
+            aggregate[0] += 1
+            aggregate[1] += value
+            if value < aggregate[2]:
+                aggregate[2] = value
+            if value > aggregate[3]:
+                aggregate[3] = value
+            if timestamp < aggregate[4]:
+                aggregate[4], aggregate[5] = timestamp, value
+            if timestamp >= aggregate[6]:
+                aggregate[6], aggregate[7] = timestamp, value
+
+    tiers = {'1m': minutes}
+    finer = minutes
+    for tier in ('1h', '1d'):
+        coarser: Dict[SeriesBucket, list] = {}
+        for (device_id, metric_info_id, start), aggregate in finer.items():
+            key = (device_id, metric_info_id, _TRUNCATE[tier](start))
+            existing = coarser.get(key)
+            if existing is None:
+                coarser[key] = list(aggregate)
+            else:
+                _merge(existing, aggregate)
+        tiers[tier] = coarser
+        finer = coarser
+    return tiers
+
+def _merge_statement():
+    """INSERT ... ON CONFLICT DO UPDATE that folds new aggregates into existing buckets."""
+    table = MetricRollup.__table__
+    if db.engine.dialect.name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+        least, greatest = func.least, func.greatest
+    else:
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+        # SQLite's multi-argument min()/max() are scalar functions
+        least, greatest = func.min, func.max
+
+    stmt = dialect_insert(table)
+    excluded = stmt.excluded
+    return stmt.on_conflict_do_update(
+        index_elements=[table.c.tier, table.c.device_id, table.c.metric_info_id, table.c.bucket_start],
+        set_={
+            'value_count': table.c.value_count + excluded.value_count,
+            'value_sum': table.c.value_sum + excluded.value_sum,
+            'value_min': least(table.c.value_min, excluded.value_min),
+            'value_max': greatest(table.c.value_max, excluded.value_max),
+            'first_value': case((excluded.first_time < table.c.first_time, excluded.first_value), else_=table.c.first_value),
+            'first_time': least(table.c.first_time, excluded.first_time),
+            'last_value': case((excluded.last_time >= table.c.last_time, excluded.last_value), else_=table.c.last_value),
+            'last_time': greatest(table.c.last_time, excluded.last_time)
+        }
+    )
+
+def update_rollups(rows: List[Dict]) -> int:
+    """
+    Fold freshly inserted metric_values rows into the rollup tiers.
+
+    Runs in the caller's transaction so rollups commit together with the raw rows.
+
+    Returns:
+        int: Number of bucket rows written
+    """
+    if not config.ingest.rollups:
+        return 0
+    return write_rollups(rows)
+
+def update_rollup_points(points: Iterable[Point]) -> int:
+    """update_rollups for (device_id, metric_info_id, metric_value, timestamp) points instead of row dicts."""
+    if not config.ingest.rollups:
+        return 0
+    return _write_aggregates(aggregate_points(points))
+
+def write_rollups(rows: List[Dict]) -> int:
+    """Merge the aggregates of metric_values rows into the rollup tiers, whether or not ingest maintains them."""
+    if not rows:
+        return 0
+    return _write_aggregates(aggregate_rows(rows))
+
+def _write_aggregates(tiers: Dict[str, Dict[SeriesBucket, list]]) -> int:
+    params = [
+        {
+            'tier': tier,
+            'device_id': device_id,
+            'metric_info_id': metric_info_id,
+            'bucket_start': start,
+            'value_count': aggregate[0],
+            'value_sum': aggregate[1],
+            'value_min': aggregate[2],
+            'value_max': aggregate[3],
+            'first_time': aggregate[4],
+            'first_value': aggregate[5],
+            'last_time': aggregate[6],
+            'last_value': aggregate[7]
+        }
+        for tier, buckets in tiers.items()
+        for (device_id, metric_info_id, start), aggregate in buckets.items()
+    ]
+    if params:
+        db.session.execute(_merge_statement(), params)
+    return len(params)
+
+# Backfill
+
+def needs_rebuild() -> bool:
+    """Whether raw values exist but the rollup tiers are still empty."""
+    if not config.ingest.rollups:
+        return False
+    if db.session.execute(select(MetricRollup.tier).limit(1)).first() is not None:
+        return False
+    return any(
+        db.session.execute(select(table.c.id).limit(1)).first() is not None
+        for table in partitions.tables_for_range()
+    )
+
+def rebuild_rollups(created_before: datetime = None) -> int:
+    """
+    Build the rollup tiers from raw values already in the database.
+
+    Only rows created before created_before are read, so values ingested
+    while the rebuild runs, which update the tiers themselves, are not
+    counted twice.
+
+    Returns:
+        int: Number of raw values folded in
+    """
+    created_before = created_before or datetime.utcnow()
+    started = time.perf_counter()
+    total = 0
+    for table in partitions.tables_for_range():
+        query = select(
+            table.c.device_id, table.c.metric_info_id, table.c.metric_value, table.c.timestamp
+        ).where(or_(table.c.created_at < created_before, table.c.created_at.is_(None)))\
+         .order_by(table.c.id)
+
+        last_id = 0
+        while True:
+            chunk = db.session.execute(
+                query.where(table.c.id > last_id).add_columns(table.c.id).limit(REBUILD_CHUNK_ROWS)
+            ).mappings().all()
+            if not chunk:
+                break
+            update_rollups(chunk)
+            db.session.commit()
+            last_id = chunk[-1]['id']
+            total += len(chunk)
+    logger.info(f"Rebuilt rollups from {total} metric values in {time.perf_counter() - started:.1f}s")
+    return total
+
+def start_rebuild(app) -> Optional[threading.Thread]:
+    """Rebuild empty rollup tiers from existing values in a background thread."""
+    with app.app_context():
+        if not needs_rebuild():
+            return None
+    created_before = datetime.utcnow()
+
+    def run():
+        with app.app_context():
+            try:
+                rebuild_rollups(created_before)
+            except Exception as e:
+                db.session.rollback()
+                logger.error(f"Rollup rebuild failed: {str(e)}", exc_info=True)
+
+    logger.info("Rollup tiers are empty, rebuilding them from existing metric values")
+    thread = threading.Thread(target=run, name='rollup-rebuild', daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,144 @@
+import struct
+import sys
+from array import array
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List
+
+# Content-Type used to negotiate the columnar batch format
+COLUMNAR_CONTENT_TYPE = 'application/x-metrics-columnar'
+
+MAGIC = b'MCOL'
+VERSION = 1
+
+_HEADER = struct.Struct('<4sBI')  # magic, version, string count
+_COUNT = struct.Struct('<I')
+_STRING_LENGTH = struct.Struct('<H')
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_NAIVE_EPOCH = datetime(1970, 1, 1)
+
+class ColumnarFormatError(ValueError):
+    """Raised when a columnar payload cannot be decoded."""
+
+@dataclass
+class ColumnarBatch:
+    """
+    A metrics batch stored column-wise.
+
+    Device names, device ids and metric names live once in a shared string
+    table; the per-row columns only hold indices into it. A device id index
+    of -1 means the row carried no device id.
+    """
+    strings: List[str]
+    device_names: array  # 'I' indices into strings
+    device_ids: array  # 'i' indices into strings, -1 for none
+    metric_names: array  # 'I' indices into strings
+    timestamps: array  # 'q' microseconds since the Unix epoch (UTC)
+    values: array  # 'd' float64 values
+
+    def __len__(self):
+        return len(self.values)
+
+def _little_endian(column: array) -> array:
+    if sys.byteorder == 'big':
+        column = array(column.typecode, column)
+        column.byteswap()
+    return column
+
+def to_epoch_micros(timestamp) -> int:
+    """Convert an ISO string or datetime to microseconds since the Unix epoch."""
+    if isinstance(timestamp, str):
+        timestamp = datetime.fromisoformat(timestamp.replace('Z', '+00:00'))
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=timezone.utc)
+    delta = timestamp - _EPOCH
+    return (delta.days * 86400 + delta.seconds) * 1000000 + delta.microseconds
+
+def encode_batch(metrics: List[Dict]) -> bytes:
+    """
+    Encode metric dicts (device_name, metric_name, metric_value, timestamp and
+    optional device_id) into the columnar wire format.
+    """
+    string_index: Dict[str, int] = {}
+
+    def intern(value: str) -> int:
+        index = string_index.get(value)
+        if index is None:
+            index = string_index[value] = len(string_index)
+        return index
+
+    device_names = array('I')
+    device_ids = array('i')
+    metric_names = array('I')
+    timestamps = array('q')
+    values = array('d')
+
+    for metric in metrics:
+        device_names.append(intern(metric['device_name']))
+        device_id = metric.get('device_id')
+        device_ids.append(intern(device_id) if device_id else -1)
+        metric_names.append(intern(metric['metric_name']))
+        timestamps.append(to_epoch_micros(metric['timestamp']))
+        values.append(float(metric['metric_value']))
+
+    parts = [_HEADER.pack(MAGIC, VERSION, len(string_index))]
+    for value in string_index:
+        encoded = value.encode('utf-8')
+        parts.append(_STRING_LENGTH.pack(len(encoded)))
+        parts.append(encoded)
+    parts.append(_COUNT.pack(len(values)))
+    for column in (device_names, device_ids, metric_names, timestamps, values):
+        parts.append(_little_endian(column).tobytes())
+    return b''.join(parts)
+
+def decode_batch(payload: bytes) -> ColumnarBatch:
+    """Decode a columnar payload without materialising per-row objects."""
+    view = memoryview(payload)
+    try:
+        magic, version, string_count = _HEADER.unpack_from(view, 0)
+        if magic != MAGIC:
+            raise ColumnarFormatError('Not a columnar metrics payload')
+        if version != VERSION:
+            raise ColumnarFormatError(f'Unsupported columnar format version {version}')
+        offset = _HEADER.size
+
+        strings = []
+        for _ in range(string_count):
+            (length,) = _STRING_LENGTH.unpack_from(view, offset)
+            offset += _STRING_LENGTH.size
+            strings.append(bytes(view[offset:offset + length]).decode('utf-8'))
+            offset += length
+
+        (row_count,) = _COUNT.unpack_from(view, offset)
+        offset += _COUNT.size
+
+        columns = []
+        for typecode in ('I', 'i', 'I', 'q', 'd'):
+            column = array(typecode)
+            size = column.itemsize * row_count
+            if offset + size > len(view):
+                raise ColumnarFormatError('Columnar payload is truncated')
+            column.frombytes(view[offset:offset + size])
+            if sys.byteorder == 'big':
+                column.byteswap()
+            columns.append(column)
+            offset += size
+    except (struct.error, UnicodeDecodeError) as e:
+        raise ColumnarFormatError(f'Malformed columnar payload: {e}') from e
+
+    batch = ColumnarBatch(strings, *columns)
+    _check_indices(batch)
+    return batch
+
+def _check_indices(batch: ColumnarBatch):
+    limit = len(batch.strings)
+    for column in (batch.device_names, batch.metric_names):
+        if column and max(column) >= limit:
+            raise ColumnarFormatError('String index out of range')
+    if batch.device_ids and (max(batch.device_ids) >= limit or min(batch.device_ids) < -1):
+        raise ColumnarFormatError('Device id index out of range')
+
+def from_epoch_micros(micros: int) -> datetime:
+    """Convert microseconds since the Unix epoch to a naive UTC datetime."""
+    return _NAIVE_EPOCH + timedelta(microseconds=micros)
@@ -0,0 +1,100 @@
+import gzip
+import time
+import zlib
+from typing import Iterable, Iterator, Tuple
+
+class DecompressionError(ValueError):
+    """Raised when a request body cannot be decompressed."""
+
+class DecompressedSizeExceeded(DecompressionError):
+    """Raised when a compressed body expands beyond the allowed size."""
+
+_CHUNK_SIZE = 64 * 1024
+
+def compress_body(payload: bytes, level: int = 6) -> Tuple[bytes, float]:
+    """
+    Gzip-compress a request body.
+
+    Returns:
+        tuple: (compressed bytes, CPU seconds spent compressing)
+    """
+    started = time.thread_time()
+    compressed = gzip.compress(payload, compresslevel=level)
+    return compressed, time.thread_time() - started
+
+def decompress_body(payload: bytes, encoding: str, max_size: int) -> Tuple[bytes, float]:
+    """
+    Decode a request body sent with the given Content-Encoding.
+
+    Decompression is bounded: output is produced in chunks and aborted as soon
+    as it would exceed max_size, so a small gzip bomb cannot exhaust memory.
+
+    Returns:
+        tuple: (decoded bytes, CPU seconds spent decompressing)
+    """
+    encoding = (encoding or 'identity').strip().lower()
+    if encoding == 'identity':
+        return payload, 0.0
+    if encoding not in ('gzip', 'x-gzip', 'deflate'):
+        raise DecompressionError(f'Unsupported Content-Encoding: {encoding}')
+
+    started = time.thread_time()
+    # 16 + MAX_WBITS expects a gzip header, MAX_WBITS a zlib one
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS if 'gzip' in encoding else zlib.MAX_WBITS)
+    parts = []
+    size = 0
+    data = payload
+    try:
+        while data:
+            chunk = decompressor.decompress(data, _CHUNK_SIZE)
+            size += len(chunk)
+            if size > max_size:
+                raise DecompressedSizeExceeded(f'Decompressed body exceeds {max_size} bytes')
+            parts.append(chunk)
+            data = decompressor.unconsumed_tail
+        tail = decompressor.flush()
+        size += len(tail)
+        if size > max_size:
+            raise DecompressedSizeExceeded(f'Decompressed body exceeds {max_size} bytes')
+        parts.append(tail)
+    except zlib.error as e:
+        raise DecompressionError(f'Invalid {encoding} body: {e}') from e
+    return b''.join(parts), time.thread_time() - started
+
+def iter_compress(chunks: Iterable[bytes], level: int = 6) -> Iterator[bytes]:
+    """Gzip-compress a stream of byte chunks incrementally."""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+def iter_decompress(chunks: Iterable[bytes], encoding: str) -> Iterator[bytes]:
+    """
+    Decode a stream of byte chunks sent with the given Content-Encoding.
+
+    Output is produced in bounded pieces so memory stays flat however large the
+    decoded stream grows.
+    """
+    encoding = (encoding or 'identity').strip().lower()
+    if encoding == 'identity':
+        yield from chunks
+        return
+    if encoding not in ('gzip', 'x-gzip', 'deflate'):
+        raise DecompressionError(f'Unsupported Content-Encoding: {encoding}')
+
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS if 'gzip' in encoding else zlib.MAX_WBITS)
+    try:
+        for chunk in chunks:
+            data = chunk
+            while data:
+                decoded = decompressor.decompress(data, _CHUNK_SIZE)
+                if decoded:
+                    yield decoded
+                data = decompressor.unconsumed_tail
+        tail = decompressor.flush()
+        if tail:
+            yield tail
+    except zlib.error as e:
+        raise DecompressionError(f'Invalid {encoding} body: {e}') from e
@@ -1,6 +1,6 @@
 import os
 from dataclasses import dataclass
-from typing import Optional
+from typing import Dict, Optional
 
 @dataclass
 class DatabaseConfig:
@@ -32,7 +32,99 @@ class WebConfig:
     port: int
     debug: bool
     secret_key: str
-    sse_interval: int  # in seconds
+    sse_interval: int  # in seconds, keepalive interval of idle SSE streams
+    workers: int = 1  # web worker processes serving the app on this host
+    chart_points: int = 1000  # target points per chart series, used to pick a rollup tier
+    series_cache_points: int = 20000  # recent points kept in memory per series, 0 disables the cache
+    series_cache_window: int = 86400  # in seconds, recent data loaded into the cache at startup
+    downsampling: str = 'lttb'  # chart point selection above max_points ("lttb" or "minmax")
+    count_cache_ttl: int = 60  # in seconds, how long exact table totals are reused
+    result_cache_ttl: int = 10  # in seconds, how long computed dashboard and reporting results are shared, 0 disables
+    result_cache_bytes: int = 32 * 1024 * 1024  # memory bound of the result cache
+    sse_queue_size: int = 256  # events queued per SSE client before a slow client is disconnected
+    sse_replay_events: int = 1000  # recent events per SSE topic replayed to clients resuming with Last-Event-ID
+    command_log_size: int = 1000  # commands kept for collectors, oldest dropped first
+    command_log_retention: Optional[float] = 7 * 86400  # in seconds, None keeps commands until they are pushed out
+    sse_server: str = 'threads'  # "threads" serves SSE from the web server's threads, "asyncio" from one event loop
+    sse_port: int = 8001  # port of the asyncio SSE server
+    sse_public_url: Optional[str] = None  # base URL clients reach the asyncio SSE server at, by default the web host on sse_port
+    sse_workers: int = 8  # threads for the database reads of dashboard streams in asyncio mode
+    live_state: bool = False  # share latest values, control status and commands between the host's web workers
+    live_state_path: Optional[str] = None  # SQLite file of the shared live state, by default next to the metrics database
+    live_state_interval: float = 0.05  # in seconds, how often workers write their values and apply the others'
+
+@dataclass
+class StorageConfig:
+    profile: str  # named SQLite pragma preset ("durable" or "throughput")
+    # Per-setting overrides of the preset; None keeps the preset value
+    journal_mode: Optional[str] = None
+    synchronous: Optional[str] = None
+    cache_size: Optional[int] = None  # pages, or KiB when negative
+    mmap_size: Optional[int] = None  # in bytes
+    temp_store: Optional[str] = None
+    busy_timeout: Optional[int] = None  # in milliseconds
+    wal_autocheckpoint: Optional[int] = None  # in pages
+    partition_interval: str = 'day'  # metric_values partition size ("day", "week" or "none")
+
+@dataclass
+class IngestConfig:
+    catalog_cache_size: int  # max cached device/metric name resolutions
+    write_behind: bool  # acknowledge uploads with 202 and commit them from a writer thread
+    buffer_max_rows: int  # rows held in the write-behind buffer before falling back to sync commits
+    group_commit_rows: int  # commit as soon as this many rows are buffered
+    group_commit_interval: float  # in seconds, max age of a buffered batch before it is committed
+    max_decompressed_size: int  # in bytes, upper bound for Content-Encoding: gzip request bodies
+    stream_chunk_rows: int  # rows parsed and inserted per chunk on the NDJSON stream endpoint
+    dedup_index_size: int  # collectors / batch ids remembered for idempotent batch retries
+    rollups: bool = True  # maintain 1m/1h/1d rollup tiers on ingest
+
+@dataclass
+class RetentionConfig:
+    enabled: bool  # run the background compaction job
+    # Retention per tier ("raw", "1m", "1h", "1d") in seconds; None keeps data forever
+    default_policy: Dict[str, Optional[float]]
+    policies: Dict[str, Dict[str, Optional[float]]]  # metric name -> per-tier overrides
+    compaction_interval: int  # in seconds, between compaction runs
+    batch_rows: int  # rows deleted per transaction
+    batch_pause: float  # in seconds, pause between delete batches so ingest can take the write lock
+    vacuum_pages: int  # free pages released per incremental vacuum step
+
+@dataclass
+class ArchiveConfig:
+    enabled: bool  # export sealed partitions to the columnar archive during compaction
+    directory: str  # root of the per-series chunk files
+    archive_after: Optional[float]  # in seconds, age of a partition's end before it is archived
+    retention: Optional[float]  # in seconds, how long archived chunks are kept; None keeps them forever
+
+_DURATION_UNITS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400, 'w': 604800}
+
+def _parse_duration(value: str) -> Optional[float]:
+    """Parse "30d", "12h", "90m" or plain days; "forever", "0" or empty keep data forever."""
+    value = (value or '').strip().lower()
+    if value in ('', '0', 'forever', 'none'):
+        return None
+    if value[-1] in _DURATION_UNITS:
+        return float(value[:-1]) * _DURATION_UNITS[value[-1]]
+    return float(value) * _DURATION_UNITS['d']
+
+def _parse_retention_policies(value: str) -> Dict[str, Dict[str, Optional[float]]]:
+    """Parse "cpu_usage:raw=7d,1h=365d;memory_usage:raw=14d" into per-metric tier retentions."""
+    policies = {}
+    for entry in (value or '').split(';'):
+        if not entry.strip():
+            continue
+        metric_name, _, tiers = entry.partition(':')
+        policy = policies.setdefault(metric_name.strip(), {})
+        for tier in tiers.split(','):
+            if not tier.strip():
+                continue
+            name, _, duration = tier.partition('=')
+            policy[name.strip().lower()] = _parse_duration(duration)
+    return policies
+
+def _optional_int(name: str) -> Optional[int]:
+    value = os.getenv(name)
+    return int(value) if value not in (None, '') else None
 
 class Config:
     def __init__(self):
@@ -69,7 +161,78 @@ class Config:
             port=int(os.getenv('APP_PORT', '8000')),
             debug=os.getenv('DEBUG', 'False').lower() == 'true',
             secret_key=os.getenv('SECRET_KEY', 'your-secret-key-here'),
-            sse_interval=int(os.getenv('SSE_INTERVAL', '5'))
+            sse_interval=int(os.getenv('SSE_INTERVAL', '5')),
+            workers=int(os.getenv('WEB_WORKERS', '1')),
+            chart_points=int(os.getenv('CHART_POINTS', '1000')),
+            series_cache_points=int(os.getenv('SERIES_CACHE_POINTS', '20000')),
+            series_cache_window=int(os.getenv('SERIES_CACHE_WINDOW', '86400')),
+            downsampling=os.getenv('DOWNSAMPLING', 'lttb').lower(),
+            count_cache_ttl=int(os.getenv('COUNT_CACHE_TTL', '60')),
+            result_cache_ttl=int(os.getenv('RESULT_CACHE_TTL', '10')),
+            result_cache_bytes=int(os.getenv('RESULT_CACHE_MAX_BYTES', '33554432')),  # 32MB
+            sse_queue_size=int(os.getenv('SSE_QUEUE_SIZE', '256')),
+            sse_replay_events=int(os.getenv('SSE_REPLAY_EVENTS', '1000')),
+            command_log_size=int(os.getenv('COMMAND_LOG_SIZE', '1000')),
+            command_log_retention=_parse_duration(os.getenv('COMMAND_LOG_RETENTION', '7d')),
+            sse_server=os.getenv('SSE_SERVER', 'threads').lower(),
+            sse_port=int(os.getenv('SSE_PORT', '8001')),
+            sse_public_url=os.getenv('SSE_PUBLIC_URL') or None,
+            sse_workers=int(os.getenv('SSE_WORKERS', '8')),
+            live_state=os.getenv('LIVE_STATE', 'False').lower() == 'true',
+            live_state_path=os.getenv('LIVE_STATE_PATH') or None,
+            live_state_interval=float(os.getenv('LIVE_STATE_INTERVAL', '0.05'))
+        )
+
+        # SQLite storage configuration
+        self.storage = StorageConfig(
+            profile=os.getenv('SQLITE_PROFILE', 'throughput').lower(),
+            journal_mode=os.getenv('SQLITE_JOURNAL_MODE'),
+            synchronous=os.getenv('SQLITE_SYNCHRONOUS'),
+            cache_size=_optional_int('SQLITE_CACHE_SIZE'),
+            mmap_size=_optional_int('SQLITE_MMAP_SIZE'),
+            temp_store=os.getenv('SQLITE_TEMP_STORE'),
+            busy_timeout=_optional_int('SQLITE_BUSY_TIMEOUT'),
+            wal_autocheckpoint=_optional_int('SQLITE_WAL_AUTOCHECKPOINT'),
+            partition_interval=os.getenv('PARTITION_INTERVAL', 'day').lower()
+        )
+
+        # Ingest configuration
+        self.ingest = IngestConfig(
+            catalog_cache_size=int(os.getenv('CATALOG_CACHE_SIZE', '10000')),
+            write_behind=os.getenv('WRITE_BEHIND', 'False').lower() == 'true',
+            buffer_max_rows=int(os.getenv('WRITE_BEHIND_MAX_ROWS', '50000')),
+            group_commit_rows=int(os.getenv('GROUP_COMMIT_ROWS', '5000')),
+            group_commit_interval=float(os.getenv('GROUP_COMMIT_INTERVAL', '0.5')),
+            max_decompressed_size=int(os.getenv('MAX_DECOMPRESSED_SIZE', '67108864')),  # 64MB
+            stream_chunk_rows=int(os.getenv('STREAM_CHUNK_ROWS', '1000')),
+            dedup_index_size=int(os.getenv('DEDUP_INDEX_SIZE', '10000')),
+            rollups=os.getenv('ROLLUPS', 'True').lower() == 'true'
+        )
+
+        # Retention and compaction configuration
+        self.retention = RetentionConfig(
+            enabled=os.getenv('COMPACTION', 'True').lower() == 'true',
+            default_policy={
+                'raw': _parse_duration(os.getenv('RETENTION_RAW', 'forever')),
+                '1m': _parse_duration(os.getenv('RETENTION_1M', '30d')),
+                '1h': _parse_duration(os.getenv('RETENTION_1H', '365d')),
+                '1d': _parse_duration(os.getenv('RETENTION_1D', 'forever'))
+            },
+            policies=_parse_retention_policies(os.getenv('RETENTION_POLICIES', '')),
+            compaction_interval=int(os.getenv('COMPACTION_INTERVAL', '3600')),
+            batch_rows=int(os.getenv('COMPACTION_BATCH_ROWS', '5000')),
+            batch_pause=float(os.getenv('COMPACTION_BATCH_PAUSE', '0.05')),
+            vacuum_pages=int(os.getenv('INCREMENTAL_VACUUM_PAGES', '1000'))
+        )
+
+        # Columnar archive configuration
+        self.archive = ArchiveConfig(
+            enabled=os.getenv('ARCHIVE', 'False').lower() == 'true',
+            directory=os.getenv('ARCHIVE_DIR') or os.path.abspath(
+                os.path.join(os.path.dirname(__file__), '../../instance/archive')
+            ),
+            archive_after=_parse_duration(os.getenv('ARCHIVE_AFTER', '7d')),
+            retention=_parse_duration(os.getenv('ARCHIVE_RETENTION', 'forever'))
         )
 
     def get_database_url(self) -> str:
@@ -112,7 +275,75 @@ class Config:
             'port': self.web.port,
             'debug': self.web.debug,
             'secret_key': self.web.secret_key,
-            'sse_interval': self.web.sse_interval
+            'sse_interval': self.web.sse_interval,
+            'workers': self.web.workers,
+            'chart_points': self.web.chart_points,
+            'series_cache_points': self.web.series_cache_points,
+            'series_cache_window': self.web.series_cache_window,
+            'downsampling': self.web.downsampling,
+            'count_cache_ttl': self.web.count_cache_ttl,
+            'result_cache_ttl': self.web.result_cache_ttl,
+            'result_cache_bytes': self.web.result_cache_bytes,
+            'sse_queue_size': self.web.sse_queue_size,
+            'sse_replay_events': self.web.sse_replay_events,
+            'command_log_size': self.web.command_log_size,
+            'command_log_retention': self.web.command_log_retention,
+            'sse_server': self.web.sse_server,
+            'sse_port': self.web.sse_port,
+            'sse_public_url': self.web.sse_public_url,
+            'sse_workers': self.web.sse_workers,
+            'live_state': self.web.live_state,
+            'live_state_path': self.web.live_state_path,
+            'live_state_interval': self.web.live_state_interval
+        }
+
+    def get_storage_config(self) -> dict:
+        """Get SQLite storage configuration dictionary."""
+        return {
+            'profile': self.storage.profile,
+            'journal_mode': self.storage.journal_mode,
+            'synchronous': self.storage.synchronous,
+            'cache_size': self.storage.cache_size,
+            'mmap_size': self.storage.mmap_size,
+            'temp_store': self.storage.temp_store,
+            'busy_timeout': self.storage.busy_timeout,
+            'wal_autocheckpoint': self.storage.wal_autocheckpoint,
+            'partition_interval': self.storage.partition_interval
+        }
+
+    def get_ingest_config(self) -> dict:
+        """Get ingest configuration dictionary."""
+        return {
+            'catalog_cache_size': self.ingest.catalog_cache_size,
+            'write_behind': self.ingest.write_behind,
+            'buffer_max_rows': self.ingest.buffer_max_rows,
+            'group_commit_rows': self.ingest.group_commit_rows,
+            'group_commit_interval': self.ingest.group_commit_interval,
+            'max_decompressed_size': self.ingest.max_decompressed_size,
+            'stream_chunk_rows': self.ingest.stream_chunk_rows,
+            'dedup_index_size': self.ingest.dedup_index_size,
+            'rollups': self.ingest.rollups
+        }
+
+    def get_retention_config(self) -> dict:
+        """Get retention and compaction configuration dictionary."""
+        return {
+            'enabled': self.retention.enabled,
+            'default_policy': self.retention.default_policy,
+            'policies': self.retention.policies,
+            'compaction_interval': self.retention.compaction_interval,
+            'batch_rows': self.retention.batch_rows,
+            'batch_pause': self.retention.batch_pause,
+            'vacuum_pages': self.retention.vacuum_pages
+        }
+
+    def get_archive_config(self) -> dict:
+        """Get columnar archive configuration dictionary."""
+        return {
+            'enabled': self.archive.enabled,
+            'directory': self.archive.directory,
+            'archive_after': self.archive.archive_after,
+            'retention': self.archive.retention
         }
 
 # Create a global config instance
@@ -0,0 +1,95 @@
+from typing import Optional, Tuple
+import numpy as np
+
+# Point selection methods for chart series
+METHODS = ('lttb', 'minmax')
+
+def _as_float(x: np.ndarray) -> np.ndarray:
+    """X coordinates as float64 relative to the first point, so datetime64 keeps its precision."""
+    if np.issubdtype(x.dtype, np.datetime64):
+        x = x.astype('datetime64[us]').astype(np.int64)
+    x = np.asarray(x, dtype=np.float64)
+    return x - x[0] if len(x) else x
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, threshold: int) -> np.ndarray:
+    """
+    Indices of the points kept by Largest-Triangle-Three-Buckets.
+
+    The first and last points are always kept. The points in between are
+    split into threshold - 2 buckets, and each bucket keeps the point that
+    forms the largest triangle with the previously kept point and the
+    average of the next bucket. This preserves the visual shape of the
+    series.
+    """
+    n = len(y)
+    if threshold >= n or n <= 2:
+        return np.arange(n)
+    if threshold < 3:
+        return np.array([0, n - 1][:max(threshold, 1)])
+
+    x = _as_float(x)
+    y = np.asarray(y, dtype=np.float64)
+    # Bucket i holds points [bounds[i], bounds[i + 1]); the last bound is the final point
+    bounds = (np.arange(threshold - 1) * ((n - 2) / (threshold - 2))).astype(np.int64) + 1
+    bounds[-1] = n - 1
+
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    previous = 0
+    for bucket in range(threshold - 2):
+        start, end = bounds[bucket], bounds[bucket + 1]
+        next_end = bounds[bucket + 2] if bucket + 2 < len(bounds) else n
+        avg_x = x[end:next_end].mean()
+        avg_y = y[end:next_end].mean()
+        areas = np.abs(
+            (x[previous] - avg_x) * (y[start:end] - y[previous])
+            - (x[previous] - x[start:end]) * (avg_y - y[previous])
+        )
+        previous = start + int(np.argmax(areas))
+        selected[bucket + 1] = previous
+    return selected
+
+def minmax_indices(y: np.ndarray, threshold: int) -> np.ndarray:
+    """
+    Indices of the minimum and maximum of each bucket, in order.
+
+    The series is split into equal buckets, two points each, so spikes are
+    never dropped, whatever their width. The first and last points are
+    always kept.
+    """
+    n = len(y)
+    buckets = (threshold - 2) // 2
+    if threshold >= n or buckets < 1:
+        return np.arange(n) if threshold >= n else np.array([0, n - 1][:max(threshold, 1)])
+
+    size = -(-n // buckets)
+    padded = np.full(buckets * size, np.nan)
+    padded[:n] = y
+    padded = padded.reshape(buckets, size)
+    valid = ~np.isnan(padded).all(axis=1)
+    offsets = np.arange(buckets)[valid] * size
+    lows = offsets + np.nanargmin(padded[valid], axis=1)
+    highs = offsets + np.nanargmax(padded[valid], axis=1)
+    return np.unique(np.concatenate(([0, n - 1], lows, highs)))
+
+def downsample(timestamps: np.ndarray, values: np.ndarray, max_points: Optional[int],
+               method: str = 'lttb') -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Reduce a series sorted by time to at most max_points points.
+
+    Args:
+        max_points: Point budget, usually the chart width; None or 0 keeps every point
+        method: "lttb" for shape-preserving selection, "minmax" for a min/max envelope
+
+    Returns:
+        tuple: (timestamps, values) of the kept points
+    """
+    if not max_points or len(values) <= max_points:
+        return timestamps, values
+    if method == 'minmax':
+        indices = minmax_indices(values, max_points)
+    elif method == 'lttb':
+        indices = lttb_indices(timestamps, values, max_points)
+    else:
+        raise ValueError(f"Unknown downsampling method '{method}'. Choose one of: {', '.join(METHODS)}")
+    return timestamps[indices], values[indices]
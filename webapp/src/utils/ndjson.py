@@ -0,0 +1,29 @@
+from typing import Iterable, Iterator
+
+class LineTooLong(ValueError):
+    """Raised when a single NDJSON record exceeds the allowed size."""
+
+def iter_lines(chunks: Iterable[bytes], max_line_size: int) -> Iterator[bytes]:
+    """
+    Split a stream of byte chunks into newline-delimited records.
+
+    Only the unfinished tail of the stream is buffered, so memory is bounded by
+    the chunk size plus max_line_size regardless of the total stream length.
+    """
+    buffer = b''
+    for chunk in chunks:
+        if not chunk:
+            continue
+        buffer += chunk
+        start = 0
+        while True:
+            end = buffer.find(b'\n', start)
+            if end < 0:
+                break
+            yield buffer[start:end]
+            start = end + 1
+        buffer = buffer[start:]
+        if len(buffer) > max_line_size:
+            raise LineTooLong(f'NDJSON record exceeds {max_line_size} bytes')
+    if buffer:
+        yield buffer
@@ -1,6 +1,6 @@
 import os
 from flask import Flask
-from ..database.database import db
+from ..database.database import db, configure_storage
 from ..utils.logging_config import setup_logger
 from .routes.views import views_bp
 from .routes.metrics import metrics_bp
@@ -36,6 +36,7 @@ def create_app(test_config=None):
 
     # Initialize the database
     db.init_app(app)
+    configure_storage(app)
     with app.app_context():
         db.create_all()
 
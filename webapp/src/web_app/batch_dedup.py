@@ -0,0 +1,136 @@
+import threading
+from bisect import bisect_right
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional
+from ..utils.config import config
+from ..utils.logging_config import get_logger
+
+logger = get_logger('web_app.batch_dedup')
+
+# Outcomes of BatchDedupIndex.claim()
+NEW = 'new'
+DUPLICATE = 'duplicate'
+IN_FLIGHT = 'in_flight'
+
+@dataclass(frozen=True)
+class BatchKey:
+    """Identity a collector attaches to an upload so retries can be recognised."""
+    batch_id: str
+    collector_id: Optional[str] = None
+    first_seq: Optional[int] = None
+    last_seq: Optional[int] = None
+
+    @property
+    def has_range(self) -> bool:
+        return self.collector_id is not None and self.first_seq is not None
+
+    @classmethod
+    def from_headers(cls, headers) -> Optional['BatchKey']:
+        """Build a key from X-Batch-Id, X-Collector-Id and X-Batch-Seq ("first-last") headers."""
+        batch_id = headers.get('X-Batch-Id')
+        if not batch_id:
+            return None
+        collector_id = headers.get('X-Collector-Id')
+        first_seq = last_seq = None
+        seq = headers.get('X-Batch-Seq')
+        if collector_id and seq:
+            try:
+                first, _, last = seq.partition('-')
+                first_seq = int(first)
+                last_seq = int(last) if last else first_seq
+            except ValueError:
+                first_seq = last_seq = None
+            if first_seq is not None and last_seq < first_seq:
+                first_seq = last_seq = None
+        return cls(batch_id, collector_id, first_seq, last_seq)
+
+class BatchDedupIndex:
+    """
+    Bounded index of recently committed upload batches.
+
+    Collectors number their metrics, so committed sequence ranges are merged
+    into a few intervals per collector; a retried batch whose range is already
+    covered is skipped without touching metric_values. Batches without a
+    sequence range fall back to an LRU set of batch ids.
+    """
+
+    def __init__(self, max_entries: int = None, max_ranges: int = 64):
+        self.max_entries = max_entries or config.ingest.dedup_index_size
+        self.max_ranges = max_ranges
+        self._lock = threading.Lock()
+        self._batch_ids = OrderedDict()  # batch_id -> None
+        self._ranges = OrderedDict()  # collector_id -> sorted, merged [first, last] intervals
+        self._in_flight = set()
+        self.duplicates = 0
+        self.committed = 0
+
+    def _covered(self, key: BatchKey) -> bool:
+        if key.batch_id in self._batch_ids:
+            return True
+        if not key.has_range:
+            return False
+        intervals = self._ranges.get(key.collector_id)
+        if not intervals:
+            return False
+        index = bisect_right(intervals, [key.first_seq, float('inf')]) - 1
+        return index >= 0 and intervals[index][0] <= key.first_seq and key.last_seq <= intervals[index][1]
+
+    def claim(self, key: BatchKey) -> str:
+        """Reserve a batch for processing unless it was already committed or is in flight."""
+        with self._lock:
+            if self._covered(key):
+                self.duplicates += 1
+                return DUPLICATE
+            if key.batch_id in self._in_flight:
+                return IN_FLIGHT
+            self._in_flight.add(key.batch_id)
+            return NEW
+
+    def release(self, key: BatchKey):
+        """Give up a claim after a failed ingest so the collector can retry."""
+        with self._lock:
+            self._in_flight.discard(key.batch_id)
+
+    def commit(self, key: BatchKey):
+        """Record a batch as committed."""
+        with self._lock:
+            self._in_flight.discard(key.batch_id)
+            self.committed += 1
+            if key.has_range:
+                self._add_range(key.collector_id, key.first_seq, key.last_seq)
+            else:
+                self._batch_ids[key.batch_id] = None
+                while len(self._batch_ids) > self.max_entries:
+                    self._batch_ids.popitem(last=False)
+
+    def _add_range(self, collector_id: str, first: int, last: int):
+        intervals = self._ranges.pop(collector_id, [])
+        intervals.append([first, last])
+        intervals.sort()
+
+        # Merge overlapping or adjacent intervals
+        merged = [intervals[0]]
+        for start, end in intervals[1:]:
+            if start <= merged[-1][1] + 1:
+                merged[-1][1] = max(merged[-1][1], end)
+            else:
+                merged.append([start, end])
+
+        # Forget the oldest sequence numbers once a collector has too many gaps
+        self._ranges[collector_id] = merged[-self.max_ranges:]
+        while len(self._ranges) > self.max_entries:
+            self._ranges.popitem(last=False)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'collectors': len(self._ranges),
+                'batch_ids': len(self._batch_ids),
+                'in_flight': len(self._in_flight),
+                'committed': self.committed,
+                'duplicates': self.duplicates
+            }
+
+# Global dedup index for batch uploads
+batch_dedup = BatchDedupIndex()
@@ -0,0 +1,192 @@
+import threading
+import time
+from collections import deque
+from typing import Dict, List, Optional, Tuple
+from ..utils.config import config
+from ..utils.logging_config import get_logger
+
+logger = get_logger('web_app.broker')
+
+# Topics published by the aggregator
+METRICS = 'metrics'
+CONTROL = 'control'
+COMMANDS = 'commands'  # listeners of the command log, see command_log
+
+class Subscription:
+    """
+    One SSE client's bounded queue of (sequence, event) pairs.
+
+    The publisher appends and notifies; the client's response generator waits
+    on the condition, or an event loop is called back through waker. A queue
+    that fills up means the client is not reading, so the subscription is
+    closed instead of blocking the publisher.
+    """
+
+    __slots__ = ('topic', 'max_depth', 'position', 'closed', 'overflowed', 'waker', '_events', '_cond')
+
+    def __init__(self, topic: str, max_depth: int, position: int):
+        self.topic = topic
+        self.max_depth = max_depth
+        self.position = position  # sequence of the last event published before subscribing
+        self.closed = False
+        self.overflowed = False
+        self.waker = None  # called without arguments whenever events arrive or the subscription closes
+        self._events = deque()
+        self._cond = threading.Condition()
+
+    @property
+    def depth(self) -> int:
+        return len(self._events)
+
+    def put(self, event: Tuple[int, object]) -> bool:
+        """Queue an event without blocking. Returns False once the subscriber was dropped."""
+        with self._cond:
+            if self.closed:
+                return False
+            if len(self._events) >= self.max_depth:
+                self.closed = True
+                self.overflowed = True
+                self._events.clear()
+                self._cond.notify()
+                queued = False
+            else:
+                self._events.append(event)
+                self._cond.notify()
+                queued = True
+        if self.waker is not None:
+            self.waker()
+        return queued
+
+    def get(self, timeout: float) -> Optional[List[Tuple[int, object]]]:
+        """
+        Wait for events and take all queued ones.
+
+        Returns:
+            list: (sequence, event) pairs, empty on timeout, or None once the subscription is closed
+        """
+        with self._cond:
+            if not self._events and not self.closed:
+                self._cond.wait(timeout)
+            if self.closed:
+                return None
+            events = list(self._events)
+            self._events.clear()
+            return events
+
+    def close(self):
+        with self._cond:
+            self.closed = True
+            self._cond.notify()
+        if self.waker is not None:
+            self.waker()
+
+class Broker:
+    """
+    In-process publish/subscribe hub for the SSE endpoints.
+
+    Ingest and the control endpoints publish once per change; every
+    subscriber of the topic gets the event in its own bounded queue and is
+    woken right away. Each web process has its own broker.
+
+    Events get a sequence number per topic, and the last replay_size events
+    of each topic are kept so reconnecting clients can be sent what they
+    missed. SSE ids combine the sequence with the broker's start time, so
+    ids from before a restart are recognized as unknown.
+    """
+
+    def __init__(self, max_depth: int = None, replay_size: int = None):
+        self.max_depth = max_depth or config.web.sse_queue_size
+        self.replay_size = replay_size if replay_size is not None else config.web.sse_replay_events
+        self.epoch = format(int(time.time() * 1000), 'x')
+        self._subscribers: Dict[str, List[Subscription]] = {}
+        self._logs: Dict[str, deque] = {}  # topic -> recent (sequence, event)
+        self._sequences: Dict[str, int] = {}  # topic -> last sequence
+        self._lock = threading.Lock()
+        self.published = 0
+        self.delivered = 0
+        self.dropped_subscribers = 0
+
+    def event_id(self, sequence: int) -> str:
+        """SSE id of an event sequence number."""
+        return f"{self.epoch}-{sequence}"
+
+    def parse_event_id(self, event_id: Optional[str]) -> Optional[int]:
+        """Sequence number of an SSE id issued by this broker, or None."""
+        epoch, _, sequence = (event_id or '').strip().partition('-')
+        if epoch != self.epoch or not sequence.isdigit():
+            return None
+        return int(sequence)
+
+    def subscribe(self, topic: str, last_event_id: str = None) -> Tuple[Subscription, Optional[List[Tuple[int, object]]]]:
+        """
+        Subscribe to a topic, resuming after last_event_id when it is still in the replay log.
+
+        Returns:
+            tuple: (subscription, events published after last_event_id), the
+            events being None when the client needs a full snapshot instead
+        """
+        after = self.parse_event_id(last_event_id)
+        with self._lock:
+            position = self._sequences.get(topic, 0)
+            subscription = Subscription(topic, self.max_depth, position)
+            self._subscribers.setdefault(topic, []).append(subscription)
+            replay = None
+            log = self._logs.get(topic, ())
+            # The log must still hold the event right after the client's last one
+            if after is not None and after <= position and (after == position or (log and log[0][0] <= after + 1)):
+                replay = [(sequence, event) for sequence, event in log if sequence > after]
+        return subscription, replay
+
+    def unsubscribe(self, subscription: Subscription):
+        subscription.close()
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.topic, [])
+            if subscription in subscribers:
+                subscribers.remove(subscription)
+
+    def publish(self, topic: str, event):
+        """Hand an event to every subscriber of a topic; slow subscribers are dropped."""
+        dropped = 0
+        # Fanned out under the lock so every subscriber sees the sequence in order; put() never blocks
+        with self._lock:
+            sequence = self._sequences[topic] = self._sequences.get(topic, 0) + 1
+            if self.replay_size:
+                log = self._logs.get(topic)
+                if log is None:
+                    log = self._logs[topic] = deque(maxlen=self.replay_size)
+                log.append((sequence, event))
+            self.published += 1
+            subscribers = self._subscribers.get(topic, [])
+            for subscription in list(subscribers):
+                if subscription.put((sequence, event)):
+                    self.delivered += 1
+                elif subscription.overflowed:
+                    subscribers.remove(subscription)
+                    dropped += 1
+            self.dropped_subscribers += dropped
+        if dropped:
+            logger.warning(f"Dropped {dropped} slow {topic} subscriber(s) with {self.max_depth} queued events")
+
+    def stats(self) -> dict:
+        with self._lock:
+            topics = {
+                topic: {
+                    'subscribers': len(subscribers),
+                    'queued_events': sum(subscription.depth for subscription in subscribers),
+                    'max_queue_depth': max((subscription.depth for subscription in subscribers), default=0),
+                    'last_event_id': self.event_id(self._sequences.get(topic, 0)),
+                    'replayable_events': len(self._logs.get(topic, ()))
+                }
+                for topic, subscribers in sorted(self._subscribers.items())
+            }
+            return {
+                'max_depth': self.max_depth,
+                'replay_size': self.replay_size,
+                'published': self.published,
+                'delivered': self.delivered,
+                'dropped_subscribers': self.dropped_subscribers,
+                'topics': topics
+            }
+
+# Global broker, published into by ingest and the control endpoints
+broker = Broker()
@@ -0,0 +1,200 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple
+from ..utils.config import config
+from ..utils.logging_config import get_logger
+from .broker import COMMANDS, Subscription, broker
+
+logger = get_logger('web_app.command_log')
+
+# Mailbox of commands meant for every collector
+BROADCAST = '*'
+
+_CONFIGURED = object()
+
+def mailbox(collector_id: str = None, device_name: str = None) -> str:
+    """Mailbox of a collector or of the collector reporting a device; BROADCAST without either."""
+    if collector_id:
+        return f"collector:{collector_id}"
+    if device_name:
+        return f"device:{device_name}"
+    return BROADCAST
+
+def compaction_key(target: str, command: dict) -> str:
+    """Identity of a command in a mailbox; the same command sent twice only needs delivering once."""
+    fields = {key: value for key, value in command.items() if key != 'timestamp'}
+    return json.dumps([target, fields], sort_keys=True, default=str)
+
+class _Command:
+    __slots__ = ('sequence', 'mailbox', 'command', 'key', 'created_at')
+
+    def __init__(self, sequence, mailbox, command, key, created_at):
+        self.sequence = sequence
+        self.mailbox = mailbox
+        self.command = command
+        self.key = key
+        self.created_at = created_at
+
+class CommandLog:
+    """
+    Bounded, sequenced log of the commands sent to collectors.
+
+    Every command gets the next sequence number and goes to one mailbox: a
+    collector, a device or BROADCAST. Listeners subscribe to their own
+    mailboxes (plus BROADCAST) and are only woken for commands addressed to
+    them; listeners that name no mailbox get every command, as before
+    mailboxes existed.
+
+    The log keeps at most capacity commands. Commands older than retention
+    are dropped, and a command repeated to the same mailbox replaces the
+    earlier copy, so the log holds what a reconnecting collector still
+    needs and nothing more. Each web process has its own log; with the
+    shared live state, it mirrors the host's log, sequence numbers and
+    event id epoch included.
+    """
+
+    def __init__(self, capacity: int = None, retention: Optional[float] = _CONFIGURED):
+        self.capacity = capacity or config.web.command_log_size
+        self.retention = config.web.command_log_retention if retention is _CONFIGURED else retention
+        self._commands: 'OrderedDict[int, _Command]' = OrderedDict()  # sequence -> command, oldest first
+        self._latest: Dict[str, int] = {}  # compaction key -> sequence of its newest command
+        self._mailboxes: Dict[Optional[str], List[Subscription]] = {}  # None -> listeners of every mailbox
+        self._targets: Dict[Subscription, tuple] = {}  # subscription -> the mailboxes it listens to
+        self._sequence = 0
+        self._lock = threading.Lock()
+        self.epoch = None  # event id epoch, the broker's unless the log is shared
+        self.appended = 0
+        self.superseded = 0
+        self.expired = 0
+        self.evicted = 0
+        self.delivered = 0
+        self.dropped_subscribers = 0
+
+    @property
+    def last_sequence(self) -> int:
+        return self._sequence
+
+    def event_id(self, sequence: int) -> str:
+        """SSE id of a command sequence number."""
+        return f"{self.epoch or broker.epoch}-{sequence}"
+
+    def parse_event_id(self, event_id: Optional[str]) -> Optional[int]:
+        """Sequence number of an SSE id issued by this log, or None."""
+        epoch, _, sequence = (event_id or '').strip().partition('-')
+        if epoch != (self.epoch or broker.epoch) or not sequence.isdigit():
+            return None
+        return int(sequence)
+
+    def _drop(self, sequence: int):
+        entry = self._commands.pop(sequence)
+        if self._latest.get(entry.key) == sequence:
+            del self._latest[entry.key]
+
+    def _compact(self, now: float):
+        """Drop expired commands and trim the log to capacity, oldest first."""
+        if self.retention is not None:
+            cutoff = now - self.retention
+            while self._commands and next(iter(self._commands.values())).created_at < cutoff:
+                self._drop(next(iter(self._commands)))
+                self.expired += 1
+        while len(self._commands) > self.capacity:
+            self._drop(next(iter(self._commands)))
+            self.evicted += 1
+
+    def append(self, command: dict, target: str = BROADCAST, sequence: int = None, created_at: float = None) -> int:
+        """
+        Log a command for a mailbox and wake that mailbox's listeners. Returns its sequence.
+
+        Args:
+            sequence, created_at: Sequence number and epoch time given by the shared live state
+        """
+        now = time.time()
+        dropped = 0
+        with self._lock:
+            self._sequence = sequence if sequence is not None else self._sequence + 1
+            sequence = self._sequence
+            key = compaction_key(target, command)
+            previous = self._latest.get(key)
+            if previous is not None:
+                self._drop(previous)
+                self.superseded += 1
+            self._commands[sequence] = _Command(sequence, target, command, key, created_at or now)
+            self._latest[key] = sequence
+            self.appended += 1
+            self._compact(now)
+
+            for listeners in (self._mailboxes.get(target, ()), self._mailboxes.get(None, ())):
+                for subscription in list(listeners):
+                    if subscription.put((sequence, command)):
+                        self.delivered += 1
+                    elif subscription.overflowed:
+                        self._remove(subscription)
+                        dropped += 1
+            self.dropped_subscribers += dropped
+        if dropped:
+            logger.warning(f"Dropped {dropped} slow command listener(s) with {broker.max_depth} queued commands")
+        return sequence
+
+    def subscribe(self, mailboxes: Optional[Iterable[str]] = None,
+                  last_event_id: str = None) -> Tuple[Subscription, List[Tuple[int, dict]]]:
+        """
+        Listen for the commands of some mailboxes, BROADCAST included; None listens to all of them.
+
+        Returns:
+            tuple: (subscription, logged (sequence, command) pairs newer than
+            last_event_id, or all logged ones when the id is unknown)
+        """
+        after = self.parse_event_id(last_event_id) or 0
+        targets = (None,) if mailboxes is None else tuple({BROADCAST, *mailboxes})
+        with self._lock:
+            self._compact(time.time())
+            subscription = Subscription(COMMANDS, broker.max_depth, self._sequence)
+            self._targets[subscription] = targets
+            for target in targets:
+                self._mailboxes.setdefault(target, []).append(subscription)
+            pending = [
+                (entry.sequence, entry.command)
+                for entry in self._commands.values()
+                if entry.sequence > after and (mailboxes is None or entry.mailbox in targets)
+            ]
+        return subscription, pending
+
+    def _remove(self, subscription: Subscription):
+        for target in self._targets.pop(subscription, ()):
+            listeners = self._mailboxes.get(target, [])
+            if subscription in listeners:
+                listeners.remove(subscription)
+            if not listeners:
+                self._mailboxes.pop(target, None)
+
+    def unsubscribe(self, subscription: Subscription):
+        subscription.close()
+        with self._lock:
+            self._remove(subscription)
+
+    def stats(self) -> dict:
+        with self._lock:
+            mailboxes = {}
+            for entry in self._commands.values():
+                mailboxes.setdefault(entry.mailbox, {'commands': 0, 'listeners': 0})['commands'] += 1
+            for target, listeners in self._mailboxes.items():
+                mailboxes.setdefault(target or 'all', {'commands': 0, 'listeners': 0})['listeners'] += len(listeners)
+            return {
+                'capacity': self.capacity,
+                'retention': self.retention,
+                'commands': len(self._commands),
+                'first_sequence': next(iter(self._commands), None),
+                'last_event_id': self.event_id(self._sequence),
+                'appended': self.appended,
+                'superseded': self.superseded,
+                'expired': self.expired,
+                'evicted': self.evicted,
+                'delivered': self.delivered,
+                'dropped_subscribers': self.dropped_subscribers,
+                'mailboxes': dict(sorted(mailboxes.items()))
+            }
+
+# Global command log, appended to by the control endpoints
+command_log = CommandLog()
@@ -0,0 +1,91 @@
+import threading
+from collections import deque
+from typing import Optional
+from ..database.database import db
+from ..database.retention import CompactionReport, compact
+from ..utils.config import config
+from ..utils.logging_config import get_logger
+from .result_cache import result_cache
+
+logger = get_logger('web_app.compaction')
+
+# Seconds after startup before the first compaction run
+FIRST_RUN_DELAY = 60
+
+class CompactionScheduler:
+    """
+    Runs the retention compaction job periodically in a background thread.
+
+    Only one run happens at a time; the last few run reports are kept for
+    the /compaction endpoint.
+    """
+
+    def __init__(self, interval: int = None, history: int = 10):
+        self.interval = interval or config.retention.compaction_interval
+        self.app = None
+        self._run_lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._thread = None
+        self._reports = deque(maxlen=history)
+        self.failures = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, app):
+        """Start the periodic compaction thread."""
+        if self.enabled:
+            return
+        self.app = app
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name='compaction', daemon=True)
+        self._thread.start()
+        logger.info(f"Compaction scheduled every {self.interval}s")
+
+    def run_now(self, app=None) -> Optional[CompactionReport]:
+        """Run one compaction pass, or return None if one is already running."""
+        if not self._run_lock.acquire(blocking=False):
+            return None
+        try:
+            with (app or self.app).app_context():
+                try:
+                    report = compact()
+                    # Dropped partitions, expired rows and archived values change past results
+                    result_cache.clear()
+                except Exception as e:
+                    db.session.rollback()
+                    self.failures += 1
+                    logger.error(f"Compaction failed: {str(e)}", exc_info=True)
+                    raise
+            self._reports.append(report)
+            return report
+        finally:
+            self._run_lock.release()
+
+    def _run(self):
+        delay = min(FIRST_RUN_DELAY, self.interval)
+        while not self._stopping.wait(delay):
+            try:
+                self.run_now()
+            except Exception:
+                pass  # Logged by run_now, try again next interval
+            delay = self.interval
+
+    def stop(self):
+        self._stopping.set()
+        self._thread = None
+
+    def stats(self) -> dict:
+        return {
+            'enabled': self.enabled,
+            'running': self._run_lock.locked(),
+            'interval': self.interval,
+            'failures': self.failures,
+            'default_policy': config.retention.default_policy,
+            'policies': config.retention.policies,
+            'runs': [report.to_dict() for report in self._reports]
+        }
+
+# Global compaction scheduler, started by create_app when enabled
+compaction = CompactionScheduler()
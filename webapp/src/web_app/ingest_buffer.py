@@ -0,0 +1,237 @@
+import atexit
+import threading
+import time
+from collections import deque
+from typing import List, Optional, Tuple, Union
+from ..database.database import db
+from ..database.ingest import ingest_metrics, ingest_columns
+from ..utils.columnar import ColumnarBatch
+from ..utils.config import config
+from ..utils.logging_config import get_logger
+from .batch_dedup import BatchKey, batch_dedup
+from .result_cache import result_cache
+from .series_cache import series_cache
+
+logger = get_logger('web_app.ingest_buffer')
+
+# Seconds before a failed group commit is tried again
+COMMIT_RETRY_DELAY = 0.5
+
+# A buffered batch and the dedup key of the upload it came from, if any
+Entry = Tuple[Union[List[dict], ColumnarBatch], Optional[BatchKey]]
+
+def _series_keys(batch: Union[List[dict], ColumnarBatch]) -> set:
+    """(device name, metric name) pairs of a batch."""
+    if isinstance(batch, ColumnarBatch):
+        return {
+            (batch.strings[device_name], batch.strings[metric_name])
+            for device_name, metric_name in set(zip(batch.device_names, batch.metric_names))
+        }
+    return {(metric['device_name'], metric['metric_name']) for metric in batch}
+
+class WriteBehindBuffer:
+    """
+    Bounded in-process buffer that group-commits validated metric batches.
+
+    Request handlers hand batches to submit() and return immediately; a single
+    writer thread drains the buffer and commits once enough rows are pending
+    or the oldest batch reaches the configured age. A group that fails to
+    commit is tried once more, then batch by batch, so one bad batch only
+    loses itself. Upload dedup keys are committed with their rows, or
+    released when a batch is lost so the collector's retry is accepted.
+    """
+
+    def __init__(self, max_rows: int = None, group_commit_rows: int = None, group_commit_interval: float = None):
+        self.max_rows = max_rows or config.ingest.buffer_max_rows
+        self.group_commit_rows = group_commit_rows or config.ingest.group_commit_rows
+        self.group_commit_interval = group_commit_interval or config.ingest.group_commit_interval
+        self.app = None
+        self._batches = deque()  # (enqueued_at, metrics, batch_key)
+        self._rows = 0
+        self._cond = threading.Condition()
+        self._stopping = False
+        self._writer = None
+        self._exit_registered = False
+
+        # Gauges
+        self.committed_rows = 0
+        self.failed_rows = 0
+        self.failed_batches = 0
+        self.retried_commits = 0
+        self.commits = 0
+        self.last_commit_latency = 0.0
+        self.max_commit_latency = 0.0
+        self._total_commit_latency = 0.0
+
+    @property
+    def enabled(self) -> bool:
+        return self._writer is not None and self._writer.is_alive()
+
+    def start(self, app):
+        """Start the writer thread and register the shutdown flush."""
+        if self.enabled:
+            return
+        self.app = app
+        self._stopping = False
+        self._writer = threading.Thread(target=self._run, name='write-behind', daemon=True)
+        self._writer.start()
+        if not self._exit_registered:
+            atexit.register(self.stop)
+            self._exit_registered = True
+        logger.info(
+            f"Write-behind ingest enabled (max_rows={self.max_rows}, "
+            f"group_commit_rows={self.group_commit_rows}, group_commit_interval={self.group_commit_interval}s)"
+        )
+
+    def submit(self, metrics: Union[List[dict], ColumnarBatch], batch_key: Optional[BatchKey] = None) -> bool:
+        """
+        Queue a validated batch. Returns False if the buffer has no room for it.
+
+        An accepted batch_key, claimed in the dedup index by the caller, is
+        committed there once the rows are, or released if they are lost.
+        """
+        with self._cond:
+            if self._stopping or self._rows + len(metrics) > self.max_rows:
+                return False
+            self._batches.append((time.monotonic(), metrics, batch_key))
+            self._rows += len(metrics)
+            # Wake the writer to start the age timer or to commit a full group
+            if len(self._batches) == 1 or self._rows >= self.group_commit_rows:
+                self._cond.notify()
+        return True
+
+    def _take(self) -> List[Entry]:
+        """Wait until a group commit is due and take every buffered (batch, batch_key) entry."""
+        with self._cond:
+            while True:
+                if self._batches:
+                    age = time.monotonic() - self._batches[0][0]
+                    if self._stopping or self._rows >= self.group_commit_rows or age >= self.group_commit_interval:
+                        break
+                    self._cond.wait(self.group_commit_interval - age)
+                elif self._stopping:
+                    return []
+                else:
+                    self._cond.wait()
+
+            entries = [(batch, batch_key) for _, batch, batch_key in self._batches]
+            self._batches.clear()
+            self._rows = 0
+            return entries
+
+    def _write(self, entries: List[Entry]):
+        """Insert batches in one transaction and commit it; rolls back and raises on failure."""
+        batches = [batch for batch, _ in entries]
+        try:
+            # JSON batches are merged into one insert, columnar batches keep their packed form
+            merged = [metric for batch in batches if isinstance(batch, list) for metric in batch]
+            if merged:
+                ingest_metrics(merged, commit=False)
+            for batch in batches:
+                if isinstance(batch, ColumnarBatch):
+                    ingest_columns(batch, commit=False)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        self.committed_rows += sum(len(batch) for batch in batches)
+        # Replays of these uploads are duplicates from now on
+        for _, batch_key in entries:
+            if batch_key is not None:
+                batch_dedup.commit(batch_key)
+        # Results computed between submit and commit did not see these rows yet
+        for batch in batches:
+            result_cache.invalidate(batch)
+
+    def _commit(self, entries: List[Entry]):
+        started = time.perf_counter()
+        row_count = sum(len(batch) for batch, _ in entries)
+        with self.app.app_context():
+            try:
+                self._write(entries)
+            except Exception as e:
+                logger.warning(f"Group commit of {row_count} metrics failed, retrying: {str(e)}")
+                self.retried_commits += 1
+                time.sleep(COMMIT_RETRY_DELAY)
+                try:
+                    self._write(entries)
+                except Exception:
+                    self._commit_each(entries)
+        latency = time.perf_counter() - started
+        self.commits += 1
+        self.last_commit_latency = latency
+        self.max_commit_latency = max(self.max_commit_latency, latency)
+        self._total_commit_latency += latency
+
+    def _commit_each(self, entries: List[Entry]):
+        """Commit batches one by one after their group failed, so only the bad ones are lost."""
+        lost = []
+        for batch, batch_key in entries:
+            try:
+                self._write([(batch, batch_key)])
+            except Exception as e:
+                lost.append(batch)
+                # The upload was acknowledged with 202, so its retry must not be taken for a duplicate
+                if batch_key is not None:
+                    batch_dedup.release(batch_key)
+                keys = sorted(_series_keys(batch))
+                logger.error(
+                    f"Lost a buffered batch of {len(batch)} metrics for {len(keys)} series "
+                    f"({', '.join(f'{device}/{metric}' for device, metric in keys[:5])}"
+                    f"{', ...' if len(keys) > 5 else ''}): {str(e)}",
+                    exc_info=True
+                )
+        if not lost:
+            return
+        self.failed_batches += len(lost)
+        self.failed_rows += sum(len(batch) for batch in lost)
+        # The batches were shown as stored when accepted; serve their series from the database again
+        series_cache.forget(set().union(*(_series_keys(batch) for batch in lost)))
+        for batch in lost:
+            result_cache.invalidate(batch)
+
+    def _run(self):
+        logger.info("Write-behind writer thread started")
+        while True:
+            entries = self._take()
+            if not entries:
+                break
+            self._commit(entries)
+        logger.info("Write-behind writer thread exiting")
+
+    def stop(self, timeout: float = 30):
+        """Flush everything still buffered and stop the writer thread."""
+        if self._writer is None:
+            return
+        with self._cond:
+            self._stopping = True
+            pending = self._rows
+            self._cond.notify()
+        logger.info(f"Flushing {pending} buffered metrics before shutdown")
+        self._writer.join(timeout=timeout)
+        if self._writer.is_alive():
+            logger.warning("Write-behind writer did not finish flushing before the timeout")
+        self._writer = None
+
+    def stats(self) -> dict:
+        """Buffer depth and commit latency gauges."""
+        with self._cond:
+            depth_rows = self._rows
+            depth_batches = len(self._batches)
+        return {
+            'enabled': self.enabled,
+            'buffered_rows': depth_rows,
+            'buffered_batches': depth_batches,
+            'max_rows': self.max_rows,
+            'committed_rows': self.committed_rows,
+            'failed_rows': self.failed_rows,
+            'failed_batches': self.failed_batches,
+            'retried_commits': self.retried_commits,
+            'commits': self.commits,
+            'last_commit_latency_ms': self.last_commit_latency * 1000,
+            'avg_commit_latency_ms': self._total_commit_latency / self.commits * 1000 if self.commits else 0.0,
+            'max_commit_latency_ms': self.max_commit_latency * 1000
+        }
+
+# Global write-behind buffer, started by create_app when enabled
+ingest_buffer = WriteBehindBuffer()
@@ -0,0 +1,267 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import deque
+from typing import List
+from ..utils.config import config
+from ..utils.logging_config import get_logger
+from .command_log import compaction_key
+
+logger = get_logger('web_app.live_state')
+
+DEFAULT_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), '../../instance/live_state.db'))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value
+);
+CREATE TABLE IF NOT EXISTS live_metrics (
+    device TEXT NOT NULL,
+    metric TEXT NOT NULL,
+    value REAL,
+    timestamp TEXT,
+    version INTEGER NOT NULL,
+    origin TEXT NOT NULL,
+    PRIMARY KEY (device, metric)
+);
+CREATE INDEX IF NOT EXISTS ix_live_metrics_version ON live_metrics (version);
+CREATE TABLE IF NOT EXISTS control (
+    key TEXT PRIMARY KEY,
+    value TEXT,
+    version INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS commands (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    mailbox TEXT NOT NULL,
+    command TEXT NOT NULL,
+    compaction_key TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_commands_compaction_key ON commands (compaction_key);
+"""
+
+UPSERT_METRIC = """
+INSERT INTO live_metrics (device, metric, value, timestamp, version, origin) VALUES (?, ?, ?, ?, ?, ?)
+ON CONFLICT (device, metric) DO UPDATE SET
+    value = excluded.value, timestamp = excluded.timestamp, version = excluded.version, origin = excluded.origin
+WHERE excluded.timestamp >= live_metrics.timestamp
+"""
+
+class LiveState:
+    """
+    Latest metric values, control status and command log shared by the web workers of a host.
+
+    The state lives in a small SQLite database in WAL mode, apart from the
+    metrics database so it never waits on ingest. Each worker keeps serving
+    from its in-memory ControlState and CommandLog; a follower thread checks
+    PRAGMA data_version, which only moves when another connection commits,
+    every interval and applies the rows of newer versions, publishing them
+    to the worker's broker.
+
+    Metric values are written behind in one transaction per interval, so
+    ingest only appends to a queue. Status changes and commands are written
+    at once and applied to every worker through the store; commands get
+    their sequence numbers from it, so all workers number them alike.
+    """
+
+    def __init__(self, path: str = None, interval: float = None):
+        self.path = path or config.web.live_state_path or DEFAULT_PATH
+        self.interval = interval or config.web.live_state_interval
+        self.origin = uuid.uuid4().hex  # tells this worker's metric rows from the others'
+        self.epoch = None
+        self.control_state = None
+        self._writer = None
+        self._reader = None
+        self._write_lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self._pending = deque()  # lists of metric dicts waiting to be written
+        self._stopping = threading.Event()
+        self._thread = None
+        self._data_version = None
+        self._version = 0
+        self.flushes = 0
+        self.written = 0
+        self.applied = 0
+        self.failures = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def _connect(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+        connection.execute('PRAGMA journal_mode=WAL')
+        # Live values are rewritten constantly; losing the last ones on power loss is fine
+        connection.execute('PRAGMA synchronous=NORMAL')
+        return connection
+
+    def start(self, control_state):
+        """Load the shared state into control_state and keep it in step with the other workers."""
+        if self.enabled:
+            return
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._writer = self._connect()
+        self._reader = self._connect()
+        with self._write_lock:
+            self._writer.executescript(SCHEMA)
+            self._writer.execute(
+                "INSERT OR IGNORE INTO meta (key, value) VALUES ('version', 0), ('epoch', ?)",
+                (format(int(time.time() * 1000), 'x'),)
+            )
+        self.epoch = self._writer.execute("SELECT value FROM meta WHERE key = 'epoch'").fetchone()[0]
+
+        self.control_state = control_state
+        # Command ids stay valid across workers and restarts
+        control_state.commands.epoch = self.epoch
+        self.sync()
+        control_state.store = self
+
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name='live-state', daemon=True)
+        self._thread.start()
+        logger.info(f"Sharing live state through {self.path} every {self.interval}s")
+
+    def stop(self):
+        self._stopping.set()
+        self._thread = None
+        if self.control_state is not None:
+            self.control_state.store = None
+
+    def _run(self):
+        while not self._stopping.wait(self.interval):
+            try:
+                self._flush()
+                self.sync()
+            except sqlite3.Error as e:
+                self.failures += 1
+                logger.error(f"Live state sync failed: {str(e)}")
+
+    def _write(self, statements):
+        """Run statements(cursor, version) in a write transaction under a new version."""
+        with self._write_lock:
+            cursor = self._writer.cursor()
+            cursor.execute('BEGIN IMMEDIATE')
+            try:
+                cursor.execute("UPDATE meta SET value = value + 1 WHERE key = 'version'")
+                version = cursor.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()[0]
+                result = statements(cursor, version)
+                cursor.execute('COMMIT')
+            except BaseException:
+                cursor.execute('ROLLBACK')
+                raise
+        return result
+
+    def write_metrics(self, metrics: List[dict]):
+        """Queue latest values for the next write; never blocks."""
+        self._pending.append(metrics)
+
+    def _flush(self):
+        # Only the newest value of each series is worth writing
+        latest = {}
+        while True:
+            try:
+                metrics = self._pending.popleft()
+            except IndexError:
+                break
+            for metric in metrics:
+                latest[(metric['device'], metric['metric'])] = metric
+        if not latest:
+            return
+        rows = [
+            (metric['device'], metric['metric'], metric['value'], metric['timestamp'])
+            for metric in latest.values()
+        ]
+        self._write(lambda cursor, version: cursor.executemany(
+            UPSERT_METRIC, [row + (version, self.origin) for row in rows]
+        ))
+        self.flushes += 1
+        self.written += len(rows)
+
+    def set_status(self, status: str):
+        """Set the control status of every worker."""
+        self._write(lambda cursor, version: cursor.execute(
+            "INSERT INTO control (key, value, version) VALUES ('status', ?, ?) "
+            "ON CONFLICT (key) DO UPDATE SET value = excluded.value, version = excluded.version",
+            (status, version)
+        ))
+        self.sync()
+
+    def add_command(self, command: dict, target: str) -> int:
+        """Append a command to the shared log, compacted like CommandLog. Returns its sequence."""
+        commands = self.control_state.commands
+        key = compaction_key(target, command)
+        now = time.time()
+
+        def append(cursor, version):
+            cursor.execute("DELETE FROM commands WHERE compaction_key = ?", (key,))
+            sequence = cursor.execute(
+                "INSERT INTO commands (mailbox, command, compaction_key, created_at) VALUES (?, ?, ?, ?)",
+                (target, json.dumps(command, default=str), key, now)
+            ).lastrowid
+            cursor.execute(
+                "DELETE FROM commands WHERE seq NOT IN (SELECT seq FROM commands ORDER BY seq DESC LIMIT ?)",
+                (commands.capacity,)
+            )
+            if commands.retention is not None:
+                cursor.execute("DELETE FROM commands WHERE created_at < ?", (now - commands.retention,))
+            return sequence
+
+        sequence = self._write(append)
+        self.sync()
+        return sequence
+
+    def sync(self):
+        """Apply what was written since the last sync, by any worker, to this worker's state."""
+        with self._sync_lock:
+            data_version = self._reader.execute('PRAGMA data_version').fetchone()[0]
+            if data_version == self._data_version:
+                return
+            cursor = self._reader.cursor()
+            cursor.execute('BEGIN')
+            try:
+                version = cursor.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()[0]
+                metrics = cursor.execute(
+                    "SELECT device, metric, value, timestamp FROM live_metrics WHERE version > ? AND origin != ?",
+                    (self._version, self.origin)
+                ).fetchall()
+                status = cursor.execute(
+                    "SELECT value FROM control WHERE key = 'status' AND version > ?", (self._version,)
+                ).fetchone()
+                commands = cursor.execute(
+                    "SELECT seq, mailbox, command, created_at FROM commands WHERE seq > ? ORDER BY seq",
+                    (self.control_state.commands.last_sequence,)
+                ).fetchall()
+            finally:
+                cursor.execute('COMMIT')
+            self._data_version = data_version
+            self._version = version
+
+            # Applied under the sync lock so commands arrive in sequence order
+            if metrics:
+                self.control_state.add_metrics(metrics, shared=False)
+            if status is not None:
+                self.control_state.set_status(status[0], shared=False)
+            for sequence, mailbox, command, created_at in commands:
+                self.control_state.commands.append(json.loads(command), mailbox, sequence, created_at)
+            self.applied += len(metrics) + (status is not None) + len(commands)
+
+    def stats(self) -> dict:
+        return {
+            'enabled': self.enabled,
+            'path': self.path,
+            'interval': self.interval,
+            'origin': self.origin,
+            'version': self._version,
+            'pending_batches': len(self._pending),
+            'flushes': self.flushes,
+            'written': self.written,
+            'applied': self.applied,
+            'failures': self.failures
+        }
+
+# Global live state store, started by create_app when LIVE_STATE is set
+live_state = LiveState()
@@ -1,8 +1,16 @@
 from flask import Flask
+from src.database.archive import check_archive_config
 from src.database.database import init_db
 from src.utils.logging_config import get_logger
 from src.utils.config import config
 from src.web_app.routes import views, aggregator
+from src.web_app.ingest_buffer import ingest_buffer
+from src.web_app.query_plans import check_query_plans
+from src.database.rollups import start_rebuild
+from src.web_app.compaction import compaction
+from src.web_app.series_cache import series_cache
+from src.web_app.sse_server import sse_server
+from src.web_app.live_state import live_state
 
 logger = get_logger('web_app')
 
@@ -17,6 +25,9 @@ def create_app():
     app.config['SQLALCHEMY_DATABASE_URI'] = config.get_database_url()
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
     
+    # Archiving exports whole partitions, so it cannot run on an unpartitioned table
+    check_archive_config()
+    
     # Register blueprints
     app.register_blueprint(views.views_bp)
     app.register_blueprint(aggregator.aggregator_bp, url_prefix='/api/v1/aggregator')
@@ -25,6 +36,34 @@ def create_app():
     logger.info("Initializing database")
     init_db(app)
     
+    # Make sure the hot dashboard and reporting queries are index-backed
+    with app.app_context():
+        check_query_plans()
+    
+    # Serve recent dashboard ranges from memory; warmed before any upload is accepted
+    with app.app_context():
+        series_cache.warm()
+    
+    # Acknowledge uploads immediately and group-commit them from a writer thread
+    if config.ingest.write_behind:
+        ingest_buffer.start(app)
+    
+    # Databases created before rollups existed get their tiers built in the background
+    if config.ingest.rollups:
+        start_rebuild(app)
+    
+    # Apply the retention policies in the background
+    if config.retention.enabled:
+        compaction.start(app)
+    
+    # Keep latest values, control status and commands in step with the host's other workers
+    if config.web.live_state:
+        live_state.start(aggregator.control_state)
+    
+    # Hold SSE connections on one event loop instead of a web server thread each
+    if config.web.sse_server == 'asyncio':
+        sse_server.start(app)
+    
     return app
 
 if __name__ == '__main__':
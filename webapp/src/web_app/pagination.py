@@ -0,0 +1,120 @@
+import base64
+import json
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Optional, Tuple
+from sqlalchemy import func
+from ..database.database import db
+from ..database.models import Device, MetricInfo, MetricRollup
+from ..database.rollups import bucket_start, choose_tier
+from ..utils.config import config
+
+# Cursor directions: "next" pages towards older rows, "prev" towards newer ones
+NEXT = 'next'
+PREV = 'prev'
+
+# How totals are reported: estimated from the rollups, counted exactly (cached), or left out
+TOTAL_MODES = ('approx', 'exact', 'none')
+
+class CursorError(ValueError):
+    """Raised when a pagination cursor cannot be decoded."""
+
+def encode_cursor(timestamp: datetime, row_id: int, direction: str) -> str:
+    """Opaque token for the (timestamp, id) position of a row."""
+    payload = json.dumps([direction, timestamp.isoformat(), row_id], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+def decode_cursor(token: str) -> Tuple[str, Tuple[datetime, int]]:
+    """Return (direction, (timestamp, id)) of a token made by encode_cursor."""
+    try:
+        payload = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        direction, timestamp, row_id = json.loads(payload)
+        if direction not in (NEXT, PREV):
+            raise ValueError(direction)
+        return direction, (datetime.fromisoformat(timestamp), int(row_id))
+    except (ValueError, TypeError) as e:
+        raise CursorError(f'Invalid cursor: {token}') from e
+
+class CountCache:
+    """Exact row counts kept for a few seconds, keyed by filters and a coarsened range."""
+
+    def __init__(self, ttl: int = None, max_entries: int = 256):
+        self.ttl = ttl if ttl is not None else config.web.count_cache_ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # key -> (expires_at, count)
+        self._lock = threading.Lock()
+
+    def _key(self, *parts):
+        # Ranges ending "now" move on every request, so compare them at TTL granularity
+        step = max(self.ttl, 1)
+        return tuple(
+            int(part.timestamp() // step) if isinstance(part, datetime) else part
+            for part in parts
+        )
+
+    def get(self, *parts) -> Optional[int]:
+        key = self._key(*parts)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                return None
+            return entry[1]
+
+    def put(self, count: int, *parts):
+        key = self._key(*parts)
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, count)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+count_cache = CountCache()
+
+def estimate_count(device_name=None, metric_name=None, start_time=None, end_time=None) -> int:
+    """
+    Approximate number of metric values from the rollup bucket counts.
+
+    The tier is picked like the dashboard does, so about CHART_POINTS
+    buckets per series are summed; only the buckets at the range edges
+    make the result inexact.
+    """
+    if start_time and end_time:
+        tier = choose_tier(start_time, end_time) or '1m'
+    else:
+        tier = '1d'
+    query = db.session.query(func.coalesce(func.sum(MetricRollup.value_count), 0))\
+        .filter(MetricRollup.tier == tier)
+    if start_time:
+        query = query.filter(MetricRollup.bucket_start >= bucket_start(start_time, tier))
+    if end_time:
+        query = query.filter(MetricRollup.bucket_start <= end_time)
+    if device_name:
+        query = query.join(Device, MetricRollup.device_id == Device.id).filter(Device.name == device_name)
+    if metric_name:
+        query = query.join(MetricInfo, MetricRollup.metric_info_id == MetricInfo.id).filter(MetricInfo.name == metric_name)
+    return int(query.scalar())
+
+def count_total(count_query, mode: str, device_name=None, metric_name=None,
+                start_time=None, end_time=None) -> Tuple[Optional[int], bool]:
+    """
+    Total for a paginated listing.
+
+    Args:
+        count_query: Callable returning the exact count
+        mode: One of TOTAL_MODES
+
+    Returns:
+        tuple: (total or None, whether the total is an estimate)
+    """
+    if mode == 'none':
+        return None, False
+    if mode == 'approx' and config.ingest.rollups:
+        return estimate_count(device_name, metric_name, start_time, end_time), True
+
+    total = count_cache.get(device_name, metric_name, start_time, end_time)
+    if total is None:
+        total = count_query()
+        count_cache.put(total, device_name, metric_name, start_time, end_time)
+    return total, mode != 'exact'
@@ -0,0 +1,70 @@
+from datetime import datetime, timedelta
+from ..database.database import db
+from ..utils.logging_config import get_logger
+from .routes import views, reporting
+
+logger = get_logger('web_app.query_plans')
+
+# Tables that must never be read with a full scan on the hot paths
+LARGE_TABLES = ('metric_values', 'metric_rollups')
+
+def _hot_queries():
+    """The dashboard and reporting queries, built with representative parameters."""
+    end_time = datetime.utcnow()
+    start_time = end_time - timedelta(hours=1)
+    return {
+        'dashboard_time_series': views.build_time_series_query(start_time, end_time),
+        'dashboard_time_series_filtered': views.build_time_series_query(start_time, end_time, 'device', 'metric'),
+        'dashboard_rollup_time_series': views.build_rollup_time_series_query('1h', start_time, end_time),
+        'dashboard_rollup_time_series_filtered': views.build_rollup_time_series_query('1h', start_time, end_time, 'device', 'metric'),
+        'paginated_metrics': views.build_metric_values_query('device', 'metric', start_time, end_time),
+        'paginated_metrics_keyset': views.build_metric_values_query('device', 'metric', start_time, end_time, before=(end_time, 1), limit=11),
+        'paginated_metrics_keyset_all': views.build_metric_values_query(before=(end_time, 1), limit=11),
+        'reporting_device_metrics': reporting.build_device_metrics_query('device', start_time, end_time),
+        'reporting_summary': reporting.build_summary_query(start_time),
+        'reporting_rollup_summary': reporting.build_rollup_summary_query('1h', start_time)
+    }
+
+def explain(query) -> list:
+    """Return the EXPLAIN QUERY PLAN detail lines for a query (SQLite only)."""
+    compiled = query.statement.compile(dialect=db.engine.dialect)
+    params = [compiled.params[name] for name in compiled.positiontup]
+    params = tuple(str(value) if isinstance(value, datetime) else value for value in params)
+    with db.engine.connect() as conn:
+        rows = conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {compiled}", params).fetchall()
+    return [row[-1] for row in rows]
+
+def _full_scans(plan: list) -> list:
+    """Plan lines that scan a large table without using an index."""
+    return [
+        detail for detail in plan
+        if any(detail.startswith(f'SCAN {table}') for table in LARGE_TABLES)
+        and 'USING' not in detail
+    ]
+
+def check_query_plans() -> dict:
+    """
+    Explain every hot query and warn about full scans of metric_values.
+
+    Must be called inside an application context.
+
+    Returns:
+        dict: Query name -> {'plan': [...], 'full_scans': [...]}
+    """
+    if db.engine.dialect.name != 'sqlite':
+        logger.info(f"Skipping query plan check on {db.engine.dialect.name}")
+        return {}
+
+    report = {}
+    for name, query in _hot_queries().items():
+        plan = explain(query)
+        full_scans = _full_scans(plan)
+        report[name] = {'plan': plan, 'full_scans': full_scans}
+        if full_scans:
+            logger.warning(f"Query {name} does a full table scan: {'; '.join(full_scans)}")
+        else:
+            logger.debug(f"Query {name} plan: {'; '.join(plan)}")
+
+    regressions = sum(1 for entry in report.values() if entry['full_scans'])
+    logger.info(f"Checked {len(report)} query plans, {regressions} with full table scans")
+    return report
@@ -0,0 +1,263 @@
+import sys
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple, Union
+from ..utils.columnar import ColumnarBatch, from_epoch_micros
+from ..utils.config import config
+from ..utils.logging_config import get_logger
+
+logger = get_logger('web_app.result_cache')
+
+# Seconds a viewer waits for another request computing the same result before computing it too
+INFLIGHT_WAIT = 30
+
+SeriesRanges = Dict[Tuple[str, str], Tuple[datetime, datetime]]  # (device, metric) -> (oldest, newest) timestamp
+
+def _naive(timestamp: Optional[datetime]) -> Optional[datetime]:
+    # Stored timestamps carry no zone, see partitions._naive
+    return timestamp.replace(tzinfo=None) if timestamp is not None else None
+
+def _sizeof(value) -> int:
+    """Approximate memory held by a result made of dicts, lists and scalars."""
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(_sizeof(key) + _sizeof(item) for key, item in value.items())
+    elif isinstance(value, (list, tuple)):
+        size += sum(_sizeof(item) for item in value)
+    return size
+
+def series_ranges(batch: Union[List[dict], ColumnarBatch]) -> SeriesRanges:
+    """Oldest and newest timestamp written to each series by an ingest batch."""
+    ranges = {}
+    if isinstance(batch, ColumnarBatch):
+        strings = batch.strings
+        rows = (
+            (strings[device_name], strings[metric_name], from_epoch_micros(timestamp))
+            for device_name, metric_name, timestamp in zip(batch.device_names, batch.metric_names, batch.timestamps)
+        )
+    else:
+        rows = ((metric['device_name'], metric['metric_name'], _naive(metric['timestamp'])) for metric in batch)
+    for device_name, metric_name, timestamp in rows:
+        key = (device_name, metric_name)
+        current = ranges.get(key)
+        if current is None:
+            ranges[key] = (timestamp, timestamp)
+        elif timestamp < current[0]:
+            ranges[key] = (timestamp, current[1])
+        elif timestamp > current[1]:
+            ranges[key] = (current[0], timestamp)
+    return ranges
+
+class _Scope:
+    """The series and time range a cached result was computed from."""
+
+    __slots__ = ('device_name', 'metric_name', 'start_time', 'end_time')
+
+    def __init__(self, device_name, metric_name, start_time, end_time):
+        self.device_name = device_name
+        self.metric_name = metric_name
+        self.start_time = _naive(start_time)
+        self.end_time = _naive(end_time)  # None for ranges that end "now"
+
+    def covers(self, ranges: SeriesRanges) -> bool:
+        """True if a write to any of the series ranges could change the result."""
+        for (device_name, metric_name), (oldest, newest) in ranges.items():
+            if self.device_name is not None and device_name != self.device_name:
+                continue
+            if self.metric_name is not None and metric_name != self.metric_name:
+                continue
+            if self.start_time is not None and newest < self.start_time:
+                continue
+            if self.end_time is not None and oldest > self.end_time:
+                continue
+            return True
+        return False
+
+class _Entry:
+    __slots__ = ('endpoint', 'scope', 'value', 'size', 'expires_at')
+
+    def __init__(self, endpoint, scope, value, size, expires_at):
+        self.endpoint = endpoint
+        self.scope = scope
+        self.value = value
+        self.size = size
+        self.expires_at = expires_at
+
+class _Inflight:
+    """A result being computed; viewers asking for the same key wait for it."""
+
+    __slots__ = ('scope', 'done', 'stale')
+
+    def __init__(self, scope):
+        self.scope = scope
+        self.done = threading.Event()
+        self.stale = False  # set when ingest wrote into the scope while computing
+
+class ResultCache:
+    """
+    Computed dashboard and reporting results, shared by every viewer of the same query.
+
+    Entries are keyed on endpoint, filters, time range and extra parameters
+    and expire after ttl seconds. Ingest drops the entries whose device,
+    metric and time range it wrote into, but only in the process that ran
+    it: each web process holds its own cache, so a result may miss rows
+    ingested by another worker for up to ttl seconds. Memory is bounded by
+    max_bytes, least recently used entries going first. Concurrent misses on
+    one key compute the result once.
+    """
+
+    def __init__(self, ttl: int = None, max_bytes: int = None):
+        self.ttl = ttl if ttl is not None else config.web.result_cache_ttl
+        self.max_bytes = max_bytes if max_bytes is not None else config.web.result_cache_bytes
+        self._entries: 'OrderedDict[tuple, _Entry]' = OrderedDict()
+        self._inflight: Dict[tuple, _Inflight] = {}
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.evictions = 0
+        self._endpoints: Dict[str, Dict[str, int]] = {}  # endpoint -> hits, misses
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0 and self.max_bytes > 0
+
+    def _key(self, endpoint, device_name, metric_name, start_time, end_time, params, live):
+        if live:
+            # Ranges ending "now" move on every request, so compare them at TTL granularity
+            start_time = int(start_time.timestamp() // self.ttl) if start_time is not None else None
+            end_time = None
+        return (endpoint, device_name, metric_name, start_time, end_time) + tuple(params)
+
+    def _count(self, endpoint: str, outcome: str):
+        counters = self._endpoints.setdefault(endpoint, {'hits': 0, 'misses': 0})
+        counters[outcome] += 1
+
+    def _lookup(self, key) -> Tuple[bool, object]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return False, None
+        if entry.expires_at < time.monotonic():
+            self._remove(key)
+            return False, None
+        self._entries.move_to_end(key)
+        return True, entry.value
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        self.bytes -= entry.size
+
+    def get_or_compute(self, endpoint: str, compute: Callable[[], object], device_name: str = None,
+                       metric_name: str = None, start_time: datetime = None, end_time: datetime = None,
+                       params: tuple = (), live: bool = False):
+        """
+        Return the cached result of a query, computing and storing it on a miss.
+
+        Args:
+            endpoint: Name of the computation, part of the key
+            compute: Callable returning the result; it must not be mutated afterwards
+            device_name, metric_name: Filters, None for all devices or metrics
+            start_time, end_time: Range read by compute, None when unbounded
+            params: Any other arguments the result depends on
+            live: The range ends "now"; the end is ignored and the start rounded to ttl seconds
+        """
+        if not self.enabled:
+            return compute()
+        key = self._key(endpoint, device_name, metric_name, start_time, end_time, params, live)
+
+        while True:
+            with self._lock:
+                found, value = self._lookup(key)
+                if found:
+                    self.hits += 1
+                    self._count(endpoint, 'hits')
+                    return value
+                inflight = self._inflight.get(key)
+                if inflight is None:
+                    self.misses += 1
+                    self._count(endpoint, 'misses')
+                    inflight = self._inflight[key] = _Inflight(
+                        _Scope(device_name, metric_name, start_time, None if live else end_time)
+                    )
+                    break
+            # Another viewer is computing this result; use theirs unless ingest made it stale
+            if not inflight.done.wait(INFLIGHT_WAIT):
+                return compute()
+
+        try:
+            value = compute()
+        except Exception:
+            with self._lock:
+                del self._inflight[key]
+            inflight.done.set()
+            raise
+
+        size = _sizeof(value)
+        with self._lock:
+            del self._inflight[key]
+            if not inflight.stale and size <= self.max_bytes:
+                if key in self._entries:
+                    self._remove(key)
+                self._entries[key] = _Entry(endpoint, inflight.scope, value, size, time.monotonic() + self.ttl)
+                self.bytes += size
+                while self.bytes > self.max_bytes:
+                    self._remove(next(iter(self._entries)))
+                    self.evictions += 1
+        inflight.done.set()
+        return value
+
+    def invalidate(self, batch: Union[List[dict], ColumnarBatch]):
+        """Drop the results an ingest batch wrote into."""
+        if not self.enabled or not len(batch):
+            return
+        ranges = series_ranges(batch)
+        with self._lock:
+            stale = [key for key, entry in self._entries.items() if entry.scope.covers(ranges)]
+            for key in stale:
+                self._remove(key)
+            self.invalidations += len(stale)
+            for inflight in self._inflight.values():
+                if not inflight.stale and inflight.scope.covers(ranges):
+                    inflight.stale = True
+
+    def clear(self):
+        """Drop every result, e.g. after partitions were dropped or compacted."""
+        with self._lock:
+            self.invalidations += len(self._entries)
+            self._entries.clear()
+            self.bytes = 0
+            for inflight in self._inflight.values():
+                inflight.stale = True
+
+    def stats(self) -> dict:
+        with self._lock:
+            now = time.monotonic()
+            endpoints = {
+                endpoint: dict(counters, entries=0, bytes=0)
+                for endpoint, counters in sorted(self._endpoints.items())
+            }
+            for entry in self._entries.values():
+                if entry.expires_at >= now:
+                    counters = endpoints.setdefault(entry.endpoint, {'hits': 0, 'misses': 0, 'entries': 0, 'bytes': 0})
+                    counters['entries'] += 1
+                    counters['bytes'] += entry.size
+            lookups = self.hits + self.misses
+            return {
+                'enabled': self.enabled,
+                'ttl': self.ttl,
+                'max_bytes': self.max_bytes,
+                'bytes': self.bytes,
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'invalidations': self.invalidations,
+                'evictions': self.evictions,
+                'endpoints': endpoints
+            }
+
+# Global result cache, invalidated by the ingest endpoints and the write-behind writer
+result_cache = ResultCache()
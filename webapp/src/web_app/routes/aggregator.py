@@ -1,12 +1,27 @@
-from flask import Blueprint, request, jsonify, Response, stream_with_context
+from flask import Blueprint, request, jsonify, abort, current_app
 from marshmallow import Schema, fields
 from datetime import datetime
-from time import sleep
 import json
 import logging
 from ...database.database import db
-from ...database.models import Device, MetricInfo, MetricValue
-import time
+from ...database.ingest import ingest_metrics, ingest_columns, coerce_timestamp
+from ...utils.config import config
+from ...utils.compression import DecompressionError, DecompressedSizeExceeded, decompress_body, iter_decompress
+from ...utils.ndjson import LineTooLong, iter_lines
+from ...utils.columnar import COLUMNAR_CONTENT_TYPE, ColumnarFormatError, decode_batch, from_epoch_micros
+from ...database.resolver import resolver
+from ...database.partitions import partitions
+from ...database.archive import archive
+from ..ingest_buffer import ingest_buffer
+from ..batch_dedup import BatchKey, batch_dedup, DUPLICATE, IN_FLIGHT
+from ..compaction import compaction
+from ..series_cache import series_cache
+from ..result_cache import result_cache
+from ..broker import broker, METRICS, CONTROL
+from ..command_log import command_log, mailbox
+from ..sse_server import KEEPALIVE, Stream, sse_server, sse_stream
+from ..live_state import live_state
+import threading
 
 logger = logging.getLogger(__name__)
 
@@ -19,48 +34,95 @@ class DateTimeEncoder(json.JSONEncoder):
 
 aggregator_bp = Blueprint('aggregator', __name__)
 
-# In-memory storage for control status and latest metrics
+# NDJSON stream ingest limits
+STREAM_READ_SIZE = 64 * 1024
+MAX_STREAM_LINE_SIZE = 1024 * 1024
+
+# In-memory storage for control status and latest metrics; changes are published to the SSE broker.
+# With the shared live state, every worker's copy follows the host's store.
 class ControlState:
     def __init__(self):
         self.status = 'RUNNING'
-        self._listeners = []
         self.latest_metrics = {}  # Store latest metrics for each device/metric combination
-        self.commands = []  # Store commands for the collector
+        self.commands = command_log  # Commands for the collectors, by mailbox
+        self.store = None  # Shared live state of the host's workers, set by live_state.start
+        self._lock = threading.Lock()
 
-    def set_status(self, status):
-        self.status = status
-        # No need to notify listeners as they will poll
+    def set_status(self, status, shared=True):
+        if shared and self.store is not None:
+            # The store applies the status to every worker, this one included
+            self.store.set_status(status)
+            return
+        with self._lock:
+            changed = status != self.status
+            self.status = status
+        if changed:
+            broker.publish(CONTROL, status)
 
     def get_status(self):
         return self.status
         
     def add_metric(self, device_name, metric_name, value, timestamp):
         """Add a new metric value to the latest metrics store."""
-        key = f"{device_name}:{metric_name}"
-        
-        # Convert timestamp to ISO format string if it's a datetime object
-        timestamp_str = timestamp
-        if isinstance(timestamp, datetime):
-            timestamp_str = timestamp.isoformat()
-            
-        self.latest_metrics[key] = {
-            'device': device_name,
-            'metric': metric_name,
-            'value': value,
-            'timestamp': timestamp_str
-        }
+        self.add_metrics([(device_name, metric_name, value, timestamp)])
+
+    def add_metrics(self, metrics, shared=True):
+        """Store (device, metric, value, timestamp) values and publish the changed ones as one event."""
+        changed = []
+        stored = []
+        with self._lock:
+            for device_name, metric_name, value, timestamp in metrics:
+                key = f"{device_name}:{metric_name}"
+                
+                # Convert timestamp to ISO format string if it's a datetime object
+                timestamp_str = timestamp
+                if isinstance(timestamp, datetime):
+                    timestamp_str = timestamp.isoformat()
+                
+                previous = self.latest_metrics.get(key)
+                metric = self.latest_metrics[key] = {
+                    'device': device_name,
+                    'metric': metric_name,
+                    'value': value,
+                    'timestamp': timestamp_str
+                }
+                stored.append(metric)
+                # Clients only want values that changed
+                if previous is None or previous['value'] != value:
+                    changed.append(metric)
+        if changed:
+            broker.publish(METRICS, changed)
+        if shared and self.store is not None:
+            # Written behind, so ingest never waits on the store
+            self.store.write_metrics(stored)
 
     def get_latest_metrics(self):
         """Get all latest metrics as a list."""
-        return list(self.latest_metrics.values())
+        with self._lock:
+            return list(self.latest_metrics.values())
+
+    def subscribe_commands(self, mailboxes=None, last_event_id=None):
+        """
+        Subscribe to the commands of some mailboxes (None for all), resuming after last_event_id.
+
+        Returns:
+            tuple: (subscription, logged (sequence, command) pairs to send first)
+        """
+        return self.commands.subscribe(mailboxes, last_event_id)
 
-    def add_command(self, command):
-        """Add a new command to the command queue."""
-        self.commands.append(command)
+    def add_command(self, command, target=None):
+        """Add a new command to a mailbox of the command log, all collectors by default."""
+        if self.store is not None:
+            return self.store.add_command(command, target or mailbox())
+        return self.commands.append(command, target or mailbox())
 
 # Global control state
 control_state = ControlState()
 
+def _sse_message(data, sequence, ids=broker):
+    """Format an SSE message whose id, issued by ids, lets a reconnecting client resume after it."""
+    return f"id: {ids.event_id(sequence)}\ndata: {data}\n\n"
+
 class MetricSchema(Schema):
     device_id = fields.Str(required=True)
     device_name = fields.Str(required=True)
@@ -76,57 +138,20 @@ metrics_schema = MetricSchema(many=True)
 @aggregator_bp.route('/metrics/', methods=['POST'])
 def collect_metric():
     # Validate and deserialize input
-    data = metric_schema.load(request.json)
+    data = metric_schema.load(_request_json())
     
-    # Ensure timestamp is a datetime object
-    if 'timestamp' in data and isinstance(data['timestamp'], str):
-        try:
-            data['timestamp'] = datetime.fromisoformat(data['timestamp'].replace('Z', '+00:00'))
-        except ValueError:
-            # If parsing fails, use current time
-            data['timestamp'] = datetime.utcnow()
+    # Ensure timestamp is a datetime object, parsed like batch uploads
+    data['timestamp'] = coerce_timestamp(data.get('timestamp'))
     
-    # Get or create device
-    device = Device.query.filter_by(id=data['device_id']).first()
-    if not device:
-        # Check if a device with the same name already exists
-        existing_device = Device.query.filter_by(name=data['device_name']).first()
-        if existing_device:
-            # Use the existing device instead of creating a new one
-            device = existing_device
-            logger.info(f"Using existing device with name '{data['device_name']}' (ID: {device.id})")
-        else:
-            # Create a new device
-            device = Device(
-                id=data['device_id'],
-                name=data['device_name']
-            )
-            db.session.add(device)
-            db.session.flush()
-            logger.info(f"Created new device: {data['device_name']} (ID: {device.id})")
-
-    # Get or create metric info
-    metric_info = MetricInfo.query.filter_by(name=data['metric_name']).first()
-    if not metric_info:
-        metric_info = MetricInfo(
-            name=data['metric_name'],
-            unit="units"
-        )
-        db.session.add(metric_info)
-        db.session.flush()
-
-    # Create metric value
-    metric = MetricValue(
-        device_id=device.id,
-        metric_info_id=metric_info.id,
-        metric_value=data['metric_value'],
-        timestamp=data['timestamp'],
-        metric_metadata=data.get('metric_metadata')
-    )
-    db.session.add(metric)
-    db.session.commit()
-    
-    # Store the latest metric for real-time updates
+    # In write-behind mode the writer thread commits the value later
+    accepted = ingest_buffer.enabled and ingest_buffer.submit([data])
+    if not accepted:
+        # Resolve the device and metric through the shared catalog cache and store the value
+        ingest_metrics([data])
+    series_cache.extend_metrics([data])
+    result_cache.invalidate([data])
+
+    # Store the latest metric for real-time updates, once streams can read the new point
     control_state.add_metric(
         device_name=data['device_name'],
         metric_name=data['metric_name'],
@@ -134,172 +159,334 @@ def collect_metric():
         timestamp=data['timestamp']
     )
 
+    if accepted:
+        return jsonify(metric_schema.dump(data)), 202
     return jsonify(metric_schema.dump(data))
 
+@aggregator_bp.errorhandler(DecompressionError)
+def handle_decompression_error(e):
+    status = 413 if isinstance(e, DecompressedSizeExceeded) else 400
+    return jsonify({"error": str(e)}), status
+
+def _request_body():
+    """Request body with any Content-Encoding removed."""
+    payload = request.get_data()
+    encoding = request.headers.get('Content-Encoding')
+    if not encoding:
+        return payload
+    
+    body, cpu_time = decompress_body(payload, encoding, config.ingest.max_decompressed_size)
+    logger.info(
+        f"Decompressed {encoding} body {len(payload)} -> {len(body)} bytes "
+        f"(ratio {len(body) / max(len(payload), 1):.1f}x, {cpu_time * 1000:.2f}ms CPU)"
+    )
+    return body
+
+def _request_json():
+    """Parse the JSON request body, decompressing it first if needed."""
+    if not request.headers.get('Content-Encoding'):
+        return request.get_json()
+    body = _request_body()
+    try:
+        return json.loads(body)
+    except ValueError:
+        abort(400, description='Invalid JSON body')
+
+def _normalize_batch(metrics_batch):
+    """Validate a batch and coerce its timestamps. Returns (metrics, error message)."""
+    if not isinstance(metrics_batch, list):
+        return None, 'Expected a JSON array of metrics'
+    
+    metrics = []
+    for index, metric_data in enumerate(metrics_batch):
+        if not isinstance(metric_data, dict):
+            return None, f'Metric {index} is not an object'
+        if not metric_data.get('device_name') or not metric_data.get('metric_name'):
+            return None, f'Metric {index} is missing device_name or metric_name'
+        try:
+            value = float(metric_data.get('metric_value'))
+        except (TypeError, ValueError):
+            return None, f'Metric {index} has a non-numeric metric_value'
+        
+        metrics.append({
+            'device_id': metric_data.get('device_id'),
+            'device_name': metric_data['device_name'],
+            'metric_name': metric_data['metric_name'],
+            'metric_value': value,
+            'timestamp': coerce_timestamp(metric_data.get('timestamp')),
+            'metric_metadata': metric_data.get('metric_metadata')
+        })
+    return metrics, None
+
 @aggregator_bp.route('/metrics/batch', methods=['POST'])
 @aggregator_bp.route('/metrics/batch/', methods=['POST'])
 def upload_metrics_batch():
-    metrics_batch = request.get_json()
+    return _idempotent(_ingest_batch_request)
+
+def _idempotent(ingest):
+    """
+    Run ingest() for the current request unless its batch was already committed.
+
+    Uploads carrying X-Batch-Id (and X-Collector-Id with X-Batch-Seq) are
+    claimed in the dedup index; replays of committed batches are skipped.
+    ingest takes the claimed key (or None) and returns (response, status).
+    Batches the write-behind buffer accepts (202) keep their claim until
+    the writer commits their rows, or releases it if they are lost.
+    """
+    batch_key = BatchKey.from_headers(request.headers)
+    if batch_key is None:
+        return ingest(None)
+    
+    outcome = batch_dedup.claim(batch_key)
+    if outcome == DUPLICATE:
+        logger.info(f"Skipping replayed batch {batch_key.batch_id}")
+        return jsonify({"status": "success", "count": 0, "duplicate": True}), 200
+    if outcome == IN_FLIGHT:
+        return jsonify({"error": f"Batch {batch_key.batch_id} is already being processed"}), 409
     
+    status = None
     try:
-        for metric_data in metrics_batch:
-            device_id = metric_data.get('device_id')
-            device_name = metric_data.get('device_name')
-            metric_name = metric_data.get('metric_name')
-            metric_value = metric_data.get('metric_value')
-            
-            # Ensure timestamp is a datetime object
-            if 'timestamp' in metric_data and isinstance(metric_data['timestamp'], str):
-                try:
-                    timestamp = datetime.fromisoformat(metric_data['timestamp'].replace('Z', '+00:00'))
-                except ValueError:
-                    # If parsing fails, use current time
-                    timestamp = datetime.utcnow()
-            else:
-                timestamp = metric_data.get('timestamp', datetime.utcnow())
-            
-            # Get or create device
-            device = Device.query.filter_by(id=device_id).first()
-            if not device:
-                # Check if a device with the same name already exists
-                existing_device = Device.query.filter_by(name=device_name).first()
-                if existing_device:
-                    # Use the existing device instead of creating a new one
-                    device = existing_device
-                    logger.info(f"Using existing device with name '{device_name}' (ID: {device.id})")
-                else:
-                    # Create a new device
-                    device = Device(
-                        id=device_id,
-                        name=device_name
-                    )
-                    db.session.add(device)
-                    db.session.flush()
-                    logger.info(f"Created new device: {device_name} (ID: {device.id})")
-            
-            # Get or create metric info
-            metric_info = MetricInfo.query.filter_by(name=metric_name).first()
-            if not metric_info:
-                metric_info = MetricInfo(
-                    name=metric_name,
-                    unit="units"
-                )
-                db.session.add(metric_info)
-                db.session.flush()
+        response, status = ingest(batch_key)
+        return response, status
+    finally:
+        if status is None or status >= 300:
+            batch_dedup.release(batch_key)
+        elif status != 202:
+            # Accepted (202) batches are committed by the write-behind writer with their rows
+            batch_dedup.commit(batch_key)
+
+def _ingest_batch_request(batch_key=None):
+    """Ingest the current batch request body. Returns (response, status)."""
+    # Packed columnar uploads skip JSON parsing and per-row dicts entirely
+    if request.mimetype == COLUMNAR_CONTENT_TYPE:
+        return _upload_columnar_batch(batch_key)
+    
+    metrics_batch, error = _normalize_batch(_request_json())
+    if error:
+        return jsonify({"error": error}), 400
+    
+    try:
+        count, accepted = _store_metrics(metrics_batch, batch_key)
+        if accepted:
+            return jsonify({"status": "accepted", "count": count}), 202
+        return jsonify({"status": "success", "count": count}), 200
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Error ingesting metrics batch: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+def _store_metrics(metrics, batch_key=None):
+    """
+    Publish live values and persist normalized metrics.
+
+    Returns:
+        tuple: (row count, True if the write-behind buffer accepted the rows)
+    """
+    # In write-behind mode the writer thread group-commits the rows later
+    accepted = ingest_buffer.enabled and ingest_buffer.submit(metrics, batch_key)
+    if accepted:
+        count = len(metrics)
+    else:
+        # Resolve devices and metric names once per batch and insert all rows together
+        count = ingest_metrics(metrics).count
+    _publish_metrics(metrics)
+    return count, accepted
+
+def _publish_metrics(metrics):
+    """Show stored metrics in the series cache and live values, and drop the results they change."""
+    series_cache.extend_metrics(metrics)
+    result_cache.invalidate(metrics)
+    
+    # Store the latest metrics for real-time updates, once streams can read the new points
+    control_state.add_metrics(
+        (metric_data['device_name'], metric_data['metric_name'], metric_data['metric_value'], metric_data['timestamp'])
+        for metric_data in metrics
+    )
+
+@aggregator_bp.route('/metrics/stream', methods=['POST'])
+def upload_metrics_stream():
+    """
+    Ingest newline-delimited JSON metrics from a (chunked) request body.
+    
+    Records are parsed as bytes arrive and inserted every STREAM_CHUNK_ROWS
+    rows, all in one transaction: a stream is stored whole or not at all,
+    so it can be retried under the same batch identity as batch uploads.
+    """
+    return _idempotent(_ingest_stream_request)
+
+def _ingest_stream_request(batch_key=None):
+    """Ingest the current NDJSON stream request body. Returns (response, status)."""
+    chunk_rows = config.ingest.stream_chunk_rows
+    # The write-behind buffer takes the whole stream at once; otherwise chunks go into the open transaction
+    write_behind = ingest_buffer.enabled
+    metrics = []
+    inserted = 0
+    line_number = 0
+    
+    def read_chunks():
+        while True:
+            chunk = request.stream.read(STREAM_READ_SIZE)
+            if not chunk:
+                break
+            yield chunk
+    
+    def rejected(error):
+        db.session.rollback()
+        return jsonify({"error": error}), 400
+    
+    try:
+        body = iter_decompress(read_chunks(), request.headers.get('Content-Encoding'))
+        for line in iter_lines(body, MAX_STREAM_LINE_SIZE):
+            line_number += 1
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                return rejected(f"Invalid JSON on line {line_number}")
             
-            # Create metric value
-            metric = MetricValue(
-                device_id=device.id,
-                metric_info_id=metric_info.id,
-                metric_value=metric_value,
-                timestamp=timestamp,
-                metric_metadata=metric_data.get('metric_metadata')
-            )
-            db.session.add(metric)
+            normalized, error = _normalize_batch([record])
+            if error:
+                return rejected(f"Line {line_number}: {error}")
+            metrics.extend(normalized)
             
-            # Store the latest metric for real-time updates
-            control_state.add_metric(
-                device_name=device_name,
-                metric_name=metric_name,
-                value=metric_value,
-                timestamp=timestamp
-            )
+            if not write_behind and len(metrics) - inserted >= chunk_rows:
+                ingest_metrics(metrics[inserted:], commit=False)
+                inserted = len(metrics)
         
-        db.session.commit()
-        return jsonify({"status": "success", "count": len(metrics_batch)})
+        accepted = write_behind and ingest_buffer.submit(metrics, batch_key)
+        if not accepted:
+            if len(metrics) > inserted:
+                ingest_metrics(metrics[inserted:], commit=False)
+            db.session.commit()
+    except (DecompressionError, LineTooLong) as e:
+        return rejected(str(e))
     except Exception as e:
         db.session.rollback()
+        logger.error(f"Error ingesting metrics stream at line {line_number}: {str(e)}")
         return jsonify({"error": str(e)}), 500
+    
+    _publish_metrics(metrics)
+    logger.info(f"Ingested {len(metrics)} metrics from a {line_number}-line NDJSON stream")
+    if accepted:
+        return jsonify({"status": "accepted", "count": len(metrics)}), 202
+    return jsonify({"status": "success", "count": len(metrics)}), 200
 
-@aggregator_bp.route('/metrics/updates', methods=['GET'])
-def metrics_stream():
-    """Stream metrics updates to clients using SSE."""
-    client_ip = request.remote_addr
-    logger.info(f"Client {client_ip} connected to metrics SSE stream")
+def _upload_columnar_batch(batch_key=None):
+    """Ingest a batch sent in the packed columnar format."""
+    try:
+        batch = decode_batch(_request_body())
+    except ColumnarFormatError as e:
+        return jsonify({"error": str(e)}), 400
     
-    def generate():
-        last_update = {}
-        update_count = 0
+    try:
+        accepted = ingest_buffer.enabled and ingest_buffer.submit(batch, batch_key)
+        count = len(batch) if accepted else ingest_columns(batch).count
+        _cache_columnar_batch(batch)
         
-        try:
-            while True:
-                # Get latest metrics
-                latest = control_state.get_latest_metrics()
-                updates = []
-                
-                # Check for new updates
-                for metric in latest:
-                    key = f"{metric['device']}:{metric['metric']}"
-                    if key not in last_update or last_update[key] != metric['value']:
-                        # Convert datetime objects to ISO format strings
-                        if 'timestamp' in metric and isinstance(metric['timestamp'], datetime):
-                            metric['timestamp'] = metric['timestamp'].isoformat()
-                        updates.append(metric)
-                        last_update[key] = metric['value']
-                
-                # Send updates if any
-                if updates:
-                    update_count += 1
-                    logger.debug(f"Sending {len(updates)} metric updates to client {client_ip} (total: {update_count})")
-                    yield f"data: {json.dumps(updates, cls=DateTimeEncoder)}\n\n"
-                
-                sleep(1)  # Check for updates every second
-        except GeneratorExit:
-            logger.info(f"Client {client_ip} disconnected from metrics SSE stream after {update_count} updates")
-    
-    return Response(
-        generate(),
-        mimetype="text/event-stream",
-        headers={
-            "Cache-Control": "no-cache",
-            "X-Accel-Buffering": "no",
-            "Connection": "keep-alive"
-        }
+        # Only the newest point of each series matters for live values
+        latest = {}
+        for row, (device_name, metric_name) in enumerate(zip(batch.device_names, batch.metric_names)):
+            latest[(device_name, metric_name)] = row
+        control_state.add_metrics(
+            (batch.strings[device_name], batch.strings[metric_name], batch.values[row], from_epoch_micros(batch.timestamps[row]))
+            for (device_name, metric_name), row in latest.items()
+        )
+        
+        if accepted:
+            return jsonify({"status": "accepted", "count": count}), 202
+        return jsonify({"status": "success", "count": count}), 200
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Error ingesting columnar metrics batch: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+def _cache_columnar_batch(batch):
+    """Add a columnar batch to the recent series cache and drop the results it changes."""
+    result_cache.invalidate(batch)
+    strings = batch.strings
+    series_cache.extend(
+        (strings[device_name], strings[metric_name], from_epoch_micros(timestamp), value)
+        for device_name, metric_name, timestamp, value in zip(
+            batch.device_names, batch.metric_names, batch.timestamps, batch.values
+        )
     )
 
+class MetricUpdatesStream(Stream):
+    """Latest metric values; a resumed stream only gets those that changed while away."""
+
+    name = 'metrics SSE'
+
+    def __init__(self):
+        super().__init__()
+        self.last_event_id = request.headers.get('Last-Event-ID')
+        logger.info(f"Client {self.client_ip} connected to metrics SSE stream")
+
+    @staticmethod
+    def coalesce(events):
+        # Keep the newest value of each series
+        updates = {}
+        for _, event in events:
+            for metric in event:
+                updates[(metric['device'], metric['metric'])] = metric
+        return list(updates.values())
+
+    def open(self):
+        # Subscribe before taking the snapshot so nothing published in between is lost
+        self.subscription, replay = broker.subscribe(METRICS, self.last_event_id)
+        if replay is None:
+            latest = control_state.get_latest_metrics()
+        else:
+            # Resumed: only what changed while the client was away
+            latest = self.coalesce(replay)
+            logger.info(f"Client {self.client_ip} resumed the metrics SSE stream, replaying {len(replay)} events")
+        if not latest:
+            return []
+        return [_sse_message(json.dumps(latest, cls=DateTimeEncoder), self.subscription.position)]
+
+    def receive(self, events):
+        # Woken by ingest as soon as a value changes
+        if not events:
+            return []
+        updates = self.coalesce(events)
+        logger.debug(f"Sending {len(updates)} metric updates to client {self.client_ip} (total: {self.sent + 1})")
+        return [_sse_message(json.dumps(updates, cls=DateTimeEncoder), events[-1][0])]
+
+@aggregator_bp.route('/metrics/updates', methods=['GET'])
+@sse_stream
+def metrics_stream():
+    """Stream metrics updates to clients using SSE."""
+    return MetricUpdatesStream()
+
+class ControlStream(Stream):
+    """The collectors' control status, sent again only when it changes."""
+
+    name = 'control SSE'
+
+    def __init__(self):
+        super().__init__()
+        self.last_status = None
+        logger.info(f"Client {self.client_ip} connected to control SSE stream")
+
+    def open(self):
+        # The status is state rather than a log, so every connection starts with the current one
+        self.subscription, _ = broker.subscribe(CONTROL)
+        self.last_status = control_state.get_status()
+        logger.info(f"Sending initial status '{self.last_status}' to client {self.client_ip}")
+        return [_sse_message(self.last_status, self.subscription.position)]
+
+    def receive(self, events):
+        if not events or events[-1][1] == self.last_status:
+            return []
+        self.last_status = events[-1][1]
+        logger.info(f"Sending status update '{self.last_status}' to client {self.client_ip}")
+        return [_sse_message(self.last_status, events[-1][0])]
+
 @aggregator_bp.route('/control', methods=['GET'])
+@sse_stream
 def control_stream():
     """Stream control state using Server-Sent Events."""
-    client_ip = request.remote_addr
-    logger.info(f"Client {client_ip} connected to control SSE stream")
-    
-    def generate():
-        update_count = 0
-        last_status = None
-        
-        try:
-            # Send initial status
-            current_status = control_state.get_status()
-            logger.info(f"Sending initial status '{current_status}' to client {client_ip}")
-            yield f"data: {current_status}\n\n"
-            last_status = current_status
-            update_count += 1
-            
-            # Keep connection alive and send updates only when status changes
-            while True:
-                time.sleep(5)
-                current_status = control_state.get_status()
-                
-                if current_status != last_status:
-                    logger.info(f"Sending status update '{current_status}' to client {client_ip}")
-                    yield f"data: {current_status}\n\n"
-                    last_status = current_status
-                    update_count += 1
-                else:
-                    # Send a comment to keep the connection alive without sending data
-                    yield f": keepalive\n\n"
-        except GeneratorExit:
-            logger.info(f"Client {client_ip} disconnected from control SSE stream after {update_count} updates")
-    
-    return Response(
-        stream_with_context(generate()),
-        mimetype="text/event-stream",
-        headers={
-            "Cache-Control": "no-cache",
-            "X-Accel-Buffering": "no",
-            "Connection": "keep-alive"
-        }
-    )
+    return ControlStream()
 
 @aggregator_bp.route('/control/<action>', methods=['POST'])
 def control_collectors(action):
@@ -326,31 +513,104 @@ def register_device():
         if not data or 'name' not in data:
             return jsonify({'status': 'error', 'message': 'Device name is required'}), 400
         
-        # Check if device already exists
-        device = Device.query.filter_by(name=data['name']).first()
-        if device:
-            return jsonify({'status': 'success', 'message': 'Device already exists', 'device_id': device.id}), 409
-        
-        # Create new device
-        device = Device(
-            name=data['name'],
-            description=data.get('description')
-        )
-        db.session.add(device)
+        # Create the device unless one with this name already exists
+        device_id, created = resolver.register_device(data['name'], data.get('description'))
         db.session.commit()
         
-        logger.info(f"Registered new device: {data['name']} (ID: {device.id})")
+        if not created:
+            return jsonify({'status': 'success', 'message': 'Device already exists', 'device_id': device_id}), 409
+        
+        logger.info(f"Registered new device: {data['name']} (ID: {device_id})")
         
         return jsonify({
             'status': 'success', 
             'message': 'Device registered successfully',
-            'device_id': device.id
+            'device_id': device_id
         }), 201
     except Exception as e:
         db.session.rollback()
         logger.error(f"Error registering device: {str(e)}")
         return jsonify({'status': 'error', 'message': str(e)}), 500
 
+@aggregator_bp.route('/stats', methods=['GET'])
+def ingest_stats():
+    """Report ingest-side counters."""
+    return jsonify({
+        'catalog': resolver.stats(),
+        'write_behind': ingest_buffer.stats(),
+        'batch_dedup': batch_dedup.stats()
+    })
+
+@aggregator_bp.route('/partitions', methods=['GET'])
+def list_partitions():
+    """List the metric_values partitions."""
+    return jsonify(partitions.stats())
+
+@aggregator_bp.route('/partitions', methods=['DELETE'])
+def drop_old_partitions():
+    """Drop every partition that ends before the ?before= ISO timestamp."""
+    before = request.args.get('before')
+    if not before:
+        return jsonify({'status': 'error', 'message': 'Missing before parameter'}), 400
+    try:
+        cutoff = datetime.fromisoformat(before.replace('Z', '+00:00'))
+    except ValueError:
+        return jsonify({'status': 'error', 'message': f'Invalid timestamp: {before}'}), 400
+    
+    try:
+        dropped = partitions.drop_partitions_before(cutoff)
+        if dropped:
+            result_cache.clear()
+        return jsonify({'status': 'success', 'dropped': dropped})
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Error dropping partitions: {str(e)}", exc_info=True)
+        return jsonify({'status': 'error', 'message': str(e)}), 500
+
+@aggregator_bp.route('/compaction', methods=['GET'])
+def compaction_stats():
+    """Report retention policies and recent compaction runs."""
+    return jsonify(compaction.stats())
+
+@aggregator_bp.route('/compaction', methods=['POST'])
+def run_compaction():
+    """Run a compaction pass now."""
+    try:
+        report = compaction.run_now(current_app._get_current_object())
+    except Exception as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 500
+    if report is None:
+        return jsonify({'status': 'error', 'message': 'Compaction is already running'}), 409
+    return jsonify({'status': 'success', 'report': report.to_dict()})
+
+@aggregator_bp.route('/partitions/<name>', methods=['DELETE'])
+def drop_partition(name):
+    """Drop a single partition."""
+    try:
+        if not partitions.drop_partition(name):
+            return jsonify({'status': 'error', 'message': f'Unknown partition: {name}'}), 404
+        result_cache.clear()
+        return jsonify({'status': 'success', 'dropped': [name]})
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Error dropping partition {name}: {str(e)}", exc_info=True)
+        return jsonify({'status': 'error', 'message': str(e)}), 500
+
+@aggregator_bp.route('/archive', methods=['GET'])
+def archive_stats():
+    """List the archived chunks and the archive's size on disk."""
+    return jsonify(archive.stats())
+
+@aggregator_bp.route('/broker', methods=['GET'])
+def broker_stats():
+    """Report the SSE broker, the command log, the SSE server and the shared live state."""
+    return jsonify(dict(
+        broker.stats(),
+        command_log=command_log.stats(),
+        sse_server=sse_server.stats(),
+        live_state=live_state.stats()
+    ))
+
 # Add a new route to handle adding stocks
 @aggregator_bp.route('/add_stock', methods=['POST'])
 def add_stock():
@@ -374,8 +634,9 @@ def add_stock():
             'timestamp': datetime.utcnow().isoformat()
         }
         
-        # Store the message in the control state for SSE
-        control_state.add_command(message)
+        # Store the message in the mailbox of the stock collector, unless addressed elsewhere
+        target = mailbox(data.get('collector_id'), data.get('device_name') or 'STOCK')
+        control_state.add_command(message, target)
         
         logger.info(f"Added stock symbol to monitoring: {symbol}")
         
@@ -388,32 +649,47 @@ def add_stock():
         logger.error(f"Error adding stock: {str(e)}", exc_info=True)
         return jsonify({'status': 'error', 'message': f'Error adding stock: {str(e)}'}), 500
 
+class CommandStream(Stream):
+    """Commands of the collector's mailboxes, resumed from the command log."""
+
+    name = 'command SSE'
+
+    def __init__(self):
+        super().__init__()
+        self.last_event_id = request.headers.get('Last-Event-ID')
+        mailboxes = [mailbox(collector_id=collector_id) for collector_id in request.args.getlist('collector')]
+        mailboxes += [mailbox(device_name=device_name) for device_name in request.args.getlist('device')]
+        self.mailboxes = mailboxes or None
+
+    def open(self):
+        self.subscription, pending = control_state.subscribe_commands(self.mailboxes, self.last_event_id)
+        if not pending:
+            # Flush the response headers right away
+            return [KEEPALIVE]
+        data = json.dumps([command for _, command in pending], cls=DateTimeEncoder)
+        return [_sse_message(data, self.subscription.position, control_state.commands)]
+
+    def receive(self, events):
+        if not events:
+            return []
+        # Send the commands as SSE
+        data = json.dumps([command for _, command in events], cls=DateTimeEncoder)
+        return [_sse_message(data, events[-1][0], control_state.commands)]
+
+    def close(self):
+        if self.subscription is not None:
+            control_state.commands.unsubscribe(self.subscription)
+
 @aggregator_bp.route('/commands')
+@sse_stream
 def get_commands():
-    """Stream commands to the collector using Server-Sent Events."""
-    def generate():
-        last_command_index = 0
-        
-        while True:
-            # Check if there are new commands
-            if last_command_index < len(control_state.commands):
-                # Get all new commands
-                new_commands = control_state.commands[last_command_index:]
-                last_command_index = len(control_state.commands)
-                
-                # Send the commands as SSE
-                data = json.dumps(new_commands, cls=DateTimeEncoder)
-                yield f"data: {data}\n\n"
-            
-            # Wait before checking again
-            sleep(1)
-    
-    return Response(
-        stream_with_context(generate()),
-        mimetype='text/event-stream',
-        headers={
-            "Cache-Control": "no-cache",
-            "X-Accel-Buffering": "no",
-            "Connection": "keep-alive"
-        }
-    ) 
\ No newline at end of file
+    """
+    Stream commands to the collector using Server-Sent Events.
+
+    A collector names its mailboxes with the collector and device query
+    parameters and only gets the commands addressed to them, or to all
+    collectors; without either it gets every command. New connections get
+    the logged commands; reconnects with a known Last-Event-ID only get the
+    commands added since.
+    """
+    return CommandStream()
@@ -2,8 +2,15 @@ from flask import Blueprint, request, jsonify
 from marshmallow import Schema, fields
 from datetime import datetime, timedelta
 from sqlalchemy import func
+import numpy as np
+from ...database.archive import archive
 from ...database.database import db
-from ...database.models import Device, MetricInfo, MetricValue
+from ...database.models import Device, MetricInfo, MetricRollup
+from ...database.partitions import partitions
+from ...database.rollups import bucket_start, choose_tier
+from ...utils.config import config
+from ...utils.downsampling import downsample
+from ..result_cache import result_cache
 
 reporting_bp = Blueprint('reporting', __name__)
 
@@ -24,33 +31,194 @@ class MetricsSummarySchema(Schema):
 metric_report_schema = MetricReportSchema(many=True)
 metrics_summary_schema = MetricsSummarySchema(many=True)
 
+def build_device_metrics_query(device_name, start_time=None, end_time=None):
+    """Build the newest-first metrics query for one device"""
+    values = partitions.source(start_time, end_time, device_name)
+    query = db.session.query(
+        Device.name.label('device_name'),
+        MetricInfo.name.label('metric_name'),
+        values.metric_value,
+        values.timestamp
+    ).select_from(values)\
+      .join(Device, values.device_id == Device.id)\
+      .join(MetricInfo, values.metric_info_id == MetricInfo.id)\
+      .filter(Device.name == device_name)
+    
+    if start_time:
+        query = query.filter(values.timestamp >= start_time)
+    if end_time:
+        query = query.filter(values.timestamp <= end_time)
+    return query.order_by(values.timestamp.desc())
+
+def build_rollup_device_metrics_query(tier, device_name, start_time=None, end_time=None):
+    """Build the newest-first bucket averages for one device from a rollup tier"""
+    query = db.session.query(
+        Device.name.label('device_name'),
+        MetricInfo.name.label('metric_name'),
+        (MetricRollup.value_sum / MetricRollup.value_count).label('metric_value'),
+        MetricRollup.bucket_start.label('timestamp')
+    ).select_from(MetricRollup)\
+      .join(Device, MetricRollup.device_id == Device.id)\
+      .join(MetricInfo, MetricRollup.metric_info_id == MetricInfo.id)\
+      .filter(MetricRollup.tier == tier)\
+      .filter(Device.name == device_name)
+    
+    if start_time:
+        query = query.filter(MetricRollup.bucket_start >= bucket_start(start_time, tier))
+    if end_time:
+        query = query.filter(MetricRollup.bucket_start <= end_time)
+    return query.order_by(MetricRollup.bucket_start.desc())
+
+def build_rollup_summary_query(tier, start_time):
+    """Build the per device and metric summary query since start_time from a rollup tier"""
+    return db.session.query(
+        Device.name.label('device_name'),
+        MetricInfo.name.label('metric_name'),
+        (func.sum(MetricRollup.value_sum) / func.sum(MetricRollup.value_count)).label('avg_value'),
+        func.min(MetricRollup.value_min).label('min_value'),
+        func.max(MetricRollup.value_max).label('max_value'),
+        func.max(MetricRollup.last_time).label('last_updated'),
+        func.sum(MetricRollup.value_count).label('count')
+    ).select_from(MetricRollup)\
+    .join(Device, MetricRollup.device_id == Device.id)\
+    .join(MetricInfo, MetricRollup.metric_info_id == MetricInfo.id)\
+    .filter(MetricRollup.tier == tier)\
+    .filter(MetricRollup.bucket_start >= bucket_start(start_time, tier))\
+    .group_by(Device.name, MetricInfo.name)
+
+def build_summary_query(start_time, tier=None):
+    """Build the per device and metric summary query since start_time"""
+    if tier:
+        return build_rollup_summary_query(tier, start_time)
+    values = partitions.source(start_time)
+    return db.session.query(
+        Device.name.label('device_name'),
+        MetricInfo.name.label('metric_name'),
+        func.avg(values.metric_value).label('avg_value'),
+        func.min(values.metric_value).label('min_value'),
+        func.max(values.metric_value).label('max_value'),
+        func.max(values.timestamp).label('last_updated'),
+        func.count(values.id).label('count')
+    ).select_from(values)\
+    .join(Device, values.device_id == Device.id)\
+    .join(MetricInfo, values.metric_info_id == MetricInfo.id)\
+    .filter(values.timestamp >= start_time)\
+    .group_by(Device.name, MetricInfo.name)
+
+def downsample_rows(rows, max_points):
+    """Downsample newest-first metric rows to max_points per metric, keeping the order"""
+    series = {}
+    for row in reversed(rows):
+        points = series.setdefault(row['metric_name'], ([], []))
+        points[0].append(row['timestamp'])
+        points[1].append(row['metric_value'])
+    
+    timestamps, values, metric_names = [], [], []
+    for metric_name, (series_timestamps, series_values) in series.items():
+        kept_timestamps, kept_values = downsample(
+            np.array(series_timestamps, dtype='datetime64[us]'),
+            np.array(series_values, dtype=np.float64),
+            max_points,
+            config.web.downsampling
+        )
+        timestamps.append(kept_timestamps)
+        values.append(kept_values)
+        metric_names.extend([metric_name] * len(kept_values))
+    if not timestamps:
+        return []
+    
+    timestamps, values = np.concatenate(timestamps), np.concatenate(values)
+    order = np.argsort(timestamps, kind='stable')[::-1]
+    device_name = rows[0]['device_name']
+    return [
+        {
+            'device_name': device_name,
+            'metric_name': metric_names[index],
+            'metric_value': value,
+            'timestamp': timestamp
+        }
+        for index, timestamp, value in zip(order.tolist(), timestamps[order].tolist(), values[order].tolist())
+    ]
+
+def archived_device_metrics(device_name, start_time=None, end_time=None):
+    """Read one device's archived values in a range as newest-first rows"""
+    if not archive.overlaps(start_time, end_time):
+        return []
+    device_id = db.session.query(Device.id).filter(Device.name == device_name).scalar()
+    if device_id is None:
+        return []
+    
+    timestamps, values, metric_ids = [], [], []
+    for _, metric_info_id in archive.series(device_id):
+        series_timestamps, series_values = archive.read(device_id, metric_info_id, start_time, end_time)
+        if series_timestamps.size:
+            timestamps.append(series_timestamps)
+            values.append(series_values)
+            metric_ids.append(np.full(series_timestamps.size, metric_info_id))
+    if not timestamps:
+        return []
+    
+    # Merge the series newest first
+    timestamps, values, metric_ids = np.concatenate(timestamps), np.concatenate(values), np.concatenate(metric_ids)
+    order = np.argsort(timestamps, kind='stable')[::-1]
+    metric_names = dict(db.session.query(MetricInfo.id, MetricInfo.name).all())
+    return [
+        {
+            'device_name': device_name,
+            'metric_name': metric_names.get(metric_info_id),
+            'metric_value': value,
+            'timestamp': timestamp
+        }
+        for timestamp, value, metric_info_id in zip(
+            timestamps[order].tolist(), values[order].tolist(), metric_ids[order].tolist()
+        )
+    ]
+
+def archived_summaries(start_time):
+    """Summarize every archived series since start_time, keyed by (device name, metric name)"""
+    if not archive.overlaps(start_time):
+        return {}
+    device_names = dict(db.session.query(Device.id, Device.name).all())
+    metric_names = dict(db.session.query(MetricInfo.id, MetricInfo.name).all())
+    summaries = {}
+    for device_id, metric_info_id in archive.series():
+        summary = archive.summarize(device_id, metric_info_id, start_time)
+        if summary and device_id in device_names and metric_info_id in metric_names:
+            summaries[(device_names[device_id], metric_names[metric_info_id])] = summary
+    return summaries
+
 @reporting_bp.route('/metrics/<device_name>', methods=['GET'])
 def get_device_metrics(device_name):
     # Get query parameters
     start_time = request.args.get('start_time', type=lambda x: datetime.fromisoformat(x) if x else None)
     end_time = request.args.get('end_time', type=lambda x: datetime.fromisoformat(x) if x else None)
+    # Optional seconds per point; buckets from the coarsest rollup tier that fits are returned instead of raw values
+    resolution = request.args.get('resolution', type=float)
+    # Optional points per metric; longer series are downsampled
+    max_points = request.args.get('max_points', type=int)
     
-    # Build query
-    query = db.session.query(MetricValue, Device).join(Device)
-    query = query.filter(Device.name == device_name)
-    
-    if start_time:
-        query = query.filter(MetricValue.timestamp >= start_time)
-    if end_time:
-        query = query.filter(MetricValue.timestamp <= end_time)
-    
-    results = query.order_by(MetricValue.timestamp.desc()).all()
+    tier = choose_tier(start_time, end_time, resolution) if resolution else None
+    if tier:
+        query = build_rollup_device_metrics_query(tier, device_name, start_time, end_time)
+    else:
+        query = build_device_metrics_query(device_name, start_time, end_time)
+    results = query.all()
     
     # Format results
     metrics_data = [
         {
-            'device_name': device.name,
-            'metric_name': metric.metric_name,
-            'metric_value': metric.metric_value,
-            'timestamp': metric.timestamp
+            'device_name': result.device_name,
+            'metric_name': result.metric_name,
+            'metric_value': result.metric_value,
+            'timestamp': result.timestamp
         }
-        for metric, device in results
+        for result in results
     ]
+    if not tier:
+        # Archived values are older than anything still in the database
+        metrics_data.extend(archived_device_metrics(device_name, start_time, end_time))
+    if max_points:
+        metrics_data = downsample_rows(metrics_data, max_points)
     
     return jsonify(metric_report_schema.dump(metrics_data))
 
@@ -60,24 +228,21 @@ def get_metrics_summary():
     time_range = request.args.get('time_range', default=24, type=int)
     start_time = datetime.utcnow() - timedelta(hours=time_range)
     
-    # Build query
-    results = db.session.query(
-        Device.name.label('device_name'),
-        MetricInfo.name.label('metric_name'),
-        func.avg(MetricValue.metric_value).label('avg_value'),
-        func.min(MetricValue.metric_value).label('min_value'),
-        func.max(MetricValue.metric_value).label('max_value'),
-        func.max(MetricValue.timestamp).label('last_updated'),
-        func.count(MetricValue.id).label('count')
-    ).join(Device)\
-    .join(MetricInfo)\
-    .filter(MetricValue.timestamp >= start_time)\
-    .group_by(Device.name, MetricInfo.name)\
-    .all()
+    # Viewers asking for the same range share one computed summary
+    summary_data = result_cache.get_or_compute(
+        'summary', lambda: summarize_metrics(start_time), start_time=start_time, live=True
+    )
+    
+    return jsonify(metrics_summary_schema.dump(summary_data))
+
+def summarize_metrics(start_time):
+    """Summary rows of every series since start_time, including archived values"""
+    tier = choose_tier(start_time, datetime.utcnow())
+    results = build_summary_query(start_time, tier).all()
     
     # Format results
-    summary_data = [
-        {
+    summary_data = {
+        (result.device_name, result.metric_name): {
             'device_name': result.device_name,
             'metric_name': result.metric_name,
             'avg_value': float(result.avg_value),
@@ -87,6 +252,27 @@ def get_metrics_summary():
             'count': result.count
         }
         for result in results
-    ]
+    }
     
-    return jsonify(metrics_summary_schema.dump(summary_data)) 
\ No newline at end of file
+    # Raw summaries also cover values that were moved to the archive
+    if not tier:
+        for key, archived in archived_summaries(start_time).items():
+            summary = summary_data.get(key)
+            if summary is None:
+                summary_data[key] = {
+                    'device_name': key[0],
+                    'metric_name': key[1],
+                    'avg_value': archived['sum'] / archived['count'],
+                    'min_value': archived['min'],
+                    'max_value': archived['max'],
+                    'last_updated': archived['last_updated'],
+                    'count': archived['count']
+                }
+                continue
+            count = summary['count'] + archived['count']
+            summary['avg_value'] = (summary['avg_value'] * summary['count'] + archived['sum']) / count
+            summary['min_value'] = min(summary['min_value'], archived['min'])
+            summary['max_value'] = max(summary['max_value'], archived['max'])
+            summary['count'] = count
+    return list(summary_data.values())
+ 
\ No newline at end of file
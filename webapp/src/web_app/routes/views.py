@@ -1,15 +1,29 @@
-from flask import Blueprint, render_template, Response, stream_with_context, request, jsonify, redirect, url_for
-from sqlalchemy import func
+from flask import Blueprint, render_template, request, jsonify, redirect, url_for
+from sqlalchemy import func, tuple_
 from datetime import datetime, timedelta
+from ...database.archive import archive
 from ...database.database import db
-from ...database.models import Device, MetricInfo, MetricValue
+from ...database.models import Device, MetricInfo, MetricRollup
+from ...database.partitions import partitions
+from ...database.rollups import TIERS, bucket_start, choose_tier
+from ...utils.config import config
+from ...utils.downsampling import downsample
 from ...utils.logging_config import setup_logger
+from ..pagination import NEXT, PREV, TOTAL_MODES, CursorError, count_total, decode_cursor, encode_cursor
+from ..result_cache import result_cache
+from ..broker import broker, METRICS
+from ..sse_server import Stream, sse_stream
+from ..series_cache import bucket_means, series_cache
 import json
 import time
 import random
+import numpy as np
 
 logger = setup_logger('views')
 
+# How far back a live stream looks for series that appeared after its snapshot
+NEW_SERIES_LOOKBACK = np.timedelta64(300, 's')
+
 views_bp = Blueprint('views', __name__, template_folder='../templates')
 
 @views_bp.route('/')
@@ -40,9 +54,10 @@ def get_metrics():
         if not device_name:
             metrics = db.session.query(MetricInfo.name).distinct().all()
         else:
+            values = partitions.source(device_name=device_name)
             metrics = db.session.query(MetricInfo.name)\
-                .join(MetricValue)\
-                .join(Device)\
+                .join(values, values.metric_info_id == MetricInfo.id)\
+                .join(Device, values.device_id == Device.id)\
                 .filter(Device.name == device_name)\
                 .distinct().all()
         
@@ -55,43 +70,198 @@ def get_metrics():
 
 @views_bp.route('/api/metric-values')
 def get_metric_values():
-    """Get paginated metric values"""
-    page = request.args.get('page', 1, type=int)
+    """Get metric values a page at a time, newest first, with cursors for the older and newer pages"""
     per_page = request.args.get('per_page', 10, type=int)
     device_name = request.args.get('device')
     metric_name = request.args.get('metric')
+    total_mode = request.args.get('total', 'approx')
+    if total_mode not in TOTAL_MODES:
+        return jsonify({'error': f"Unknown total mode '{total_mode}'. Choose one of: {', '.join(TOTAL_MODES)}"}), 400
     
+    try:
+        return jsonify(paginate_metric_values(
+            device_name, metric_name, per_page=per_page, cursor=request.args.get('cursor'), total_mode=total_mode
+        ))
+    except CursorError as e:
+        return jsonify({'error': str(e)}), 400
+
+def build_metric_values_query(device_name=None, metric_name=None, start_time=None, end_time=None,
+                              before=None, after=None, limit=None):
+    """
+    Build the newest-first metric values table query with optional filters.
+
+    before/after take a (timestamp, id) cursor; rows after a cursor are
+    returned oldest first. With limit every partition is cut to that many
+    rows before the results are merged.
+    """
+    values = partitions.source(start_time, end_time, device_name, metric_name, before, after, limit)
     query = db.session.query(
         Device.name.label('device_name'),
         MetricInfo.name.label('metric_name'),
-        MetricValue.metric_value,
-        MetricValue.timestamp
-    ).join(Device, MetricValue.device_id == Device.id)\
-      .join(MetricInfo, MetricValue.metric_info_id == MetricInfo.id)
+        values.metric_value,
+        values.timestamp,
+        values.id
+    ).select_from(values)\
+      .join(Device, values.device_id == Device.id)\
+      .join(MetricInfo, values.metric_info_id == MetricInfo.id)
     
+    if start_time:
+        query = query.filter(values.timestamp >= start_time)
+    if end_time:
+        query = query.filter(values.timestamp <= end_time)
     if device_name:
         query = query.filter(Device.name == device_name)
     if metric_name:
         query = query.filter(MetricInfo.name == metric_name)
+    if before:
+        query = query.filter(tuple_(values.timestamp, values.id) < tuple_(*before))
+    if after:
+        query = query.filter(tuple_(values.timestamp, values.id) > tuple_(*after))
+        query = query.order_by(values.timestamp, values.id)
+    else:
+        query = query.order_by(values.timestamp.desc(), values.id.desc())
+    if limit:
+        query = query.limit(limit)
+    return query
+
+def paginate_metric_values(device_name=None, metric_name=None, start_time=None, end_time=None,
+                           per_page=10, cursor=None, total_mode='approx', live=False):
+    """
+    One keyset page of metric values, newest first.
+
+    Pages are addressed by opaque cursors holding the (timestamp, id) of a
+    boundary row, so every page costs the same as the first. Totals are
+    estimated or cached according to total_mode. Pages are shared through
+    the result cache; live marks a range that ends now.
+    """
+    return result_cache.get_or_compute(
+        'metric_values',
+        lambda: _paginate_metric_values(device_name, metric_name, start_time, end_time, per_page, cursor, total_mode),
+        device_name, metric_name, start_time, end_time, (per_page, cursor, total_mode), live
+    )
+
+def _paginate_metric_values(device_name, metric_name, start_time, end_time, per_page, cursor, total_mode):
+    direction, position = decode_cursor(cursor) if cursor else (NEXT, None)
+    before = position if direction == NEXT else None
+    after = position if direction == PREV else None
     
-    total = query.count()
-    values = query.order_by(MetricValue.timestamp.desc())\
-        .offset((page - 1) * per_page)\
-        .limit(per_page)\
-        .all()
+    rows = build_metric_values_query(device_name, metric_name, start_time, end_time, before, after, per_page + 1).all()
+    more = len(rows) > per_page
+    rows = rows[:per_page]
+    if after:
+        if not more:
+            # Reached the newest rows, which is simply the first page
+            return _paginate_metric_values(device_name, metric_name, start_time, end_time, per_page, None, total_mode)
+        rows.reverse()
     
-    return jsonify({
+    has_older = more if direction == NEXT else True
+    has_newer = position is not None
+    total, estimated = count_total(
+        lambda: build_metric_values_query(device_name, metric_name, start_time, end_time).order_by(None).count(),
+        total_mode, device_name, metric_name, start_time, end_time
+    )
+    
+    return {
         'total': total,
-        'page': page,
+        'total_estimated': estimated,
+        'total_pages': (total + per_page - 1) // per_page if total is not None else None,
         'per_page': per_page,
-        'total_pages': (total + per_page - 1) // per_page,
+        'next_cursor': encode_cursor(rows[-1].timestamp, rows[-1].id, NEXT) if rows and has_older else None,
+        'prev_cursor': encode_cursor(rows[0].timestamp, rows[0].id, PREV) if rows and has_newer else None,
         'data': [{
-            'device_name': value.device_name,
-            'metric_name': value.metric_name,
-            'value': float(value.metric_value),
-            'timestamp': value.timestamp.strftime('%Y-%m-%d %H:%M:%S')
-        } for value in values]
-    })
+            'device_name': row.device_name,
+            'metric_name': row.metric_name,
+            'value': float(row.metric_value),
+            'timestamp': row.timestamp.strftime('%Y-%m-%d %H:%M:%S')
+        } for row in rows]
+    }
+
+def build_rollup_time_series_query(tier, start_time, end_time, device_name=None, metric_name=None):
+    """
+    Build the dashboard time series query over one rollup tier, one averaged point per bucket.
+
+    The bucket aggregates and last values are returned too, so the series summary
+    and current value need no second query.
+    """
+    query = db.session.query(
+        Device.name,
+        MetricInfo.name.label('metric_name'),
+        (MetricRollup.value_sum / MetricRollup.value_count).label('metric_value'),
+        MetricRollup.bucket_start.label('timestamp'),
+        MetricRollup.value_sum,
+        MetricRollup.value_count,
+        MetricRollup.value_min,
+        MetricRollup.value_max,
+        MetricRollup.last_time,
+        MetricRollup.last_value
+    ).select_from(MetricRollup)\
+      .join(Device, MetricRollup.device_id == Device.id)\
+      .join(MetricInfo, MetricRollup.metric_info_id == MetricInfo.id)\
+      .filter(MetricRollup.tier == tier)\
+      .filter(MetricRollup.bucket_start >= bucket_start(start_time, tier))\
+      .filter(MetricRollup.bucket_start <= end_time)
+    
+    if device_name:
+        query = query.filter(Device.name == device_name)
+    if metric_name:
+        query = query.filter(MetricInfo.name == metric_name)
+    return query.order_by(Device.name, MetricInfo.name, MetricRollup.bucket_start)
+
+def build_time_series_query(start_time, end_time, device_name=None, metric_name=None, tier=None):
+    """Build the dashboard time series query, from a rollup tier when one is given"""
+    if tier:
+        return build_rollup_time_series_query(tier, start_time, end_time, device_name, metric_name)
+    values = partitions.source(start_time, end_time, device_name, metric_name)
+    query = db.session.query(
+        Device.name,
+        MetricInfo.name.label('metric_name'),
+        values.metric_value,
+        values.timestamp
+    ).select_from(values)\
+      .join(Device, values.device_id == Device.id)\
+      .join(MetricInfo, values.metric_info_id == MetricInfo.id)\
+      .filter(values.timestamp >= start_time)
+    if end_time:
+        query = query.filter(values.timestamp <= end_time)
+    
+    # Apply filters if provided
+    if device_name:
+        query = query.filter(Device.name == device_name)
+    if metric_name:
+        query = query.filter(MetricInfo.name == metric_name)
+    return query.order_by(Device.name, MetricInfo.name, values.timestamp)
+
+def parse_date_range(start_date, end_date):
+    """
+    Turn the start_date/end_date filter strings into a range, the last 24 hours by default.
+
+    Returns:
+        tuple: (start_time, end_time, live), live meaning the range ends now and follows new data
+    """
+    # Ranges without an end follow the newest data
+    live = not end_date
+    
+    # Convert string dates to datetime objects
+    try:
+        if start_date:
+            start_time = datetime.fromisoformat(start_date.replace('Z', '+00:00'))
+        else:
+            start_time = datetime.utcnow() - timedelta(hours=24)
+            
+        if end_date:
+            end_time = datetime.fromisoformat(end_date.replace('Z', '+00:00'))
+        else:
+            end_time = datetime.utcnow()
+    except ValueError as e:
+        logger.error(f"Invalid date format: {e}")
+        start_time = datetime.utcnow() - timedelta(hours=24)
+        end_time = datetime.utcnow()
+        live = True
+    
+    # Ensure start_time is before end_time
+    if start_time > end_time:
+        start_time, end_time = end_time, start_time
+    return start_time, end_time, live
 
 def get_metrics_data(device_name=None, metric_name=None):
     """Get metrics data for the dashboard"""
@@ -99,154 +269,18 @@ def get_metrics_data(device_name=None, metric_name=None):
         # Get date range from request parameters
         start_date = request.args.get('start_date')
         end_date = request.args.get('end_date')
-        
-        # Convert string dates to datetime objects
-        try:
-            if start_date:
-                start_time = datetime.fromisoformat(start_date.replace('Z', '+00:00'))
-            else:
-                start_time = datetime.utcnow() - timedelta(hours=24)
-                
-            if end_date:
-                end_time = datetime.fromisoformat(end_date.replace('Z', '+00:00'))
-            else:
-                end_time = datetime.utcnow()
-        except ValueError as e:
-            logger.error(f"Invalid date format: {e}")
-            start_time = datetime.utcnow() - timedelta(hours=24)
-            end_time = datetime.utcnow()
-        
-        # Ensure start_time is before end_time
-        if start_time > end_time:
-            start_time, end_time = end_time, start_time
+        # Points per chart series, usually the chart width in pixels
+        max_points = request.args.get('max_points', default=config.web.chart_points, type=int)
+        start_time, end_time, live = parse_date_range(start_date, end_date)
         
         logger.info(f"Fetching metrics from {start_time} to {end_time}")
         
-        # Check if we have any metrics in the database
-        total_metrics = db.session.query(MetricValue).count()
-        logger.info(f"Total metrics in database: {total_metrics}")
-        
-        # Base query for time series
-        time_series_query = db.session.query(
-            Device.name,
-            MetricInfo.name.label('metric_name'),
-            MetricValue.metric_value,
-            MetricValue.timestamp
-        ).join(Device, MetricValue.device_id == Device.id)\
-          .join(MetricInfo, MetricValue.metric_info_id == MetricInfo.id)\
-          .filter(MetricValue.timestamp >= start_time)\
-          .filter(MetricValue.timestamp <= end_time)
-        
-        # Apply filters if provided
-        if device_name:
-            logger.info(f"Filtering time series by device: {device_name}")
-            time_series_query = time_series_query.filter(Device.name == device_name)
-        if metric_name:
-            logger.info(f"Filtering time series by metric: {metric_name}")
-            time_series_query = time_series_query.filter(MetricInfo.name == metric_name)
-        
-        # Log the SQL query for debugging
-        logger.info(f"Time series query: {str(time_series_query)}")
-        
-        time_series = time_series_query.order_by(
-            Device.name, MetricInfo.name, MetricValue.timestamp
-        ).all()
-        
-        logger.info(f"Retrieved {len(time_series)} time series data points")
-
-        # Base query for summary metrics
-        summary_query = db.session.query(
-            Device.name,
-            MetricInfo.name.label('metric_name'),
-            func.avg(MetricValue.metric_value).label('avg_value'),
-            func.min(MetricValue.metric_value).label('min_value'),
-            func.max(MetricValue.metric_value).label('max_value'),
-            func.max(MetricValue.timestamp).label('last_updated')
-        ).join(Device, MetricValue.device_id == Device.id)\
-          .join(MetricInfo, MetricValue.metric_info_id == MetricInfo.id)\
-          .filter(MetricValue.timestamp >= start_time)\
-          .filter(MetricValue.timestamp <= end_time)
-        
-        # Apply filters if provided
-        if device_name:
-            logger.info(f"Filtering summary by device: {device_name}")
-            summary_query = summary_query.filter(Device.name == device_name)
-        if metric_name:
-            logger.info(f"Filtering summary by metric: {metric_name}")
-            summary_query = summary_query.filter(MetricInfo.name == metric_name)
-        
-        # Log the SQL query for debugging
-        logger.info(f"Summary query: {str(summary_query)}")
-        
-        summary_metrics = summary_query.group_by(Device.name, MetricInfo.name).all()
-        
-        logger.info(f"Retrieved {len(summary_metrics)} summary metrics")
-
-        # Organize metrics by device and metric name
-        metrics = {}
-        
-        # First, organize time series data
-        for record in time_series:
-            if record.name not in metrics:
-                metrics[record.name] = {}
-            if record.metric_name not in metrics[record.name]:
-                metrics[record.name][record.metric_name] = {
-                    'timestamps': [],
-                    'values': []
-                }
-            metrics[record.name][record.metric_name]['timestamps'].append(
-                record.timestamp.strftime('%Y-%m-%d %H:%M:%S')
-            )
-            metrics[record.name][record.metric_name]['values'].append(
-                float(record.metric_value)
-            )
-
-        # Then add summary data
-        for summary in summary_metrics:
-            if summary.name not in metrics:
-                metrics[summary.name] = {}
-            if summary.metric_name not in metrics[summary.name]:
-                # If we have summary data but no time series data, create empty arrays
-                metrics[summary.name][summary.metric_name] = {
-                    'timestamps': [],
-                    'values': []
-                }
-            
-            # Get the most recent value
-            current_value = metrics[summary.name][summary.metric_name]['values'][-1] \
-                if metrics[summary.name][summary.metric_name]['values'] else 0.0
-            
-            # Ensure all values are floats
-            metrics[summary.name][summary.metric_name].update({
-                'current_value': float(current_value),
-                'avg_value': float(summary.avg_value) if summary.avg_value is not None else 0.0,
-                'min_value': float(summary.min_value) if summary.min_value is not None else 0.0,
-                'max_value': float(summary.max_value) if summary.max_value is not None else 100.0,
-                'last_updated': summary.last_updated.strftime('%Y-%m-%d %H:%M:%S') if summary.last_updated else datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
-            })
-        
-        # If no metrics were found AND there are no metrics in the database, create a dummy entry for demonstration
-        if not metrics and total_metrics == 0:
-            logger.warning("No metrics found in database, creating dummy data for demonstration")
-            now = datetime.utcnow()
-            timestamps = [(now - timedelta(minutes=i)).strftime('%Y-%m-%d %H:%M:%S') for i in range(10, 0, -1)]
-            
-            metrics = {
-                "Demo Device": {
-                    "CPU Usage": {
-                        "timestamps": timestamps,
-                        "values": [random.randint(10, 90) for _ in range(10)],
-                        "current_value": 50.0,
-                        "avg_value": 50.0,
-                        "min_value": 10.0,
-                        "max_value": 90.0,
-                        "last_updated": now.strftime('%Y-%m-%d %H:%M:%S')
-                    }
-                }
-            }
-        elif not metrics:
-            # If we have metrics in the database but none match our filters
-            logger.warning("No metrics match the current filters, but metrics exist in the database")
+        # Viewers with the same filters share one computed result
+        metrics = result_cache.get_or_compute(
+            'dashboard_metrics',
+            lambda: _load_metrics_data(start_time, end_time, device_name, metric_name, max_points),
+            device_name, metric_name, start_time, end_time, (max_points,), live
+        )
         
         logger.info(f"Retrieved metrics for {len(metrics)} devices")
         return metrics
@@ -256,6 +290,180 @@ def get_metrics_data(device_name=None, metric_name=None):
         # Return empty data structure with proper format
         return {}
 
+def _load_metrics_data(start_time, end_time, device_name, metric_name, max_points):
+    """Compute the dashboard metrics structure for a range"""
+    # Read from the coarsest rollup tier that still gives enough points for the range
+    tier = choose_tier(start_time, end_time, (end_time - start_time).total_seconds() / max(max_points, 1))
+    
+    # Ranges held by the in-memory ring buffers are served without a query; the rings never hold archived values
+    cached_series = None
+    if tier or not archive.overlaps(start_time, end_time):
+        cached_series = series_cache.query(start_time, end_time, device_name, metric_name, tier)
+    if cached_series is not None:
+        logger.info(f"Dashboard data source: series cache ({tier or 'raw'})")
+        metrics = _metrics_from_series(cached_series, tier, max_points)
+    else:
+        logger.info(f"Dashboard data source: {tier or 'raw'}")
+        metrics = _query_metrics_data(start_time, end_time, device_name, metric_name, tier, max_points)
+    
+    # If no metrics were found AND there are no metrics in the database, create a dummy entry for demonstration
+    if not metrics and not partitions.has_rows():
+        logger.warning("No metrics found in database, creating dummy data for demonstration")
+        now = datetime.utcnow()
+        timestamps = [(now - timedelta(minutes=i)).strftime('%Y-%m-%d %H:%M:%S') for i in range(10, 0, -1)]
+        
+        metrics = {
+            "Demo Device": {
+                "CPU Usage": {
+                    "timestamps": timestamps,
+                    "values": [random.randint(10, 90) for _ in range(10)],
+                    "current_value": 50.0,
+                    "avg_value": 50.0,
+                    "min_value": 10.0,
+                    "max_value": 90.0,
+                    "last_updated": now.strftime('%Y-%m-%d %H:%M:%S')
+                }
+            }
+        }
+    elif not metrics:
+        # If we have metrics in the database but none match our filters
+        logger.warning("No metrics match the current filters, but metrics exist in the database")
+    
+    return metrics
+
+def _format_timestamps(timestamps):
+    """Format datetime64 timestamps the way the dashboard expects them"""
+    return np.char.replace(np.datetime_as_string(timestamps, unit='s'), 'T', ' ').tolist()
+
+def _series_entry(timestamps, values, max_points, current_value, avg_value, min_value, max_value, last_updated):
+    """Dashboard entry for one series: its chart downsampled to max_points and its summary"""
+    chart_timestamps, chart_values = downsample(timestamps, values, max_points, config.web.downsampling)
+    return {
+        'timestamps': _format_timestamps(chart_timestamps),
+        'values': chart_values.tolist(),
+        'current_value': float(current_value),
+        'avg_value': float(avg_value),
+        'min_value': float(min_value),
+        'max_value': float(max_value),
+        'last_updated': _format_timestamps(np.asarray(last_updated, dtype='datetime64[us]')[None])[0]
+    }
+
+def _metrics_from_series(series, tier=None, max_points=None):
+    """Build the dashboard metrics structure from cached (timestamps, values) arrays"""
+    metrics = {}
+    for (device, metric_name), (timestamps, values) in series.items():
+        # Summaries cover every point; charts get one averaged point per tier bucket like the rollup queries
+        chart_timestamps, chart_values = bucket_means(timestamps, values, TIERS[tier]) if tier else (timestamps, values)
+        metrics.setdefault(device, {})[metric_name] = _series_entry(
+            chart_timestamps, chart_values, max_points,
+            values[-1], values.mean(), values.min(), values.max(), timestamps[-1]
+        )
+    return metrics
+
+def _query_metrics_data(start_time, end_time, device_name, metric_name, tier, max_points=None):
+    """
+    Build the dashboard metrics structure from a single time series query.
+
+    Rows come back sorted by series, so each series is a contiguous run of
+    the fetched columns and its summary is computed with reduceat instead of
+    a second GROUP BY query. Raw ranges reaching into the columnar archive
+    get the archived values merged in front of the database rows.
+    """
+    archived = {} if tier else _archived_series(start_time, end_time, device_name, metric_name)
+    if device_name:
+        logger.info(f"Filtering time series by device: {device_name}")
+    if metric_name:
+        logger.info(f"Filtering time series by metric: {metric_name}")
+    time_series_query = build_time_series_query(start_time, end_time, device_name, metric_name, tier)
+    
+    # Log the SQL query for debugging
+    logger.info(f"Time series query: {str(time_series_query)}")
+    
+    rows = time_series_query.all()
+    
+    logger.info(f"Retrieved {len(rows)} time series data points")
+    if archived:
+        return _metrics_from_series(_merge_archived(archived, rows), None, max_points)
+    if not rows:
+        return {}
+    
+    columns = list(zip(*rows))
+    devices, metric_names = columns[0], columns[1]
+    values = np.array(columns[2], dtype=np.float64)
+    timestamps = np.array(columns[3], dtype='datetime64[us]')
+    
+    # Start and end index of each (device, metric) run
+    starts = [0] + [
+        index for index in range(1, len(rows))
+        if devices[index] != devices[index - 1] or metric_names[index] != metric_names[index - 1]
+    ]
+    ends = starts[1:] + [len(rows)]
+    offsets = np.array(starts)
+    
+    if tier:
+        # Combine the bucket aggregates, as the rollup summary query would
+        avg_values = np.add.reduceat(np.array(columns[4], dtype=np.float64), offsets) \
+            / np.add.reduceat(np.array(columns[5], dtype=np.float64), offsets)
+        min_values = np.minimum.reduceat(np.array(columns[6], dtype=np.float64), offsets)
+        max_values = np.maximum.reduceat(np.array(columns[7], dtype=np.float64), offsets)
+        last_updated = np.maximum.reduceat(np.array(columns[8], dtype='datetime64[us]'), offsets)
+        # Buckets are sorted by start, so a series' newest reading is its last bucket's last value
+        current_values = np.array(columns[9], dtype=np.float64)[np.array(ends) - 1]
+    else:
+        avg_values = np.add.reduceat(values, offsets) / np.diff(np.append(offsets, len(rows)))
+        min_values = np.minimum.reduceat(values, offsets)
+        max_values = np.maximum.reduceat(values, offsets)
+        last_updated = timestamps[np.array(ends) - 1]
+        current_values = values[np.array(ends) - 1]
+    
+    metrics = {}
+    for index, (start, end) in enumerate(zip(starts, ends)):
+        metrics.setdefault(devices[start], {})[metric_names[start]] = _series_entry(
+            timestamps[start:end], values[start:end], max_points,
+            current_values[index], avg_values[index], min_values[index], max_values[index], last_updated[index]
+        )
+    return metrics
+
+def _archived_series(start_time, end_time, device_name, metric_name):
+    """Archived (timestamps, values) of the matching series in a range, keyed by (device name, metric name)"""
+    if not archive.overlaps(start_time, end_time):
+        return {}
+    devices = db.session.query(Device.id, Device.name)
+    if device_name:
+        devices = devices.filter(Device.name == device_name)
+    device_names = dict(devices.all())
+    metric_names = dict(db.session.query(MetricInfo.id, MetricInfo.name).all())
+    
+    series = {}
+    for device_id, metric_info_id in archive.series():
+        if device_id not in device_names or metric_info_id not in metric_names:
+            continue
+        if metric_name and metric_names[metric_info_id] != metric_name:
+            continue
+        timestamps, values = archive.read(device_id, metric_info_id, start_time, end_time)
+        if timestamps.size:
+            series[(device_names[device_id], metric_names[metric_info_id])] = (timestamps, values)
+    return series
+
+def _merge_archived(archived, rows):
+    """Append (device, metric, value, timestamp) rows to the archived arrays of their series"""
+    points = {}
+    for device, metric, value, timestamp in rows:
+        series = points.setdefault((device, metric), ([], []))
+        series[0].append(timestamp)
+        series[1].append(value)
+    
+    merged = {}
+    for key in sorted(set(archived) | set(points)):
+        timestamps, values = archived.get(key, (np.empty(0, dtype='datetime64[us]'), np.empty(0, dtype=np.float64)))
+        if key in points:
+            timestamps = np.concatenate([timestamps, np.array(points[key][0], dtype='datetime64[us]')])
+            values = np.concatenate([values, np.array(points[key][1], dtype=np.float64)])
+        # Partitions are archived oldest first, but a legacy table may still overlap them
+        order = np.argsort(timestamps, kind='stable')
+        merged[key] = (timestamps[order], values[order])
+    return merged
+
 @views_bp.route('/dashboard')
 def dashboard():
     """Render the dashboard template"""
@@ -263,16 +471,16 @@ def dashboard():
         # Check if we have any data
         device_count = db.session.query(Device).count()
         metric_count = db.session.query(MetricInfo).count()
-        value_count = db.session.query(MetricValue).count()
+        has_values = partitions.has_rows()
         
-        logger.info(f"Database status - Devices: {device_count}, Metrics: {metric_count}, Values: {value_count}")
+        logger.info(f"Database status - Devices: {device_count}, Metrics: {metric_count}, Has values: {has_values}")
         
         # Get filter parameters
         device_name = request.args.get('device', '')
         metric_name = request.args.get('metric', '')
         start_date = request.args.get('start_date')
         end_date = request.args.get('end_date')
-        page = request.args.get('page', 1, type=int)
+        cursor = request.args.get('cursor')
         per_page = request.args.get('per_page', 10, type=int)
         
         # Log the raw filter parameters
@@ -301,24 +509,20 @@ def dashboard():
         
         # Get metrics based on selected device
         if device_name:
-            # Get metrics for the selected device
-            metrics_query = db.session.query(MetricInfo.name)\
-                .join(MetricValue)\
-                .join(Device)\
-                .filter(Device.name == device_name)\
-                .distinct()
+            # Metrics of the selected device need a scan of its values, so viewers share the list
+            metrics_list = result_cache.get_or_compute(
+                'device_metric_names', lambda: _device_metric_names(device_name), device_name
+            )
         else:
             # Get all metrics
-            metrics_query = db.session.query(MetricInfo.name).distinct()
-            
-        metrics_list = [metric[0] for metric in metrics_query.all()]
+            metrics_list = [metric[0] for metric in db.session.query(MetricInfo.name).distinct().all()]
         logger.info(f"Available metrics: {metrics_list}")
         
         # Get metrics data for gauges and charts
         metrics = get_metrics_data(device_name, metric_name)
         
         # Get paginated metrics data for the table
-        paginated_metrics = get_paginated_metrics(device_name, metric_name, start_date, end_date, page, per_page)
+        paginated_metrics = get_paginated_metrics(device_name, metric_name, start_date, end_date, cursor, per_page)
         
         # Pass empty string instead of None for selected values to ensure proper template rendering
         selected_device = device_name if device_name is not None else ''
@@ -332,7 +536,6 @@ def dashboard():
             selected_device=selected_device,
             selected_metric=selected_metric,
             paginated_metrics=paginated_metrics,
-            current_page=page,
             per_page=per_page
         )
         
@@ -346,104 +549,221 @@ def dashboard():
             initial_metrics=[],
             selected_device='',
             selected_metric='',
-            paginated_metrics={'data': [], 'total': 0, 'total_pages': 0},
-            current_page=1,
+            paginated_metrics={'data': [], 'total': 0, 'total_pages': 0, 'next_cursor': None, 'prev_cursor': None},
             per_page=10
         )
 
-def get_paginated_metrics(device_name=None, metric_name=None, start_date=None, end_date=None, page=1, per_page=10):
-    """Get paginated metrics data for the table"""
+def _device_metric_names(device_name):
+    """Names of the metrics a device has values for"""
+    values = partitions.source(device_name=device_name)
+    metrics_query = db.session.query(MetricInfo.name)\
+        .join(values, values.metric_info_id == MetricInfo.id)\
+        .join(Device, values.device_id == Device.id)\
+        .filter(Device.name == device_name)\
+        .distinct()
+    return [metric[0] for metric in metrics_query.all()]
+
+def get_paginated_metrics(device_name=None, metric_name=None, start_date=None, end_date=None, cursor=None, per_page=10):
+    """Get one keyset page of metrics data for the table"""
     try:
-        # Convert string dates to datetime objects
-        try:
-            if start_date:
-                start_time = datetime.fromisoformat(start_date.replace('Z', '+00:00'))
-            else:
-                start_time = datetime.utcnow() - timedelta(hours=24)
-                
-            if end_date:
-                end_time = datetime.fromisoformat(end_date.replace('Z', '+00:00'))
-            else:
-                end_time = datetime.utcnow()
-        except ValueError as e:
-            logger.error(f"Invalid date format: {e}")
-            start_time = datetime.utcnow() - timedelta(hours=24)
-            end_time = datetime.utcnow()
-        
-        # Ensure start_time is before end_time
-        if start_time > end_time:
-            start_time, end_time = end_time, start_time
-        
-        # Build query for paginated metrics
-        query = db.session.query(
-            Device.name.label('device_name'),
-            MetricInfo.name.label('metric_name'),
-            MetricValue.metric_value,
-            MetricValue.timestamp
-        ).join(Device, MetricValue.device_id == Device.id)\
-          .join(MetricInfo, MetricValue.metric_info_id == MetricInfo.id)\
-          .filter(MetricValue.timestamp >= start_time)\
-          .filter(MetricValue.timestamp <= end_time)
+        start_time, end_time, live = parse_date_range(start_date, end_date)
         
-        # Apply filters if provided
-        if device_name:
-            query = query.filter(Device.name == device_name)
-        if metric_name:
-            query = query.filter(MetricInfo.name == metric_name)
-        
-        # Get total count for pagination
-        total = query.count()
-        
-        # Get paginated data
-        metrics_data = query.order_by(MetricValue.timestamp.desc())\
-            .offset((page - 1) * per_page)\
-            .limit(per_page)\
-            .all()
-        
-        # Format the data
-        result = {
-            'total': total,
-            'page': page,
-            'per_page': per_page,
-            'total_pages': (total + per_page - 1) // per_page,
-            'data': [{
-                'device_name': metric.device_name,
-                'metric_name': metric.metric_name,
-                'value': float(metric.metric_value),
-                'timestamp': metric.timestamp.strftime('%Y-%m-%d %H:%M:%S')
-            } for metric in metrics_data]
-        }
-        
-        return result
+        try:
+            return paginate_metric_values(device_name, metric_name, start_time, end_time, per_page, cursor, live=live)
+        except CursorError as e:
+            logger.warning(f"{e}, showing the first page")
+            return paginate_metric_values(device_name, metric_name, start_time, end_time, per_page, live=live)
     except Exception as e:
         logger.error(f"Error getting paginated metrics: {str(e)}")
-        return {'data': [], 'total': 0, 'page': page, 'per_page': per_page, 'total_pages': 0}
+        return {'data': [], 'total': 0, 'per_page': per_page, 'total_pages': 0, 'next_cursor': None, 'prev_cursor': None}
+
+class DashboardStream(Stream):
+    """
+    Dashboard chart points for one query: a snapshot, then the points newer
+    than each series' high-water mark.
+    """
+
+    name = 'dashboard metrics'
+    blocking = True
+
+    def __init__(self):
+        super().__init__()
+        self.device_name = request.args.get('device') or None
+        self.metric_name = request.args.get('metric') or None
+        max_points = request.args.get('max_points', default=config.web.chart_points, type=int)
+        self.start_time, self.end_time, self.live = parse_date_range(request.args.get('start_date'), request.args.get('end_date'))
+        self.tier = choose_tier(self.start_time, self.end_time, (self.end_time - self.start_time).total_seconds() / max(max_points, 1))
+        # Reconnects send Last-Event-ID; pages that already show the data pass ?since= instead
+        self.resume_from = _parse_event_id(request.headers.get('Last-Event-ID') or request.args.get('since'))
+        self.marks, self.default_mark = {}, self.resume_from
+        self.checked_at = None
+
+    def open(self):
+        # Subscribe before the snapshot so no change published in between is missed
+        if self.live:
+            self.subscription = broker.subscribe(METRICS)[0]
+        if self.resume_from is not None:
+            return []
+        
+        metrics = get_metrics_data(self.device_name, self.metric_name)
+        # Resend the last second of every series; the browser replaces points it already has
+        self.marks = {
+            (device, metric): np.datetime64(data['last_updated'].replace(' ', 'T'), 'us') - np.timedelta64(1, 'us')
+            for device, device_metrics in metrics.items()
+            for metric, data in device_metrics.items()
+        }
+        self.default_mark = np.datetime64(self.start_time.replace(tzinfo=None), 'us')
+        return [_sse_event('snapshot', _stream_position(self.marks, self.default_mark), {
+            'metrics': metrics,
+            'window': (self.end_time - self.start_time).total_seconds(),
+            'timestamp': datetime.utcnow().isoformat()
+        })]
+
+    def receive(self, events):
+        # A fixed range never changes, only keep the connection open
+        if not self.live:
+            return []
+        # Wake-ups for other series are skipped; unchanged values still show up once per interval
+        matching = any(
+            (self.device_name is None or metric['device'] == self.device_name)
+            and (self.metric_name is None or metric['metric'] == self.metric_name)
+            for _, event in events for metric in event
+        )
+        if not matching and self.checked_at is not None and time.monotonic() - self.checked_at < config.web.sse_interval:
+            return []
+        self.checked_at = time.monotonic()
+        
+        delta = _stream_delta(self.marks, self.default_mark, self.device_name, self.metric_name, self.tier)
+        if not delta:
+            return []
+        return [_sse_event('delta', _stream_position(self.marks, self.default_mark), {
+            'metrics': delta,
+            'timestamp': datetime.utcnow().isoformat()
+        })]
 
 @views_bp.route('/metrics/stream')
+@sse_stream
 def stream_metrics():
-    """Stream metrics updates using Server-Sent Events"""
-    device_name = request.args.get('device')
-    metric_name = request.args.get('metric')
+    """
+    Stream dashboard metrics using Server-Sent Events.
+
+    The first "snapshot" event holds the full dashboard structure. For ranges
+    that end now, "delta" events then carry only the points newer than each
+    series' high-water mark, sent as soon as ingest publishes a change. Event
+    ids are the stream's high-water mark, so a reconnecting EventSource
+    resumes through Last-Event-ID without a new snapshot; ?since= does the
+    same for a first connection.
+    """
+    return DashboardStream()
+
+def _parse_event_id(event_id):
+    """High-water mark of a Last-Event-ID header sent by a reconnecting client"""
+    if not event_id:
+        return None
+    try:
+        return np.datetime64(event_id, 'us')
+    except ValueError:
+        logger.warning(f"Ignoring invalid Last-Event-ID: {event_id}")
+        return None
+
+def _stream_position(marks, default_mark):
+    # The oldest mark, so a resumed stream may repeat points but never skips any
+    return str(min(marks.values(), default=default_mark))
+
+def _sse_event(event, event_id, data):
+    return f"id: {event_id}\nevent: {event}\ndata: {json.dumps(data)}\n\n"
+
+def _stream_delta(marks, default_mark, device_name, metric_name, tier):
+    """
+    Chart points newer than each series' mark, advancing the marks.
+
+    With a tier, the bucket holding the mark is sent again with its updated
+    mean, so the browser replaces its last point instead of appending raw
+    points to a bucketed chart.
+    """
+    width = TIERS[tier] if tier else None
+    if marks:
+        # Series without a mark appeared after the snapshot, so only recent points can be theirs
+        default_mark = max(default_mark, np.datetime64(datetime.utcnow(), 'us') - NEW_SERIES_LOOKBACK)
+    read_marks = marks
+    if width:
+        # Read whole buckets: from just before the start of the bucket holding each mark
+        width_us = np.timedelta64(int(width.total_seconds() * 1_000_000), 'us')
+        def bucket_mark(mark):
+            epoch = np.datetime64(0, 'us')
+            return epoch + (mark - epoch) // width_us * width_us - np.timedelta64(1, 'us')
+        read_marks = {key: bucket_mark(mark) for key, mark in marks.items()}
+        default_read = bucket_mark(default_mark)
+    else:
+        default_read = default_mark
     
-    @stream_with_context
-    def generate_metrics():
-        while True:
-            # Get latest metrics
-            metrics = get_metrics_data(device_name, metric_name)
-            
-            # Format the SSE data
-            data = json.dumps({
-                'metrics': metrics,
-                'timestamp': datetime.utcnow().isoformat()
-            })
-            
-            # Send the SSE message
-            yield f"data: {data}\n\n"
-            
-            # Wait before sending next update
-            time.sleep(5)  # Update every 5 seconds
+    points = series_cache.newer_than(read_marks, default_read, device_name, metric_name)
+    if points is None:
+        points = _query_points_newer_than(read_marks, default_read, device_name, metric_name)
     
-    return Response(generate_metrics(), mimetype='text/event-stream')
+    delta = {}
+    for key, (timestamps, values) in sorted(points.items()):
+        # Only series with points past their mark changed; raw charts get just those points
+        newer = timestamps > marks.get(key, default_mark)
+        if not newer.any():
+            continue
+        if not width:
+            timestamps, values = timestamps[newer], values[newer]
+        marks[key] = timestamps[-1]
+        chart_timestamps, chart_values = bucket_means(timestamps, values, width) if width else (timestamps, values)
+        delta.setdefault(key[0], {})[key[1]] = {
+            'timestamps': _format_timestamps(chart_timestamps),
+            'values': chart_values.tolist(),
+            'current_value': float(values[-1]),
+            'last_updated': _format_timestamps(timestamps[-1:])[0]
+        }
+    return delta
+
+def _query_points_newer_than(marks, default_mark, device_name, metric_name):
+    """
+    Database fallback of SeriesCache.newer_than for series the cache does not cover.
+
+    Each marked series is read from its own mark through its series index,
+    so an idle series costs one short lookup instead of widening the read
+    of every other series; series without a mark are read from default_mark.
+    """
+    points = {}
+    for (device, metric), mark in marks.items():
+        rows = build_time_series_query(mark.astype(datetime), None, device, metric).all()
+        if rows:
+            points[(device, metric)] = ([row[3] for row in rows], [row[2] for row in rows])
+    
+    for device, metric, value, timestamp in build_time_series_query(default_mark.astype(datetime), None, device_name, metric_name):
+        if (device, metric) in marks:
+            continue
+        series = points.setdefault((device, metric), ([], []))
+        series[0].append(timestamp)
+        series[1].append(value)
+    db.session.commit()
+    
+    newer = {}
+    for key, (timestamps, values) in points.items():
+        timestamps = np.array(timestamps, dtype='datetime64[us]')
+        keep = timestamps > marks.get(key, default_mark)
+        if keep.any():
+            newer[key] = (timestamps[keep], np.array(values, dtype=np.float64)[keep])
+    return newer
+
+@views_bp.route('/api/query-plans')
+def query_plans():
+    """Report the query plans of the dashboard and reporting queries"""
+    from ..query_plans import check_query_plans
+    return jsonify(check_query_plans())
+
+@views_bp.route('/api/series-cache')
+def series_cache_stats():
+    """Report the recent series cache hit rate and memory use per series"""
+    return jsonify(series_cache.stats())
+
+@views_bp.route('/api/result-cache')
+def result_cache_stats():
+    """Report the result cache hit rate and memory use per endpoint"""
+    return jsonify(result_cache.stats())
 
 @views_bp.route('/test-charts')
 def test_charts():
@@ -0,0 +1,332 @@
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, Optional, Tuple
+import numpy as np
+from ..database.database import db
+from ..database.models import Device, MetricInfo
+from ..database.partitions import partitions
+from ..database.rollups import bucket_start
+from ..utils.config import config
+from ..utils.logging_config import get_logger
+
+logger = get_logger('web_app.series_cache')
+
+TIMESTAMP_DTYPE = 'datetime64[us]'
+
+# Points allocated when a series is first seen; buffers double up to their capacity
+INITIAL_POINTS = 256
+
+# Rows fetched per round trip while warming the cache
+WARM_FETCH_ROWS = 10000
+
+SeriesKey = Tuple[str, str]  # (device name, metric name)
+
+def _to_datetime64(timestamp: datetime) -> np.datetime64:
+    # Stored timestamps carry no zone, see partitions._naive
+    return np.datetime64(timestamp.replace(tzinfo=None), 'us')
+
+class SeriesRing:
+    """
+    Fixed-capacity ring of one series' most recent points, oldest first.
+
+    Timestamps and values live in two parallel NumPy arrays. Once full, each
+    new point overwrites the oldest one and covered_from moves forward, so
+    the ring always knows from which time on it holds every point.
+    """
+
+    __slots__ = ('capacity', 'timestamps', 'values', 'head', 'size', 'covered_from')
+
+    def __init__(self, capacity: int, covered_from: np.datetime64):
+        self.capacity = capacity
+        self.timestamps = np.empty(min(capacity, INITIAL_POINTS), dtype=TIMESTAMP_DTYPE)
+        self.values = np.empty(min(capacity, INITIAL_POINTS), dtype=np.float64)
+        self.head = 0  # index of the oldest point
+        self.size = 0
+        self.covered_from = covered_from
+
+    @property
+    def nbytes(self) -> int:
+        return self.timestamps.nbytes + self.values.nbytes
+
+    def ordered(self) -> Tuple[np.ndarray, np.ndarray]:
+        """All points oldest first; a view unless the ring has wrapped."""
+        end = self.head + self.size
+        if end <= len(self.timestamps):
+            return self.timestamps[self.head:end], self.values[self.head:end]
+        wrap = end - len(self.timestamps)
+        return (
+            np.concatenate((self.timestamps[self.head:], self.timestamps[:wrap])),
+            np.concatenate((self.values[self.head:], self.values[:wrap]))
+        )
+
+    def _reset(self, timestamps: np.ndarray, values: np.ndarray):
+        length = min(self.capacity, max(len(timestamps), INITIAL_POINTS))
+        self.timestamps = np.empty(length, dtype=TIMESTAMP_DTYPE)
+        self.values = np.empty(length, dtype=np.float64)
+        self.timestamps[:len(timestamps)] = timestamps
+        self.values[:len(values)] = values
+        self.head = 0
+        self.size = len(timestamps)
+
+    def extend(self, timestamps: np.ndarray, values: np.ndarray):
+        """Add points sorted by timestamp. Points older than covered_from are ignored."""
+        keep = timestamps >= self.covered_from
+        if not keep.all():
+            timestamps, values = timestamps[keep], values[keep]
+        if not len(timestamps):
+            return
+
+        if self.size and timestamps[0] < self.timestamps[(self.head + self.size - 1) % len(self.timestamps)]:
+            # Late points: merge and rewrite, evicting the oldest if over capacity
+            current_ts, current_values = self.ordered()
+            merged_ts = np.concatenate((current_ts, timestamps))
+            order = np.argsort(merged_ts, kind='stable')
+            merged_ts, merged_values = merged_ts[order], np.concatenate((current_values, values))[order]
+            if len(merged_ts) > self.capacity:
+                self.covered_from = merged_ts[-self.capacity - 1] + np.timedelta64(1, 'us')
+                merged_ts, merged_values = merged_ts[-self.capacity:], merged_values[-self.capacity:]
+            self._reset(merged_ts, merged_values)
+            return
+
+        if len(timestamps) >= self.capacity:
+            if self.size or len(timestamps) > self.capacity:
+                evicted = timestamps[-self.capacity - 1] if len(timestamps) > self.capacity \
+                    else self.timestamps[(self.head + self.size - 1) % len(self.timestamps)]
+                self.covered_from = evicted + np.timedelta64(1, 'us')
+            self._reset(timestamps[-self.capacity:], values[-self.capacity:])
+            return
+
+        # Grow until the buffer reaches its capacity
+        length = len(self.timestamps)
+        if self.size + len(timestamps) > length and length < self.capacity:
+            current_ts, current_values = self.ordered()
+            length = min(self.capacity, max(length * 2, self.size + len(timestamps)))
+            self.timestamps = np.empty(length, dtype=TIMESTAMP_DTYPE)
+            self.values = np.empty(length, dtype=np.float64)
+            self.timestamps[:self.size] = current_ts
+            self.values[:self.size] = current_values
+            self.head = 0
+
+        overflow = self.size + len(timestamps) - length
+        if overflow > 0:
+            self.covered_from = self.timestamps[(self.head + overflow - 1) % length] + np.timedelta64(1, 'us')
+
+        start = (self.head + self.size) % length
+        first = min(len(timestamps), length - start)
+        self.timestamps[start:start + first] = timestamps[:first]
+        self.values[start:start + first] = values[:first]
+        self.timestamps[:len(timestamps) - first] = timestamps[first:]
+        self.values[:len(timestamps) - first] = values[first:]
+
+        if overflow > 0:
+            self.head = (self.head + overflow) % length
+            self.size = length
+        else:
+            self.size += len(timestamps)
+
+    def window(self, start_time: np.datetime64, end_time: np.datetime64) -> Tuple[np.ndarray, np.ndarray]:
+        """Points with start_time <= timestamp <= end_time."""
+        timestamps, values = self.ordered()
+        low = np.searchsorted(timestamps, start_time, side='left')
+        high = np.searchsorted(timestamps, end_time, side='right')
+        return timestamps[low:high], values[low:high]
+
+class SeriesCache:
+    """
+    Recent points of every (device, metric) series in per-series ring buffers.
+
+    The cache is warmed from the database at startup and then kept current by
+    the ingest endpoints, so dashboard ranges inside the buffers are answered
+    without a query. Each web process holds its own cache and only sees its
+    own ingest, so the cache stays off when several workers serve the app.
+    """
+
+    def __init__(self, capacity: int = None, warm_window: int = None, workers: int = None):
+        self.capacity = capacity if capacity is not None else config.web.series_cache_points
+        self.warm_window = warm_window or config.web.series_cache_window
+        self.workers = workers or config.web.workers
+        self._series: Dict[SeriesKey, SeriesRing] = {}
+        self._lock = threading.Lock()
+        self.warmed_from = None  # start of the warm window, set once the cache is usable
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.capacity > 0 and self.warmed_from is not None
+
+    def _ring(self, key: SeriesKey) -> SeriesRing:
+        ring = self._series.get(key)
+        if ring is None:
+            # A series first seen after warming had no points before the warm window
+            ring = self._series[key] = SeriesRing(self.capacity, self.warmed_from)
+        return ring
+
+    def warm(self):
+        """Load the last warm_window seconds of every series. Needs an app context."""
+        if self.capacity <= 0:
+            return
+        if self.workers > 1:
+            # Rows ingested through the other workers would be missing from this worker's buffers
+            logger.info(f"Series cache disabled with {self.workers} web workers")
+            return
+        started = time.perf_counter()
+        start_time = datetime.utcnow() - timedelta(seconds=self.warm_window)
+        values = partitions.source(start_time)
+        query = db.session.query(Device.name, MetricInfo.name, values.timestamp, values.metric_value)\
+            .select_from(values)\
+            .join(Device, values.device_id == Device.id)\
+            .join(MetricInfo, values.metric_info_id == MetricInfo.id)\
+            .filter(values.timestamp >= start_time)\
+            .order_by(values.timestamp)\
+            .yield_per(WARM_FETCH_ROWS)
+
+        points: Dict[SeriesKey, Tuple[list, list]] = {}
+        for device_name, metric_name, timestamp, value in query:
+            series = points.setdefault((device_name, metric_name), ([], []))
+            series[0].append(timestamp)
+            series[1].append(value)
+        db.session.commit()
+
+        with self._lock:
+            self.warmed_from = _to_datetime64(start_time)
+            self._series = {}
+            for key, (timestamps, series_values) in points.items():
+                self._ring(key).extend(
+                    np.array(timestamps, dtype=TIMESTAMP_DTYPE),
+                    np.array(series_values, dtype=np.float64)
+                )
+        logger.info(
+            f"Warmed series cache with {sum(len(series[0]) for series in points.values())} points "
+            f"of {len(points)} series in {time.perf_counter() - started:.1f}s"
+        )
+
+    def extend(self, points: Iterable[Tuple[str, str, datetime, float]]):
+        """Add ingested (device name, metric name, timestamp, value) points."""
+        if not self.enabled:
+            return
+        grouped: Dict[SeriesKey, Tuple[list, list]] = {}
+        for device_name, metric_name, timestamp, value in points:
+            series = grouped.setdefault((device_name, metric_name), ([], []))
+            series[0].append(timestamp.replace(tzinfo=None))
+            series[1].append(value)
+
+        with self._lock:
+            for key, (timestamps, values) in grouped.items():
+                timestamps = np.array(timestamps, dtype=TIMESTAMP_DTYPE)
+                values = np.array(values, dtype=np.float64)
+                if len(timestamps) > 1 and (timestamps[1:] < timestamps[:-1]).any():
+                    order = np.argsort(timestamps, kind='stable')
+                    timestamps, values = timestamps[order], values[order]
+                self._ring(key).extend(timestamps, values)
+
+    def extend_metrics(self, metrics: Iterable[dict]):
+        """Add normalized metric dicts as accepted by the ingest endpoints."""
+        self.extend(
+            (metric['device_name'], metric['metric_name'], metric['timestamp'], metric['metric_value'])
+            for metric in metrics
+        )
+
+    def forget(self, keys: Iterable[SeriesKey]):
+        """Drop the cached points of some series; only points added after this are served from memory."""
+        with self._lock:
+            for key in keys:
+                ring = self._series.get(key)
+                if ring is None or not ring.size:
+                    continue
+                newest = ring.timestamps[(ring.head + ring.size - 1) % len(ring.timestamps)]
+                self._series[key] = SeriesRing(self.capacity, newest + np.timedelta64(1, 'us'))
+
+    def query(self, start_time: datetime, end_time: datetime, device_name: str = None,
+              metric_name: str = None, tier: str = None) -> Optional[Dict[SeriesKey, Tuple[np.ndarray, np.ndarray]]]:
+        """
+        Points of every matching series in a range, or None when the range is not fully cached.
+
+        With a tier the points are read from the start of the bucket holding
+        start_time, like the rollup queries, but only start_time itself has
+        to be covered; a partly evicted first bucket is still served.
+
+        Returns:
+            dict: (device name, metric name) -> (timestamps, values), sorted by key
+        """
+        if not self.enabled:
+            return None
+        start, end = _to_datetime64(start_time), _to_datetime64(end_time)
+        read_from = _to_datetime64(bucket_start(start_time, tier)) if tier else start
+
+        with self._lock:
+            rings = [
+                (key, ring) for key, ring in self._series.items()
+                if (device_name is None or key[0] == device_name) and (metric_name is None or key[1] == metric_name)
+            ]
+            if start < self.warmed_from or any(start < ring.covered_from for _, ring in rings):
+                self.misses += 1
+                return None
+            self.hits += 1
+            windows = {key: ring.window(read_from, end) for key, ring in rings}
+
+        return {key: windows[key] for key in sorted(windows) if len(windows[key][0])}
+
+    def newer_than(self, marks: Dict[SeriesKey, np.datetime64], default_mark: np.datetime64, device_name: str = None,
+                   metric_name: str = None) -> Optional[Dict[SeriesKey, Tuple[np.ndarray, np.ndarray]]]:
+        """
+        Points of every matching series newer than its mark, or None when some of them may have been evicted.
+
+        Series without a mark use default_mark. Only series with new points are returned.
+        """
+        if not self.enabled:
+            return None
+        with self._lock:
+            points = {}
+            for key, ring in self._series.items():
+                if (device_name is not None and key[0] != device_name) or (metric_name is not None and key[1] != metric_name):
+                    continue
+                mark = marks.get(key, default_mark)
+                if mark < ring.covered_from or mark < self.warmed_from:
+                    self.misses += 1
+                    return None
+                timestamps, values = ring.ordered()
+                first = np.searchsorted(timestamps, mark, side='right')
+                if first < len(timestamps):
+                    points[key] = (timestamps[first:].copy(), values[first:].copy())
+            self.hits += 1
+        return points
+
+    def stats(self) -> dict:
+        with self._lock:
+            series = [
+                {
+                    'device_name': device_name,
+                    'metric_name': metric_name,
+                    'points': ring.size,
+                    'capacity': ring.capacity,
+                    'bytes': ring.nbytes,
+                    'covered_from': str(ring.covered_from)
+                }
+                for (device_name, metric_name), ring in sorted(self._series.items())
+            ]
+        lookups = self.hits + self.misses
+        return {
+            'enabled': self.enabled,
+            'capacity': self.capacity,
+            'workers': self.workers,
+            'warmed_from': str(self.warmed_from) if self.warmed_from is not None else None,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'bytes': sum(entry['bytes'] for entry in series),
+            'series': series
+        }
+
+def bucket_means(timestamps: np.ndarray, values: np.ndarray, width: timedelta) -> Tuple[np.ndarray, np.ndarray]:
+    """Average sorted points into fixed-width buckets aligned to the epoch; timestamps become bucket starts."""
+    width_us = int(width.total_seconds() * 1_000_000)
+    buckets = timestamps.astype(np.int64) // width_us
+    starts = np.flatnonzero(np.concatenate(([True], buckets[1:] != buckets[:-1])))
+    sums = np.add.reduceat(values, starts)
+    counts = np.diff(np.append(starts, len(values)))
+    return (buckets[starts] * width_us).astype(TIMESTAMP_DTYPE), sums / counts
+
+# Global series cache, warmed by create_app and fed by the ingest endpoints
+series_cache = SeriesCache()
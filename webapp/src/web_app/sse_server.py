@@ -0,0 +1,369 @@
+import asyncio
+import functools
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from typing import Callable, List, Optional
+from urllib.parse import unquote, urlsplit
+from flask import Response, redirect, request, stream_with_context
+from werkzeug.exceptions import HTTPException
+from ..utils.config import config
+from ..utils.logging_config import get_logger
+from .broker import broker
+
+logger = get_logger('web_app.sse_server')
+
+KEEPALIVE = ": keepalive\n\n"
+
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "X-Accel-Buffering": "no"
+}
+
+# Limits of the request head read by the asyncio server
+MAX_REQUEST_HEAD = 64 * 1024
+REQUEST_TIMEOUT = 30
+
+RESPONSE_HEAD = (
+    b"HTTP/1.1 200 OK\r\n"
+    b"Content-Type: text/event-stream; charset=utf-8\r\n"
+    b"Cache-Control: no-cache\r\n"
+    b"X-Accel-Buffering: no\r\n"
+    b"Access-Control-Allow-Origin: *\r\n"
+    b"Connection: close\r\n"
+)
+
+class Stream:
+    """
+    One SSE connection: its subscription and the messages sent on each wake-up.
+
+    Streams are created in the request context and then served either from
+    a web server thread (iter_stream) or by the asyncio server, which holds
+    idle connections without a thread each.
+    """
+
+    name = 'SSE'
+    blocking = False  # open() or receive() query the database; the asyncio server runs them in worker threads
+
+    def __init__(self):
+        self.client_ip = request.remote_addr
+        self.subscription = None  # None for streams that only send keepalives
+        self.sent = 0
+
+    def open(self) -> List[str]:
+        """Subscribe and return the first messages."""
+        return []
+
+    def receive(self, events) -> List[str]:
+        """Messages for the (sequence, event) pairs of a wake-up; events is empty after a quiet interval."""
+        return []
+
+    def close(self):
+        if self.subscription is not None:
+            broker.unsubscribe(self.subscription)
+
+def _messages(stream: Stream, events) -> List[str]:
+    messages = stream.receive(events)
+    stream.sent += len(messages)
+    if not messages and not events:
+        return [KEEPALIVE]
+    return messages
+
+def iter_stream(stream: Stream):
+    """Serve a stream from the current thread, blocking between wake-ups."""
+    try:
+        yield from stream.open()
+        while True:
+            if stream.subscription is None:
+                time.sleep(config.web.sse_interval)
+                events = []
+            else:
+                events = stream.subscription.get(config.web.sse_interval)
+            if events is None:
+                logger.warning(f"Client {stream.client_ip} fell behind on the {stream.name} stream and was disconnected")
+                break
+            yield from _messages(stream, events)
+    except GeneratorExit:
+        logger.info(f"Client {stream.client_ip} disconnected from the {stream.name} stream after {stream.sent} messages")
+    finally:
+        stream.close()
+
+def sse_stream(view: Callable[..., Stream]):
+    """
+    Make a view returning a Stream an SSE endpoint.
+
+    While the asyncio server runs, clients are redirected to it, so no web
+    server thread is held per connection; otherwise the stream is served
+    from the request's thread.
+    """
+    @functools.wraps(view)
+    def endpoint(*args, **kwargs):
+        if sse_server.running:
+            return redirect(sse_server.url_for(request), code=307)
+        return Response(
+            stream_with_context(iter_stream(view(*args, **kwargs))),
+            mimetype='text/event-stream',
+            headers=SSE_HEADERS
+        )
+    endpoint.open_stream = view
+    return endpoint
+
+def _raise_open_files_limit():
+    # Every stream holds a socket
+    try:
+        import resource
+    except ImportError:
+        return
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft != hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+        logger.info(f"Raised the open files limit from {soft} to {hard}")
+
+class SSEServer:
+    """
+    Asyncio server for the SSE endpoints.
+
+    Each stream connection is a coroutine on one event loop, woken through
+    its subscription's waker, so thousands of idle collectors and
+    dashboards cost memory instead of threads. The web server keeps
+    handling every other request and redirects stream requests here.
+    Streams that read the database run those steps in a small thread pool.
+    """
+
+    def __init__(self, host: str = None, port: int = None):
+        self.host = host or config.web.host
+        self.port = port if port is not None else config.web.sse_port
+        self.app = None
+        self._loop = None
+        self._thread = None
+        self._executor = None
+        self._ready = threading.Event()
+        self._listening = False
+        self._pending = deque()  # asyncio events to set on the loop, from publisher threads
+        self._pending_lock = threading.Lock()
+        self._wake_scheduled = False
+        self.connections = 0
+        self.served = 0
+        self.rejected = 0
+
+    @property
+    def running(self) -> bool:
+        return self._listening and self._thread is not None and self._thread.is_alive()
+
+    def start(self, app):
+        """Start the event loop thread and wait until it listens."""
+        if self.running:
+            return
+        self.app = app
+        _raise_open_files_limit()
+        self._executor = ThreadPoolExecutor(max_workers=config.web.sse_workers, thread_name_prefix='sse-worker')
+        self._ready.clear()
+        self._thread = threading.Thread(target=self._run, name='sse-server', daemon=True)
+        self._thread.start()
+        self._ready.wait()
+
+    def _run(self):
+        try:
+            asyncio.run(self._serve())
+        except Exception as e:
+            logger.error(f"SSE server failed: {str(e)}", exc_info=True)
+        finally:
+            self._listening = False
+            self._ready.set()
+
+    async def _serve(self):
+        self._loop = asyncio.get_running_loop()
+        try:
+            server = await asyncio.start_server(self._handle, self.host, self.port, limit=MAX_REQUEST_HEAD, backlog=4096)
+        except OSError as e:
+            # Usually another web worker of the host already owns the port
+            logger.warning(
+                f"SSE server could not listen on {self.host}:{self.port} ({str(e)}); "
+                f"this process serves SSE streams from the web server's threads. Only one process can own SSE_PORT"
+            )
+            self._executor.shutdown(wait=False)
+            return
+        self._listening = True
+        self._ready.set()
+        logger.info(f"Serving SSE streams from an event loop on {self.host}:{self.port}")
+        async with server:
+            await server.serve_forever()
+
+    def url_for(self, flask_request) -> str:
+        """Where the asyncio server serves the stream of a web server request."""
+        base = config.web.sse_public_url
+        if not base:
+            host = urlsplit(f"//{flask_request.host}").hostname or 'localhost'
+            if ':' in host:
+                host = f"[{host}]"
+            base = f"{flask_request.scheme}://{host}:{self.port}"
+        query = flask_request.query_string.decode('latin-1')
+        return base.rstrip('/') + flask_request.path + (f"?{query}" if query else '')
+
+    def _waker(self, wake: asyncio.Event) -> Callable[[], None]:
+        """Callback setting wake from any thread; a burst of publishes schedules one loop callback."""
+        def wake_up():
+            with self._pending_lock:
+                self._pending.append(wake)
+                if self._wake_scheduled:
+                    return
+                self._wake_scheduled = True
+            try:
+                self._loop.call_soon_threadsafe(self._wake_pending)
+            except RuntimeError:
+                pass  # The loop has stopped
+        return wake_up
+
+    def _wake_pending(self):
+        with self._pending_lock:
+            pending, self._pending = self._pending, deque()
+            self._wake_scheduled = False
+        for wake in pending:
+            wake.set()
+
+    def _environ(self, head: bytes, writer) -> Optional[dict]:
+        """WSGI environ of a request head, so Flask's URL map and request context can be used."""
+        lines = head.decode('latin-1').split('\r\n')
+        try:
+            method, target, protocol = lines[0].split(' ')
+        except ValueError:
+            return None
+        path, _, query = target.partition('?')
+        peer = writer.get_extra_info('peername') or ('', 0)
+        environ = {
+            'REQUEST_METHOD': method,
+            'SCRIPT_NAME': '',
+            'PATH_INFO': unquote(path, encoding='latin-1'),
+            'QUERY_STRING': query,
+            'SERVER_NAME': self.host,
+            'SERVER_PORT': str(self.port),
+            'SERVER_PROTOCOL': protocol,
+            'REMOTE_ADDR': peer[0],
+            'REMOTE_PORT': peer[1],
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': 'http',
+            'wsgi.input': BytesIO(),
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': False,
+            'wsgi.run_once': False
+        }
+        for line in lines[1:]:
+            if not line:
+                continue
+            name, separator, value = line.partition(':')
+            if not separator:
+                return None
+            key = name.strip().upper().replace('-', '_')
+            environ[key if key in ('CONTENT_TYPE', 'CONTENT_LENGTH') else f'HTTP_{key}'] = value.strip()
+        return environ
+
+    async def _reject(self, writer, status: int, reason: str):
+        self.rejected += 1
+        writer.write(f"HTTP/1.1 {status} {reason}\r\nContent-Length: 0\r\nConnection: close\r\n\r\n".encode('latin-1'))
+        await writer.drain()
+
+    async def _handle(self, reader, writer):
+        self.connections += 1
+        try:
+            try:
+                head = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), REQUEST_TIMEOUT)
+            except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, asyncio.TimeoutError):
+                return
+            environ = self._environ(head, writer)
+            if environ is None:
+                return await self._reject(writer, 400, 'Bad Request')
+            if environ['REQUEST_METHOD'] != 'GET':
+                return await self._reject(writer, 405, 'Method Not Allowed')
+            try:
+                endpoint, view_args = self.app.url_map.bind_to_environ(environ).match()
+            except HTTPException:
+                endpoint, view_args = None, {}
+            open_stream = getattr(self.app.view_functions.get(endpoint), 'open_stream', None)
+            if open_stream is None:
+                return await self._reject(writer, 404, 'Not Found')
+            await self._serve_stream(open_stream, view_args, environ, reader, writer)
+        except ConnectionError:
+            pass
+        except Exception as e:
+            logger.error(f"Error serving SSE stream: {str(e)}", exc_info=True)
+        finally:
+            self.connections -= 1
+            writer.close()
+
+    async def _serve_stream(self, open_stream, view_args, environ, reader, writer):
+        loop = asyncio.get_running_loop()
+
+        def in_request(step, *args, **kwargs):
+            with self.app.request_context(environ):
+                return step(*args, **kwargs)
+
+        try:
+            stream = in_request(open_stream, **view_args)
+        except HTTPException as e:
+            return await self._reject(writer, e.code, e.name)
+
+        async def call(step, *args):
+            if stream.blocking:
+                return await loop.run_in_executor(self._executor, functools.partial(in_request, step, *args))
+            return step(*args)
+
+        wake = asyncio.Event()
+        disconnected = None
+        try:
+            messages = await call(stream.open)
+            if stream.subscription is not None:
+                stream.subscription.waker = self._waker(wake)
+                # Events published between subscribing and setting the waker are already queued
+                if stream.subscription.depth:
+                    wake.set()
+            # HTTP/1.1 clients read chunks as they arrive; HTTP/1.0 ones read until the connection closes
+            chunked = environ['SERVER_PROTOCOL'] == 'HTTP/1.1'
+            writer.write(RESPONSE_HEAD + (b"Transfer-Encoding: chunked\r\n\r\n" if chunked else b"\r\n"))
+            self.served += 1
+            # Clients send nothing after the request, so the read only ends when they leave
+            disconnected = loop.create_task(reader.read())
+            disconnected.add_done_callback(lambda _: wake.set())
+
+            while True:
+                if messages:
+                    data = ''.join(messages).encode('utf-8')
+                    writer.write(b"%x\r\n%s\r\n" % (len(data), data) if chunked else data)
+                    await writer.drain()
+                timer = loop.call_later(config.web.sse_interval, wake.set)
+                await wake.wait()
+                timer.cancel()
+                wake.clear()
+                if disconnected.done():
+                    logger.info(f"Client {stream.client_ip} disconnected from the {stream.name} stream after {stream.sent} messages")
+                    break
+                events = [] if stream.subscription is None else stream.subscription.get(0)
+                if events is None:
+                    logger.warning(f"Client {stream.client_ip} fell behind on the {stream.name} stream and was disconnected")
+                    break
+                if not events and loop.time() < timer.when():
+                    # Woken for events an earlier wake-up already took
+                    messages = []
+                    continue
+                messages = await call(_messages, stream, events)
+        finally:
+            if disconnected is not None:
+                disconnected.cancel()
+            stream.close()
+
+    def stats(self) -> dict:
+        return {
+            'mode': config.web.sse_server,
+            'running': self.running,
+            'host': self.host,
+            'port': self.port,
+            'connections': self.connections,
+            'served': self.served,
+            'rejected': self.rejected
+        }
+
+# Global asyncio SSE server, started by create_app in the "asyncio" mode
+sse_server = SSEServer()
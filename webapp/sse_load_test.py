@@ -0,0 +1,177 @@
+"""
+Load test for the asyncio SSE server: holds many idle streams open and
+reports the server's memory.
+
+    python sse_load_test.py --serve --streams 10000 --hold 60
+
+--serve starts run.py with SSE_SERVER=asyncio; without it, point --url at
+a running server and pass its --pid to get memory figures.
+"""
+import argparse
+import asyncio
+import os
+import resource
+import socket
+import subprocess
+import sys
+import time
+from urllib.parse import urlsplit
+
+def rss_bytes(pid):
+    """Resident memory of a process, from /proc."""
+    try:
+        with open(f'/proc/{pid}/status') as status:
+            for line in status:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+def thread_count(pid):
+    try:
+        return len(os.listdir(f'/proc/{pid}/task'))
+    except OSError:
+        return None
+
+def format_mb(value):
+    return f"{value / 1024 / 1024:.1f}MB" if value is not None else 'n/a'
+
+class Stats:
+    def __init__(self):
+        self.connected = 0
+        self.open = 0
+        self.failed = 0
+        self.events = 0
+        self.keepalives = 0
+
+async def hold_stream(url, connecting, hold_until, stats, errors):
+    parts = urlsplit(url)
+    path = parts.path + (f'?{parts.query}' if parts.query else '')
+    try:
+        async with connecting:
+            reader, writer = await asyncio.open_connection(parts.hostname, parts.port or 80)
+            writer.write(
+                f"GET {path} HTTP/1.1\r\nHost: {parts.netloc}\r\nAccept: text/event-stream\r\n\r\n".encode('latin-1')
+            )
+            await writer.drain()
+            head = await reader.readuntil(b'\r\n\r\n')
+            if not head.startswith(b'HTTP/1.1 200'):
+                raise ConnectionError(head.split(b'\r\n', 1)[0].decode('latin-1'))
+    except Exception as e:
+        stats.failed += 1
+        errors[type(e).__name__] = errors.get(type(e).__name__, 0) + 1
+        return
+    stats.connected += 1
+    stats.open += 1
+    try:
+        while True:
+            remaining = hold_until - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                data = await asyncio.wait_for(reader.read(65536), remaining)
+            except asyncio.TimeoutError:
+                break
+            if not data:
+                stats.failed += 1
+                break
+            stats.keepalives += data.count(b': keepalive')
+            stats.events += data.count(b'\ndata: ')
+    finally:
+        stats.open -= 1
+        writer.close()
+
+def wait_for_port(host, port, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection((host, port), timeout=1):
+                return True
+        except OSError:
+            time.sleep(0.2)
+    return False
+
+def start_server(port, sse_port):
+    """Run the web app with the asyncio SSE server."""
+    env = dict(
+        os.environ,
+        SSE_SERVER='asyncio',
+        APP_HOST='127.0.0.1',
+        APP_PORT=str(port),
+        SSE_PORT=str(sse_port),
+        COMPACTION='False',
+        LOG_LEVEL='WARNING'
+    )
+    process = subprocess.Popen(
+        [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'run.py')],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    if not wait_for_port('127.0.0.1', sse_port):
+        process.kill()
+        raise SystemExit('The web app did not start')
+    return process
+
+async def run(args, pid):
+    stats = Stats()
+    errors = {}
+    baseline = rss_bytes(pid) if pid else None
+    print(f"Server before: {format_mb(baseline)} RSS, {thread_count(pid) if pid else 'n/a'} threads")
+
+    started = time.monotonic()
+    hold_until = started + args.ramp + args.hold
+    connecting = asyncio.Semaphore(args.concurrency)
+    tasks = [
+        asyncio.create_task(hold_stream(args.url, connecting, hold_until, stats, errors))
+        for _ in range(args.streams)
+    ]
+    while stats.connected + stats.failed < args.streams and time.monotonic() < started + args.ramp:
+        await asyncio.sleep(0.1)
+    connect_time = time.monotonic() - started
+    print(f"Opened {stats.connected} streams in {connect_time:.1f}s ({stats.failed} failed{', ' + str(errors) if errors else ''})")
+
+    peak = baseline
+    while time.monotonic() < hold_until:
+        await asyncio.sleep(min(5, max(hold_until - time.monotonic(), 0)))
+        current = rss_bytes(pid) if pid else None
+        if current is not None:
+            peak = max(peak or 0, current)
+        print(f"  {stats.open} open, {stats.keepalives} keepalives, {stats.events} events, "
+              f"server {format_mb(current)} RSS, {thread_count(pid) if pid else 'n/a'} threads")
+    await asyncio.gather(*tasks)
+
+    print(f"Held {args.streams} streams for {args.hold}s: {stats.failed} failed or dropped")
+    if baseline is not None and peak is not None and stats.connected:
+        print(f"Server peak {format_mb(peak)} RSS, {(peak - baseline) / stats.connected / 1024:.1f}KB per stream")
+
+def main():
+    parser = argparse.ArgumentParser(description='Hold many idle SSE streams open against the asyncio SSE server')
+    parser.add_argument('--url', help='stream URL (default: the control stream of the --serve server)')
+    parser.add_argument('--streams', type=int, default=10000)
+    parser.add_argument('--hold', type=int, default=30, help='seconds to keep every stream open')
+    parser.add_argument('--ramp', type=int, default=60, help='seconds allowed for opening the streams')
+    parser.add_argument('--concurrency', type=int, default=200, help='connections being opened at once')
+    parser.add_argument('--pid', type=int, help='server process id, for memory figures')
+    parser.add_argument('--serve', action='store_true', help='start the web app in asyncio SSE mode')
+    parser.add_argument('--port', type=int, default=18000)
+    parser.add_argument('--sse-port', type=int, default=18001)
+    args = parser.parse_args()
+
+    # Every stream holds a socket on both ends
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    if hard < args.streams + 100:
+        print(f"Warning: the open files limit ({hard}) is below --streams")
+
+    process = start_server(args.port, args.sse_port) if args.serve else None
+    args.url = args.url or f"http://127.0.0.1:{args.sse_port}/api/v1/aggregator/control"
+    try:
+        asyncio.run(run(args, process.pid if process else args.pid))
+    finally:
+        if process:
+            process.terminate()
+            process.wait()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+from datetime import datetime, timedelta
+import pytest
+from src.web_app.batch_dedup import BatchDedupIndex, BatchKey, DUPLICATE, IN_FLIGHT, NEW
+
+def test_key_from_headers():
+    key = BatchKey.from_headers({'X-Batch-Id': 'b1', 'X-Collector-Id': 'c1', 'X-Batch-Seq': '10-19'})
+    assert key == BatchKey('b1', 'c1', 10, 19)
+    assert key.has_range
+
+    assert BatchKey.from_headers({}) is None
+    assert BatchKey.from_headers({'X-Batch-Id': 'b1', 'X-Collector-Id': 'c1', 'X-Batch-Seq': '7'}) == BatchKey('b1', 'c1', 7, 7)
+    # Malformed and reversed ranges fall back to the batch id alone
+    for seq in ('x-y', '19-10'):
+        key = BatchKey.from_headers({'X-Batch-Id': 'b1', 'X-Collector-Id': 'c1', 'X-Batch-Seq': seq})
+        assert not key.has_range
+
+def test_claim_commit_and_retry():
+    index = BatchDedupIndex(max_entries=10)
+    key = BatchKey('b1')
+    assert index.claim(key) == NEW
+    assert index.claim(key) == IN_FLIGHT
+    index.commit(key)
+    assert index.claim(key) == DUPLICATE
+    assert index.stats()['duplicates'] == 1
+
+def test_release_allows_retry():
+    index = BatchDedupIndex(max_entries=10)
+    key = BatchKey('b1', 'c1', 1, 5)
+    assert index.claim(key) == NEW
+    index.release(key)
+    assert index.claim(key) == NEW
+
+def test_ranges_merge_and_cover_retries():
+    index = BatchDedupIndex(max_entries=10)
+    index.commit(BatchKey('b1', 'c1', 1, 10))
+    index.commit(BatchKey('b2', 'c1', 11, 20))
+    # A retry under a new batch id whose range was already committed is still a duplicate
+    assert index.claim(BatchKey('b3', 'c1', 5, 15)) == DUPLICATE
+    assert index.claim(BatchKey('b4', 'c1', 15, 25)) == NEW
+    assert index.claim(BatchKey('b5', 'c2', 1, 10)) == NEW
+
+def test_batch_ids_are_bounded():
+    index = BatchDedupIndex(max_entries=2)
+    for batch_id in ('b1', 'b2', 'b3'):
+        index.commit(BatchKey(batch_id))
+    assert index.claim(BatchKey('b1')) == NEW
+    assert index.claim(BatchKey('b3')) == DUPLICATE
+
+@pytest.fixture
+def write_behind_app(tmp_path, monkeypatch):
+    from flask import Flask
+    from src.database.database import db, init_db
+    from src.utils.config import config
+    from src.web_app import ingest_buffer as buffer_module
+    from src.web_app.routes import aggregator
+    monkeypatch.setattr(config, 'get_database_url', lambda: f"sqlite:///{tmp_path / 'metrics.db'}")
+    monkeypatch.setattr(buffer_module, 'COMMIT_RETRY_DELAY', 0)
+
+    app = Flask(__name__)
+    app.register_blueprint(aggregator.aggregator_bp, url_prefix='/api/v1/aggregator')
+    init_db(app)
+    buffer_module.ingest_buffer.start(app)
+    yield app
+    buffer_module.ingest_buffer.stop()
+    with app.app_context():
+        db.session.remove()
+        db.engine.dispose()
+
+def _upload(client, batch_id):
+    now = datetime.utcnow()
+    return client.post(
+        '/api/v1/aggregator/metrics/batch',
+        json=[{'device_name': 'D1', 'metric_name': 'cpu', 'metric_value': float(i), 'timestamp': (now - timedelta(seconds=i)).isoformat()} for i in range(3)],
+        headers={'X-Batch-Id': batch_id, 'X-Collector-Id': batch_id, 'X-Batch-Seq': '1-3'}
+    )
+
+def test_write_behind_commits_key_with_rows(write_behind_app):
+    from src.web_app.ingest_buffer import ingest_buffer
+    client = write_behind_app.test_client()
+    assert _upload(client, 'wb-ok').status_code == 202
+    # A replay is never buffered twice: it waits while in flight and is a duplicate once committed
+    assert _upload(client, 'wb-ok').status_code in (200, 409)
+    ingest_buffer.stop()
+    response = _upload(client, 'wb-ok')
+    assert response.status_code == 200
+    assert response.get_json()['duplicate']
+
+def test_write_behind_releases_key_of_lost_batch(write_behind_app, monkeypatch):
+    from src.web_app import ingest_buffer as buffer_module
+    def fail(*args, **kwargs):
+        raise RuntimeError('disk I/O error')
+    monkeypatch.setattr(buffer_module, 'ingest_metrics', fail)
+    failed_batches = buffer_module.ingest_buffer.failed_batches
+
+    client = write_behind_app.test_client()
+    assert _upload(client, 'wb-lost').status_code == 202
+    buffer_module.ingest_buffer.stop()
+    assert buffer_module.ingest_buffer.failed_batches == failed_batches + 1
+
+    # The writer is stopped, so the replay is stored synchronously
+    response = _upload(client, 'wb-lost')
+    assert response.status_code == 200
+    assert response.get_json()['count'] == 3
@@ -0,0 +1,65 @@
+import threading
+from src.web_app.broker import Broker
+
+def test_overflow_closes_subscription():
+    broker = Broker(max_depth=3, replay_size=0)
+    slow, _ = broker.subscribe('metrics')
+    fast, _ = broker.subscribe('metrics')
+    woken = []
+    slow.waker = lambda: woken.append(True)
+
+    for i in range(3):
+        broker.publish('metrics', i)
+    assert [event for _, event in fast.get(0)] == [0, 1, 2]
+    assert slow.depth == 3 and not slow.closed
+
+    # The fourth event does not fit: the slow subscriber is dropped, the other keeps receiving
+    broker.publish('metrics', 3)
+    assert slow.closed and slow.overflowed and slow.depth == 0
+    assert slow.get(0) is None
+    assert len(woken) == 4
+    assert [event for _, event in fast.get(0)] == [3]
+    assert broker.stats()['topics']['metrics']['subscribers'] == 1
+    assert broker.dropped_subscribers == 1
+
+    # A dropped subscription ignores further events
+    assert not slow.put((5, 'late'))
+
+def test_get_wakes_on_publish():
+    broker = Broker(max_depth=10, replay_size=0)
+    subscription, _ = broker.subscribe('control')
+    threading.Timer(0.05, broker.publish, ('control', 'on')).start()
+    assert subscription.get(5) == [(1, 'on')]
+    assert subscription.get(0.01) == []
+    broker.unsubscribe(subscription)
+    assert subscription.get(0) is None
+
+def test_replay_after_last_event_id():
+    broker = Broker(max_depth=100, replay_size=5)
+    for i in range(1, 9):
+        broker.publish('metrics', f"e{i}")
+    assert broker.parse_event_id(broker.event_id(8)) == 8
+
+    # Event 4 is the oldest still in the log, so clients that saw event 3 can resume
+    _, replay = broker.subscribe('metrics', broker.event_id(3))
+    assert replay == [(4, 'e4'), (5, 'e5'), (6, 'e6'), (7, 'e7'), (8, 'e8')]
+    _, replay = broker.subscribe('metrics', broker.event_id(8))
+    assert replay == []
+    # Anything older needs a snapshot
+    _, replay = broker.subscribe('metrics', broker.event_id(2))
+    assert replay is None
+
+def test_unknown_event_ids_need_a_snapshot():
+    broker = Broker(max_depth=100, replay_size=5)
+    broker.publish('metrics', 'e1')
+    restarted = Broker(max_depth=100, replay_size=5)
+    restarted.epoch = format(int(broker.epoch, 16) + 1, 'x')
+    restarted.publish('metrics', 'e1')
+
+    # Ids of another broker's epoch, from the future, or malformed
+    for last_event_id in (broker.event_id(1), restarted.event_id(2), 'garbage', f"{restarted.epoch}-x", None):
+        _, replay = restarted.subscribe('metrics', last_event_id)
+        assert replay is None, last_event_id
+    # Every subscription starts at the current position
+    subscription, replay = restarted.subscribe('metrics', restarted.event_id(1))
+    assert replay == [] and subscription.position == 1
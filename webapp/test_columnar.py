@@ -0,0 +1,53 @@
+from datetime import datetime, timezone
+import pytest
+from src.utils.columnar import ColumnarFormatError, decode_batch, encode_batch, from_epoch_micros
+
+METRICS = [
+    {'device_id': 'dev-1', 'device_name': 'Server', 'metric_name': 'cpu', 'metric_value': 12.5,
+     'timestamp': '2024-03-01T12:00:00.123456Z'},
+    {'device_name': 'Server', 'metric_name': 'memory', 'metric_value': 3,
+     'timestamp': datetime(2024, 3, 1, 12, 0, 1, tzinfo=timezone.utc)},
+    {'device_id': 'dev-2', 'device_name': 'Sensor ü', 'metric_name': 'cpu', 'metric_value': -1e300,
+     'timestamp': datetime(1969, 12, 31, 23, 59, 59)}
+]
+
+def test_round_trip():
+    batch = decode_batch(encode_batch(METRICS))
+    assert len(batch) == 3
+    # Repeated names are stored once
+    assert batch.strings == ['Server', 'dev-1', 'cpu', 'memory', 'Sensor ü', 'dev-2']
+
+    rows = [
+        (batch.strings[batch.device_names[i]],
+         batch.strings[batch.device_ids[i]] if batch.device_ids[i] >= 0 else None,
+         batch.strings[batch.metric_names[i]],
+         from_epoch_micros(batch.timestamps[i]),
+         batch.values[i])
+        for i in range(len(batch))
+    ]
+    assert rows == [
+        ('Server', 'dev-1', 'cpu', datetime(2024, 3, 1, 12, 0, 0, 123456), 12.5),
+        ('Server', None, 'memory', datetime(2024, 3, 1, 12, 0, 1), 3.0),
+        ('Sensor ü', 'dev-2', 'cpu', datetime(1969, 12, 31, 23, 59, 59), -1e300)
+    ]
+
+def test_empty_batch():
+    assert len(decode_batch(encode_batch([]))) == 0
+
+@pytest.mark.parametrize('payload', [
+    b'',
+    b'JSON' + encode_batch(METRICS)[4:],
+    encode_batch(METRICS)[:-1],
+    encode_batch(METRICS)[:4] + b'\x02' + encode_batch(METRICS)[5:]
+])
+def test_malformed_payloads(payload):
+    with pytest.raises(ColumnarFormatError):
+        decode_batch(payload)
+
+def test_string_index_out_of_range():
+    payload = bytearray(encode_batch(METRICS[:1]))
+    # The device name column follows the string table and the row count
+    offset = len(payload) - (4 + 4 + 4 + 8 + 8)
+    payload[offset:offset + 4] = (99).to_bytes(4, 'little')
+    with pytest.raises(ColumnarFormatError):
+        decode_batch(bytes(payload))
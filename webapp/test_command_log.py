@@ -0,0 +1,99 @@
+import pytest
+from flask import Flask
+from src.web_app.command_log import BROADCAST, CommandLog, compaction_key, mailbox
+
+def _symbols(pending):
+    return [command['symbol'] for _, command in pending]
+
+def test_repeated_command_replaces_earlier_copy():
+    log = CommandLog(capacity=10, retention=None)
+    log.append({'action': 'add_stock', 'symbol': 'AAPL', 'timestamp': '2024-03-01T00:00:00'}, 'device:STOCK')
+    log.append({'action': 'add_stock', 'symbol': 'MSFT', 'timestamp': '2024-03-01T00:00:01'}, 'device:STOCK')
+    log.append({'action': 'add_stock', 'symbol': 'AAPL', 'timestamp': '2024-03-01T00:00:02'}, 'device:STOCK')
+    # The same command to another mailbox is a different command
+    log.append({'action': 'add_stock', 'symbol': 'AAPL', 'timestamp': '2024-03-01T00:00:03'}, BROADCAST)
+
+    _, pending = log.subscribe()
+    assert [(sequence, command['symbol'], command['timestamp']) for sequence, command in pending] == [
+        (2, 'MSFT', '2024-03-01T00:00:01'), (3, 'AAPL', '2024-03-01T00:00:02'), (4, 'AAPL', '2024-03-01T00:00:03')
+    ]
+    assert log.superseded == 1
+    # Only the timestamp may differ between copies of a command
+    assert compaction_key('device:STOCK', {'symbol': 'A', 'timestamp': 1}) == compaction_key('device:STOCK', {'symbol': 'A', 'timestamp': 2})
+    assert compaction_key('device:STOCK', {'symbol': 'A'}) != compaction_key('device:STOCK', {'symbol': 'B'})
+
+def test_capacity_and_retention(monkeypatch):
+    now = [10000.0]
+    monkeypatch.setattr('src.web_app.command_log.time.time', lambda: now[0])
+    log = CommandLog(capacity=3, retention=60)
+    for i in range(5):
+        log.append({'action': 'add_stock', 'symbol': f"S{i}"})
+    _, pending = log.subscribe()
+    assert _symbols(pending) == ['S2', 'S3', 'S4']
+    assert log.evicted == 2
+
+    now[0] += 30
+    log.append({'action': 'add_stock', 'symbol': 'S5'})
+    assert log.evicted == 3
+    # Commands older than the retention are gone the next time the log is read
+    now[0] += 45
+    _, pending = log.subscribe()
+    assert _symbols(pending) == ['S5']
+    assert log.expired == 2
+    assert log.stats()['first_sequence'] == 6
+
+def test_mailbox_and_broadcast_delivery():
+    log = CommandLog(capacity=10, retention=None)
+    everything, _ = log.subscribe()
+    stock, _ = log.subscribe([mailbox(device_name='STOCK')])
+    other, _ = log.subscribe([mailbox(collector_id='c2')])
+
+    log.append({'symbol': 'AAPL'}, mailbox(device_name='STOCK'))
+    log.append({'symbol': 'MSFT'}, mailbox(collector_id='c2'))
+    log.append({'symbol': 'ALL'}, mailbox())
+    assert _symbols(everything.get(0)) == ['AAPL', 'MSFT', 'ALL']
+    assert _symbols(stock.get(0)) == ['AAPL', 'ALL']
+    assert _symbols(other.get(0)) == ['MSFT', 'ALL']
+
+    # Reconnecting listeners only get their own logged commands, newer than their last event id
+    for last_event_id, symbols in ((None, ['AAPL', 'ALL']), (log.event_id(1), ['ALL'])):
+        subscription, pending = log.subscribe([mailbox(device_name='STOCK')], last_event_id)
+        assert _symbols(pending) == symbols
+        log.unsubscribe(subscription)
+
+    log.unsubscribe(stock)
+    log.append({'symbol': 'IBM'}, mailbox(device_name='STOCK'))
+    assert stock.get(0) is None
+    assert _symbols(everything.get(0)) == ['IBM']
+    assert log.stats()['mailboxes']['device:STOCK']['listeners'] == 0
+
+@pytest.fixture
+def client(monkeypatch):
+    from src.web_app.routes import aggregator
+    monkeypatch.setattr(aggregator.control_state, 'commands', CommandLog(capacity=10, retention=None))
+    monkeypatch.setattr(aggregator.control_state, 'store', None)
+    app = Flask(__name__)
+    app.register_blueprint(aggregator.aggregator_bp, url_prefix='/api/v1/aggregator')
+    return app.test_client(), aggregator.control_state
+
+def test_add_stock_reaches_stock_collector(client):
+    client, control_state = client
+    # The stock collector listens with device=STOCK; older collectors name no mailbox at all
+    stock, _ = control_state.subscribe_commands([mailbox(device_name='STOCK')])
+    legacy, _ = control_state.subscribe_commands(None)
+    other, _ = control_state.subscribe_commands([mailbox(device_name='D1')])
+
+    response = client.post('/api/v1/aggregator/add_stock', json={'symbol': 'aapl'})
+    assert response.status_code == 201
+    assert _symbols(stock.get(0)) == ['AAPL']
+    assert _symbols(legacy.get(0)) == ['AAPL']
+    assert other.get(0) == []
+
+    # Addressed to one collector instead
+    client.post('/api/v1/aggregator/add_stock', json={'symbol': 'msft', 'collector_id': 'c1'})
+    assert stock.get(0) == []
+    assert _symbols(legacy.get(0)) == ['MSFT']
+    _, pending = control_state.subscribe_commands([mailbox(collector_id='c1')])
+    assert _symbols(pending) == ['MSFT']
+
+    assert client.post('/api/v1/aggregator/add_stock', json={'symbol': 'not a symbol'}).status_code == 400
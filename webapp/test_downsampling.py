@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+from src.utils.downsampling import METHODS, downsample
+
+def _series(n):
+    timestamps = np.datetime64('2024-03-01T00:00:00', 'us') + np.arange(n) * np.timedelta64(1, 's')
+    values = np.sin(np.arange(n) / 7.0) + np.random.default_rng(n).normal(0, 0.1, n)
+    return timestamps, values
+
+@pytest.mark.parametrize('method', METHODS)
+@pytest.mark.parametrize('n, max_points', [(1000, 100), (1000, 3), (1000, 4), (101, 100), (57, 10), (10000, 999)])
+def test_keeps_ends_within_budget(method, n, max_points):
+    timestamps, values = _series(n)
+    kept_timestamps, kept_values = downsample(timestamps, values, max_points, method)
+
+    assert 2 <= len(kept_values) <= max_points
+    assert kept_timestamps[0] == timestamps[0] and kept_timestamps[-1] == timestamps[-1]
+    assert kept_values[0] == values[0] and kept_values[-1] == values[-1]
+    # Kept points stay in time order and are taken from the input
+    assert (np.diff(kept_timestamps) > np.timedelta64(0)).all()
+    assert np.isin(kept_timestamps, timestamps).all()
+
+@pytest.mark.parametrize('method', METHODS)
+def test_short_input_is_returned_unchanged(method):
+    timestamps, values = _series(50)
+    for max_points in (50, 500, None, 0):
+        kept_timestamps, kept_values = downsample(timestamps, values, max_points, method)
+        assert kept_timestamps is timestamps and kept_values is values
+
+    empty = np.array([], dtype='datetime64[us]'), np.array([])
+    assert len(downsample(*empty, 10, method)[1]) == 0
+
+@pytest.mark.parametrize('method', METHODS)
+def test_tiny_budgets(method):
+    timestamps, values = _series(100)
+    assert list(downsample(timestamps, values, 2, method)[1]) == [values[0], values[-1]]
+    assert list(downsample(timestamps, values, 1, method)[1]) == [values[0]]
+
+def test_minmax_keeps_spikes():
+    timestamps, values = _series(10000)
+    values[4321], values[7654] = 50.0, -50.0
+    kept_values = downsample(timestamps, values, 20, 'minmax')[1]
+    assert 50.0 in kept_values and -50.0 in kept_values
+
+def test_unknown_method():
+    timestamps, values = _series(100)
+    with pytest.raises(ValueError):
+        downsample(timestamps, values, 10, 'average')
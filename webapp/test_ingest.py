@@ -0,0 +1,146 @@
+from datetime import datetime, timedelta
+import pytest
+from flask import Flask
+from sqlalchemy import func, select
+from src.utils.config import config
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, 'get_database_url', lambda: f"sqlite:///{tmp_path / 'metrics.db'}")
+
+    from src.database.database import db, init_db
+    from src.database.resolver import resolver
+    resolver.clear()
+    app = Flask(__name__)
+    init_db(app)
+    with app.app_context():
+        yield app
+        db.session.remove()
+        db.engine.dispose()
+    resolver.clear()
+
+def _count(model):
+    from src.database.database import db
+    return db.session.execute(select(func.count()).select_from(model)).scalar()
+
+def _raw_rows():
+    from src.database.partitions import partitions
+    return sum(_count(table) for table in partitions.tables_for_range())
+
+def test_bulk_ingest_creates_devices_and_metrics_once(app):
+    from src.database.ingest import ingest_metrics
+    from src.database.models import Device, MetricInfo
+
+    start = datetime.utcnow() - timedelta(hours=1)
+    batch = [
+        {'device_id': None, 'device_name': f"D{i % 3}", 'metric_name': f"m{i % 4}",
+         'metric_value': float(i), 'timestamp': (start + timedelta(seconds=i)).isoformat()}
+        for i in range(120)
+    ]
+    result = ingest_metrics(batch)
+    assert (result.count, result.devices, result.metrics) == (120, 3, 4)
+    assert _raw_rows() == 120
+    assert _count(Device) == 3
+    assert _count(MetricInfo) == 4
+
+    # A second batch of known names only adds rows
+    result = ingest_metrics(batch[:30])
+    assert result.count == 30
+    assert _raw_rows() == 150
+    assert _count(Device) == 3
+    assert _count(MetricInfo) == 4
+
+def test_bulk_ingest_prefers_known_device_id(app):
+    from src.database.database import db
+    from src.database.ingest import ingest_metrics
+    from src.database.models import Device
+
+    now = datetime.utcnow()
+    ingest_metrics([
+        {'device_id': 'dev-1', 'device_name': 'D1', 'metric_name': 'cpu', 'metric_value': 1.0, 'timestamp': now},
+        {'device_id': 'dev-1', 'device_name': 'D1', 'metric_name': 'cpu', 'metric_value': 2.0, 'timestamp': now},
+        {'device_id': None, 'device_name': 'D1', 'metric_name': 'cpu', 'metric_value': 3.0, 'timestamp': now},
+    ])
+    assert db.session.execute(select(Device.id, Device.name)).all() == [('dev-1', 'D1')]
+
+def test_columnar_ingest_matches_row_ingest(tmp_path, monkeypatch):
+    from src.database.database import db, init_db
+    from src.database.ingest import ingest_columns, ingest_metrics
+    from src.database.models import Device, MetricInfo, MetricRollup
+    from src.database.partitions import partitions
+    from src.database.resolver import resolver
+    from src.utils.columnar import decode_batch, encode_batch
+    monkeypatch.setattr(partitions, 'interval', 'day')
+    monkeypatch.setattr(config.ingest, 'rollups', True)
+
+    # Spans a partition boundary
+    start = datetime(2024, 3, 1, 23, 59, 30)
+    batch = [
+        {'device_id': None, 'device_name': f"D{i % 2}", 'metric_name': 'cpu',
+         'metric_value': float(i), 'timestamp': start + timedelta(seconds=i)}
+        for i in range(60)
+    ]
+
+    stored = []
+    for name, ingest in (('rows', ingest_metrics), ('columns', lambda metrics: ingest_columns(decode_batch(encode_batch(metrics))))):
+        monkeypatch.setattr(config, 'get_database_url', lambda name=name: f"sqlite:///{tmp_path / name}.db")
+        resolver.clear()
+        app = Flask(__name__)
+        init_db(app)
+        with app.app_context():
+            assert ingest(batch).count == 60
+            values = [
+                row for table in partitions.tables_for_range()
+                for row in db.session.execute(
+                    select(Device.name, MetricInfo.name, table.c.metric_value, table.c.timestamp, table.c.created_at.isnot(None))
+                    .join(Device, table.c.device_id == Device.id).join(MetricInfo, table.c.metric_info_id == MetricInfo.id)
+                ).all()
+            ]
+            rollups = db.session.execute(
+                select(MetricRollup.tier, MetricRollup.bucket_start, MetricRollup.value_count, MetricRollup.value_sum, MetricRollup.last_value)
+                .order_by(MetricRollup.tier, MetricRollup.bucket_start, MetricRollup.value_sum)
+            ).all()
+            stored.append((sorted(values, key=lambda row: row[3]), rollups, len(partitions.entries())))
+            db.session.remove()
+            db.engine.dispose()
+    resolver.clear()
+
+    assert stored[0] == stored[1]
+    assert len(stored[1][0]) == 60
+    assert stored[1][2] == 2
+
+def test_legacy_upload_updates_caches_and_live_values(app, monkeypatch):
+    from src.web_app.routes import aggregator
+    from src.web_app.routes.metrics import metrics_bp
+    extended = []
+    monkeypatch.setattr(aggregator.series_cache, 'extend_metrics', extended.extend)
+    monkeypatch.setattr(aggregator.control_state, 'latest_metrics', {})
+    app.register_blueprint(metrics_bp)
+
+    response = app.test_client().post('/metrics', json={'device_name': 'D1', 'metrics': [
+        {'name': 'cpu', 'value': 1.5, 'timestamp': '2024-03-01T12:00:00'},
+        {'name': 'cpu', 'value': 2.5, 'timestamp': '2024-03-01T12:00:01'}
+    ]})
+    assert response.status_code == 200
+    assert _raw_rows() == 2
+    assert [metric['metric_value'] for metric in extended] == [1.5, 2.5]
+    assert aggregator.control_state.latest_metrics['D1:cpu']['value'] == 2.5
+
+def test_legacy_upload_drops_cached_results_it_changes(app, monkeypatch):
+    from src.web_app.result_cache import result_cache
+    from src.web_app.routes.metrics import metrics_bp
+    monkeypatch.setattr(result_cache, 'ttl', 60)
+    monkeypatch.setattr(result_cache, 'max_bytes', 1 << 20)
+    result_cache.clear()
+    app.register_blueprint(metrics_bp)
+
+    start, end = datetime(2024, 3, 1, 11), datetime(2024, 3, 1, 13)
+    for device_name in ('D1', 'D2'):
+        result_cache.get_or_compute('test', lambda: 'before', device_name, 'cpu', start, end, (), False)
+
+    app.test_client().post('/metrics', json={'device_name': 'D1', 'metrics': [
+        {'name': 'cpu', 'value': 1.5, 'timestamp': '2024-03-01T12:00:00'}
+    ]})
+    assert result_cache.get_or_compute('test', lambda: 'after', 'D1', 'cpu', start, end, (), False) == 'after'
+    assert result_cache.get_or_compute('test', lambda: 'after', 'D2', 'cpu', start, end, (), False) == 'before'
+    result_cache.clear()
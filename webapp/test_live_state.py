@@ -0,0 +1,61 @@
+import pytest
+from src.web_app.command_log import CommandLog, mailbox
+from src.web_app.live_state import LiveState
+from src.web_app.routes.aggregator import ControlState
+
+@pytest.fixture
+def workers(tmp_path):
+    """Two workers sharing one live state file; the follower threads never wake during a test."""
+    started = []
+    for _ in range(2):
+        control_state = ControlState()
+        control_state.commands = CommandLog(capacity=10, retention=None)
+        store = LiveState(str(tmp_path / 'live_state.db'), interval=3600)
+        store.start(control_state)
+        started.append((control_state, store))
+    yield started
+    for _, store in started:
+        store.stop()
+        store._writer.close()
+        store._reader.close()
+
+def test_values_written_by_one_worker_reach_the_other(workers):
+    (first, first_store), (second, second_store) = workers
+    first.add_metric('D1', 'cpu', 42.0, '2024-03-01T12:00:00')
+    assert first.get_latest_metrics()[0]['value'] == 42.0
+
+    # Written behind: nothing to see until the writer flushes
+    second_store.sync()
+    assert second.get_latest_metrics() == []
+
+    first_store._flush()
+    version = second_store._data_version
+    second_store.sync()
+    assert second_store._data_version != version
+    assert second.get_latest_metrics() == [
+        {'device': 'D1', 'metric': 'cpu', 'value': 42.0, 'timestamp': '2024-03-01T12:00:00'}
+    ]
+    # Nothing new was committed, so the next poll reads no rows
+    applied = second_store.applied
+    second_store.sync()
+    assert second_store.applied == applied
+
+    # An older value written later does not replace the newer one
+    first.add_metric('D1', 'cpu', 1.0, '2024-03-01T11:00:00')
+    first_store._flush()
+    second_store.sync()
+    assert second.get_latest_metrics()[0]['value'] == 42.0
+
+def test_status_and_commands_are_shared(workers):
+    (first, first_store), (second, second_store) = workers
+    first.set_status('PAUSED')
+    second_store.sync()
+    assert (first.status, second.status) == ('PAUSED', 'PAUSED')
+
+    sequence = first.add_command({'action': 'add_stock', 'symbol': 'AAPL'}, mailbox(device_name='STOCK'))
+    second_store.sync()
+    # Both workers number the command alike, under the shared epoch
+    assert first.commands.epoch == second.commands.epoch == first_store.epoch
+    for control_state in (first, second):
+        _, pending = control_state.subscribe_commands([mailbox(device_name='STOCK')])
+        assert pending == [(sequence, {'action': 'add_stock', 'symbol': 'AAPL'})]
@@ -0,0 +1,91 @@
+import base64
+from datetime import datetime, timedelta
+import pytest
+from flask import Flask
+from src.utils.config import config
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, 'get_database_url', lambda: f"sqlite:///{tmp_path / 'metrics.db'}")
+
+    from src.database.database import db, init_db
+    from src.database.ingest import ingest_metrics
+    from src.database.resolver import resolver
+    from src.web_app.result_cache import result_cache
+    from src.web_app.routes.views import views_bp
+    resolver.clear()
+    result_cache.clear()
+    app = Flask(__name__)
+    app.register_blueprint(views_bp)
+    init_db(app)
+    with app.app_context():
+        # Five values share each timestamp, so only the row id orders them
+        start = datetime.utcnow() - timedelta(hours=1)
+        ingest_metrics([
+            {'device_id': None, 'device_name': 'D1', 'metric_name': 'cpu', 'metric_value': float(i),
+             'timestamp': start + timedelta(seconds=i // 5)}
+            for i in range(23)
+        ])
+        yield app.test_client()
+        db.session.remove()
+        db.engine.dispose()
+    resolver.clear()
+    result_cache.clear()
+
+def _page(client, **params):
+    response = client.get('/api/metric-values', query_string={'per_page': 4, 'total': 'exact', **params})
+    assert response.status_code == 200
+    return response.get_json()
+
+def test_cursor_round_trip():
+    from src.web_app.pagination import NEXT, PREV, decode_cursor, encode_cursor
+    timestamp = datetime(2024, 3, 1, 12, 30, 15, 250000)
+    for direction in (NEXT, PREV):
+        assert decode_cursor(encode_cursor(timestamp, 42, direction)) == (direction, (timestamp, 42))
+
+def test_pages_walk_tied_timestamps_in_keyset_order(client):
+    pages = [_page(client)]
+    while pages[-1]['next_cursor']:
+        pages.append(_page(client, cursor=pages[-1]['next_cursor']))
+
+    values = [row['value'] for page in pages for row in page['data']]
+    assert values == [float(i) for i in reversed(range(23))]
+    assert len(pages) == 6 and len(pages[-1]['data']) == 3
+    assert pages[0]['total'] == 23 and pages[0]['total_pages'] == 6
+    assert pages[0]['prev_cursor'] is None
+    assert pages[-1]['next_cursor'] is None
+
+    # Going back from the third page gives the second page again
+    back = _page(client, cursor=pages[2]['prev_cursor'])
+    assert back['data'] == pages[1]['data']
+    assert back['next_cursor'] == pages[1]['next_cursor']
+    # and from the second page the first, without a previous cursor
+    first = _page(client, cursor=back['prev_cursor'])
+    assert first['data'] == pages[0]['data']
+    assert first['prev_cursor'] is None
+
+def test_exact_multiple_has_no_empty_last_page(client):
+    from src.database.ingest import ingest_metrics
+    ingest_metrics([{'device_id': None, 'device_name': 'D1', 'metric_name': 'cpu', 'metric_value': 23.0,
+                     'timestamp': datetime.utcnow()}])
+    cursor, pages = None, 0
+    while True:
+        page = _page(client, cursor=cursor) if cursor else _page(client)
+        pages += 1
+        assert len(page['data']) == 4
+        cursor = page['next_cursor']
+        if not cursor:
+            break
+    assert pages == 6
+
+@pytest.mark.parametrize('cursor', [
+    'not a cursor!',
+    base64.urlsafe_b64encode(b'{"direction": "next"}').decode('ascii'),
+    base64.urlsafe_b64encode(b'["sideways","2024-03-01T00:00:00",1]').decode('ascii'),
+    base64.urlsafe_b64encode(b'["next","yesterday",1]').decode('ascii'),
+    base64.urlsafe_b64encode(b'["next","2024-03-01T00:00:00","one"]').decode('ascii'),
+])
+def test_malformed_cursor_is_rejected(client, cursor):
+    response = client.get('/api/metric-values', query_string={'cursor': cursor})
+    assert response.status_code == 400
+    assert 'Invalid cursor' in response.get_json()['error']
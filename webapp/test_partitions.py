@@ -0,0 +1,74 @@
+from datetime import datetime, timedelta
+import pytest
+from flask import Flask
+from sqlalchemy import select
+from src.utils.config import config
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    from src.database.partitions import partitions
+    monkeypatch.setattr(config, 'get_database_url', lambda: f"sqlite:///{tmp_path / 'metrics.db'}")
+    monkeypatch.setattr(partitions, 'interval', 'day')
+
+    from src.database.database import db, init_db
+    from src.database.resolver import resolver
+    resolver.clear()
+    app = Flask(__name__)
+    init_db(app)
+    with app.app_context():
+        yield app
+        db.session.remove()
+        db.engine.dispose()
+    resolver.clear()
+
+# Ten minutes either side of midnight, one row a minute
+MIDNIGHT = datetime(2024, 3, 2)
+
+def _ingest_across_midnight():
+    from src.database.ingest import ingest_metrics
+    ingest_metrics([
+        {'device_id': None, 'device_name': 'D1', 'metric_name': 'cpu', 'metric_value': float(i),
+         'timestamp': MIDNIGHT + timedelta(minutes=i)}
+        for i in range(-10, 10)
+    ])
+
+def _values(start_time=None, end_time=None, **filters):
+    from src.database.database import db
+    from src.database.partitions import partitions
+    values = partitions.source(start_time, end_time, **filters)
+    return [row[0] for row in db.session.query(values.metric_value).order_by(values.timestamp).all()]
+
+def test_route_splits_rows_at_partition_boundary(app):
+    from src.database.database import db
+    from src.database.partitions import partitions
+    _ingest_across_midnight()
+
+    entries = {name: (start, end, table) for name, start, end, table in partitions.entries()}
+    assert sorted(entries) == ['metric_values_d20240301', 'metric_values_d20240302']
+    for name, (start, end, table) in entries.items():
+        timestamps = db.session.execute(select(table.c.timestamp)).scalars().all()
+        assert len(timestamps) == 10
+        assert all(start <= timestamp < end for timestamp in timestamps)
+
+def test_source_reads_only_the_requested_range(app):
+    from src.database.partitions import partitions
+    _ingest_across_midnight()
+
+    # A range inside one partition is pruned to it
+    assert len(partitions.tables_for_range(MIDNIGHT + timedelta(minutes=1), MIDNIGHT + timedelta(minutes=5))) == 1
+    assert _values(MIDNIGHT + timedelta(minutes=1), MIDNIGHT + timedelta(minutes=5)) == [1.0, 2.0, 3.0, 4.0, 5.0]
+    # A range across midnight reads both, in order
+    assert _values(MIDNIGHT - timedelta(minutes=2), MIDNIGHT + timedelta(minutes=1)) == [-2.0, -1.0, 0.0, 1.0]
+    assert _values(device_name='D1', metric_name='cpu') == [float(i) for i in range(-10, 10)]
+    assert _values(device_name='D2') == []
+
+def test_drop_partition_then_query(app):
+    from src.database.partitions import partitions
+    _ingest_across_midnight()
+
+    assert partitions.drop_partitions_before(MIDNIGHT) == ['metric_values_d20240301']
+    assert [entry[0] for entry in partitions.entries()] == ['metric_values_d20240302']
+    assert _values() == [float(i) for i in range(10)]
+    assert _values(MIDNIGHT - timedelta(minutes=5), MIDNIGHT - timedelta(minutes=1)) == []
+    # Unknown and already dropped partitions are left alone
+    assert not partitions.drop_partition('metric_values_d20240301')
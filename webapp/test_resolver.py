@@ -0,0 +1,79 @@
+import pytest
+from flask import Flask
+from sqlalchemy import func, select
+from src.utils.config import config
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, 'get_database_url', lambda: f"sqlite:///{tmp_path / 'metrics.db'}")
+
+    from src.database.database import db, init_db
+    app = Flask(__name__)
+    init_db(app)
+    with app.app_context():
+        yield app
+        db.session.remove()
+        db.engine.dispose()
+
+def test_lru_bound():
+    from src.database.resolver import CatalogResolver
+
+    resolver = CatalogResolver(max_size=2)
+    resolver._promote([('metric', 'a', 1), ('metric', 'b', 2)])
+    # Reading 'a' makes 'b' the least recently used entry
+    assert resolver._get(resolver._metric_ids, 'a') == 1
+    resolver._promote([('metric', 'c', 3)])
+    assert list(resolver._metric_ids) == ['a', 'c']
+    assert resolver.stats()['metrics'] == 2
+
+def test_upsert_absorbs_concurrent_insert(app):
+    from src.database.database import db
+    from src.database.models import MetricInfo
+    from src.database.resolver import CatalogResolver, _upsert
+
+    # Another worker inserted the name after this resolver missed it
+    db.session.execute(_upsert(MetricInfo, [{'name': 'cpu', 'unit': 'units'}], index_elements=['name']))
+    first_id = db.session.execute(select(MetricInfo.id)).scalar()
+    db.session.execute(_upsert(MetricInfo, [{'name': 'cpu', 'unit': 'units'}], index_elements=['name']))
+    assert db.session.execute(select(func.count()).select_from(MetricInfo)).scalar() == 1
+
+    assert CatalogResolver().resolve_metric('cpu') == first_id
+
+def test_entries_are_promoted_after_commit(app):
+    from src.database.database import db
+    from src.database.resolver import resolver
+
+    resolver.clear()
+    metric_id = resolver.resolve_metric('cpu')
+    device_id = resolver.resolve_device(None, 'D1')
+    assert resolver.stats()['metrics'] == 0
+    db.session.commit()
+    assert resolver._metric_ids['cpu'] == metric_id
+    assert resolver._devices_by_name['D1'].id == device_id
+
+    # A rolled back transaction leaves nothing behind
+    resolver.resolve_metric('memory')
+    db.session.rollback()
+    assert 'memory' not in resolver._metric_ids
+    resolver.clear()
+
+def test_register_device_drops_cached_resolution(app):
+    from src.database.database import db
+    from src.database.models import Device
+    from src.database.resolver import resolver
+
+    resolver.clear()
+    device_id = resolver.resolve_device('dev-1', 'D1')
+    db.session.commit()
+    assert 'dev-1' in resolver._devices_by_id
+
+    # The row is replaced behind the cache's back; registration must not return the stale id
+    db.session.query(Device).delete()
+    db.session.commit()
+    new_id, created = resolver.register_device('D1')
+    db.session.commit()
+    assert created
+    assert new_id != device_id
+    assert 'dev-1' not in resolver._devices_by_id
+    assert resolver._devices_by_name['D1'].id == new_id
+    resolver.clear()
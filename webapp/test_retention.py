@@ -0,0 +1,70 @@
+from datetime import datetime, timedelta
+import pytest
+from flask import Flask
+from sqlalchemy import delete, func, select
+from src.utils.config import config
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, 'get_database_url', lambda: f"sqlite:///{tmp_path / 'metrics.db'}")
+    monkeypatch.setitem(config.retention.default_policy, 'raw', 30 * 86400)
+    monkeypatch.setattr(config.retention, 'batch_pause', 0)
+    monkeypatch.setattr(config.archive, 'enabled', False)
+    monkeypatch.setattr(config.ingest, 'rollups', True)
+
+    from src.database.database import db, init_db
+    app = Flask(__name__)
+    init_db(app)
+    with app.app_context():
+        yield app
+        db.session.remove()
+        db.engine.dispose()
+
+def _raw_rows():
+    from src.database.database import db
+    from src.database.partitions import partitions
+    return sum(db.session.execute(select(func.count()).select_from(table)).scalar() for table in partitions.tables_for_range())
+
+def test_compact_keeps_raw_values_until_rollups_cover_them(app):
+    from src.database.database import db
+    from src.database.ingest import ingest_metrics
+    from src.database.models import MetricRollup
+    from src.database.retention import compact
+    from src.database.rollups import rebuild_rollups
+
+    old = datetime.utcnow() - timedelta(days=40)
+    ingest_metrics([
+        {'device_id': 'd1', 'device_name': 'D1', 'metric_name': 'cpu', 'metric_value': float(i), 'timestamp': old + timedelta(seconds=i)}
+        for i in range(100)
+    ])
+    # A database from before rollups: the rebuild has not run yet
+    db.session.execute(delete(MetricRollup))
+    db.session.commit()
+
+    report = compact()
+    assert report.raw_rows_removed == 0
+    assert len(report.raw_metrics_skipped) == 1
+    assert _raw_rows() == 100
+
+    rebuild_rollups()
+    report = compact()
+    assert report.raw_rows_removed == 100
+    assert _raw_rows() == 0
+    rolled_up = db.session.execute(
+        select(func.sum(MetricRollup.value_count)).where(MetricRollup.tier == '1d')
+    ).scalar()
+    assert rolled_up == 100
+
+def test_archive_needs_partitions(monkeypatch):
+    from src.database.archive import check_archive_config
+    from src.database.partitions import partitions
+    monkeypatch.setattr(config.archive, 'enabled', True)
+    monkeypatch.setattr(partitions, 'interval', 'none')
+    with pytest.raises(ValueError, match='PARTITION_INTERVAL'):
+        check_archive_config()
+
+    monkeypatch.setattr(partitions, 'interval', 'day')
+    check_archive_config()
+    monkeypatch.setattr(config.archive, 'enabled', False)
+    monkeypatch.setattr(partitions, 'interval', 'none')
+    check_archive_config()
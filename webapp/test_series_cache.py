@@ -0,0 +1,51 @@
+from datetime import datetime, timedelta
+import pytest
+from flask import Flask
+from src.utils.config import config
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, 'get_database_url', lambda: f"sqlite:///{tmp_path / 'metrics.db'}")
+
+    from src.database.database import db, init_db
+    from src.database.ingest import ingest_metrics
+    from src.database.resolver import resolver
+    resolver.clear()
+    app = Flask(__name__)
+    init_db(app)
+    with app.app_context():
+        now = datetime.utcnow()
+        ingest_metrics([
+            {'device_id': None, 'device_name': 'D1', 'metric_name': 'cpu', 'metric_value': float(i),
+             'timestamp': now - timedelta(minutes=10 - i)}
+            for i in range(10)
+        ])
+        yield app
+        db.session.remove()
+        db.engine.dispose()
+    resolver.clear()
+
+def test_warmed_cache_serves_recent_ranges(app):
+    from src.web_app.series_cache import SeriesCache
+    cache = SeriesCache(capacity=100, warm_window=3600, workers=1)
+    cache.warm()
+    now = datetime.utcnow()
+    cache.extend([('D1', 'cpu', now, 10.0)])
+
+    series = cache.query(now - timedelta(minutes=30), now + timedelta(seconds=1), 'D1', 'cpu')
+    timestamps, values = series[('D1', 'cpu')]
+    assert list(values) == [float(i) for i in range(11)]
+    # Older than the warm window
+    assert cache.query(now - timedelta(hours=2), now, 'D1', 'cpu') is None
+
+def test_cache_stays_off_with_several_workers(app):
+    from src.web_app.series_cache import SeriesCache
+    cache = SeriesCache(capacity=100, warm_window=3600, workers=4)
+    cache.warm()
+    now = datetime.utcnow()
+    cache.extend([('D1', 'cpu', now, 10.0)])
+
+    # Another worker's rows would be missing, so every range goes to the database
+    assert not cache.enabled
+    assert cache.query(now - timedelta(minutes=30), now, 'D1', 'cpu') is None
+    assert cache.stats()['workers'] == 4
@@ -0,0 +1,38 @@
+import logging
+import socket
+from flask import Flask
+
+def test_taken_port_falls_back_to_threads(caplog):
+    from src.web_app.sse_server import SSEServer
+
+    # Another worker already listens on the port
+    owner = socket.socket()
+    owner.bind(('127.0.0.1', 0))
+    owner.listen()
+    try:
+        server = SSEServer('127.0.0.1', owner.getsockname()[1])
+        logger = logging.getLogger('web_app.sse_server')
+        logger.addHandler(caplog.handler)
+        try:
+            server.start(Flask(__name__))
+        finally:
+            logger.removeHandler(caplog.handler)
+        assert not server.running
+        assert any(
+            record.levelno == logging.WARNING and 'Only one process can own SSE_PORT' in record.getMessage()
+            for record in caplog.records
+        )
+    finally:
+        owner.close()
+
+def test_free_port_is_served():
+    from src.web_app.sse_server import SSEServer
+
+    probe = socket.socket()
+    probe.bind(('127.0.0.1', 0))
+    port = probe.getsockname()[1]
+    probe.close()
+    server = SSEServer('127.0.0.1', port)
+    server.start(Flask(__name__))
+    assert server.running
+    socket.create_connection(('127.0.0.1', port), timeout=5).close()